@@ -1,23 +1,202 @@
 import os, sys
+from argparse import ArgumentParser, ArgumentTypeError
 
+from simulator.cache import ResultCache, ScenarioCache, DEFAULT_CACHE_DIR, open_cache
+from simulator.output import open_output, RecordWriter
 from simulator.world import World
 from simulator.errors import SimulationException
+from simulator.events import EventFilter, EVENT_NAMES
+
+
+def ids(string):
+    """'1,2,3' -> [1, 2, 3]"""
+    try:
+        return [int(id_) for id_ in string.split(',')]
+    except ValueError:
+        raise ArgumentTypeError('{} is not a comma separated list of ids'.format(string))
+
+
+def positive(string):
+    """'3' -> 3, a positive integer"""
+    if not string.isdigit() or int(string) < 1:
+        raise ArgumentTypeError('{} is not a positive integer'.format(string))
+    return int(string)
+
+
+def positive_float(string):
+    """'2.5' -> 2.5, a positive number"""
+    try:
+        value = float(string)
+    except ValueError:
+        value = 0
+    if not value > 0:
+        raise ArgumentTypeError('{} is not a positive number'.format(string))
+    return value
+
+
+def names(choices):
+    """Returns a type of comma separated names out of the choices."""
+    def names_type(string):
+        names = string.split(',')
+        for name in names:
+            if name not in choices:
+                raise ArgumentTypeError('unknown name {0}, choose from {1}'.format(name, ','.join(choices)))
+        return names
+    return names_type
+
+
+def parse_args(argv):
+    parser = ArgumentParser(description='Bus network simulator')
+    parser.add_argument('input', nargs='?', help='input file')
+    parser.add_argument('output', nargs='?', help='output file (default stdout)')
+    engine = parser.add_mutually_exclusive_group()
+    engine.add_argument('--leap', type=float, metavar='EPSILON',
+                        help='use the approximate tau-leaping engine with the given error control')
+    engine.add_argument('--dwell', action='store_true',
+                        help='sample the dwell of a bus alone at a stop in one step')
+    engine.add_argument('--parallel', type=int, nargs='?', const=0, metavar='WORKERS',
+                        help='simulate the disconnected parts of the network in parallel (summary statistics only)')
+    engine.add_argument('--replay', metavar='LOG',
+                        help='recompute the summary statistics from the events of a text output or binary trace')
+    parser.add_argument('--compare', type=int, metavar='RUNS',
+                        help='compare the leaping engine against the exact one over RUNS runs')
+    parser.add_argument('--batch', action='store_true',
+                        help='run every input of a directory or glob, the output argument is the output directory')
+    parser.add_argument('--serve', metavar='ADDRESS',
+                        help='run the jobs sent to a Unix domain socket path or a localhost TCP port')
+    parser.add_argument('--workers', type=int, metavar='N',
+                        help='number of worker processes of the server or batch (default one per CPU)')
+    parser.add_argument('--compress', type=int, nargs='?', const=6, choices=range(1, 10), metavar='LEVEL',
+                        help='gzip the output file with the given level (default 6, implied by a .gz output)')
+    parser.add_argument('--events', type=names(EVENT_NAMES), metavar='TYPES',
+                        help='log only the events of these comma separated types ({})'.format(','.join(EVENT_NAMES)))
+    parser.add_argument('--routes', type=ids, metavar='IDS',
+                        help='log only the events of these comma separated routes')
+    parser.add_argument('--stops', type=ids, metavar='IDS',
+                        help='log only the events at these comma separated stops')
+    parser.add_argument('--sample', type=positive, default=1, metavar='N',
+                        help='log only every N-th of the events')
+    parser.add_argument('--trace', metavar='FILE',
+                        help='write the events to a binary trace instead of the output')
+    parser.add_argument('--percentiles', action='store_true',
+                        help='log the percentiles of the queues and waiting passengers (exact and leap engines)')
+    parser.add_argument('--wait-times', action='store_true',
+                        help='log the percentiles of the waiting times of the passengers (not with --parallel)')
+    parser.add_argument('--snapshots', metavar='FILE',
+                        help='write the statistics of every interval of the run to a CSV (or .npz) file')
+    parser.add_argument('--interval', type=positive_float, metavar='TIME',
+                        help='length of the intervals of --snapshots (default a hundredth of the stop time)')
+    parser.add_argument('--seed', type=int, help='seed of the random numbers')
+    parser.add_argument('--no-cache', action='store_true',
+                        help='always parse the input and rerun the experiments of a seeded run')
+    parser.add_argument('--cache-dir', default=DEFAULT_CACHE_DIR,
+                        help='directory of the parsed inputs and experiment results caches (default %(default)s)')
+    parser.add_argument('--cache-size', type=int, default=64, metavar='MB',
+                        help='size limit of each of the caches (default %(default)s)')
+    return parser.parse_args(argv)
 
 
 def main(argv):
-    if not argv:
+    args = parse_args(argv)
+    if args.serve:
+        from simulator.server import serve
+        serve(args.serve, workers=args.workers, cache_dir=None if args.no_cache else args.cache_dir)
+        return
+    if not args.input:
         print('No input file supplied!')
         return
+    if args.batch:
+        if args.parallel is not None or args.compare or args.replay or args.trace:
+            print('--batch can not be combined with --parallel, --compare, --replay or --trace')
+            return
+        from simulator.batch import run_batch
+        engine = 'leap' if args.leap else 'dwell' if args.dwell else 'exact'
+        run_batch(
+            args.input, args.output, workers=args.workers, engine=engine, epsilon=args.leap,
+            seed=args.seed, cache_dir=None if args.no_cache else args.cache_dir
+        )
+        return
     cwd = os.getcwd()
-    input_f = os.path.join(cwd, argv[0])
-    if len(argv) > 1:
-        output_f = os.path.join(cwd, argv[1])
-        sys.stdout = open(output_f, 'w')
+    input_f = os.path.join(cwd, args.input)
+    if not args.output:
+        simulate(args, cwd, input_f)
+        return
+    sys.stdout = open_output(os.path.join(cwd, args.output), args.compress)
     try:
-        world = World(input_f)
-        world.start()
+        simulate(args, cwd, input_f)
+    finally:
+        output, sys.stdout = sys.stdout, sys.__stdout__
+        output.close()
+
+
+def event_filter(args, sink):
+    """Returns the sink behind the filter of the events options (if any)."""
+    if args.events is None and args.routes is None and args.stops is None and args.sample == 1:
+        return sink
+    return EventFilter(sink, types=args.events, routes=args.routes, stops=args.stops, every=args.sample)
+
+
+def simulate(args, cwd, input_f):
+    try:
+        open(input_f, 'rb').close()
     except IOError:
         print('Input file does not exist!')
+        return
+    cache_size = args.cache_size * 1024 * 1024
+    scenarios = None
+    try:
+        if not args.no_cache:
+            scenarios = open_cache(ScenarioCache, args.cache_dir, cache_size)
+        if args.compare:
+            from simulator.leaping import compare_engines
+            compare_engines(input_f, runs=args.compare, epsilon=args.leap or 0.03)
+            return
+        if args.replay:
+            from simulator.replay import ReplayWorld
+            world = ReplayWorld(input_f, scenarios=scenarios)
+            world.replay_file(os.path.join(cwd, args.replay))
+            return
+        if args.leap:
+            from simulator.leaping import LeapingWorld
+            world = LeapingWorld(input_f, epsilon=args.leap, scenarios=scenarios)
+        elif args.parallel is not None:
+            from simulator.partition import PartitionedWorld
+            world = PartitionedWorld(input_f, workers=args.parallel, scenarios=scenarios)
+        elif args.dwell:
+            from simulator.dwell import DwellWorld
+            world = DwellWorld(input_f, scenarios=scenarios)
+        else:
+            world = World(input_f, scenarios=scenarios)
+        if args.percentiles:
+            if args.dwell or args.parallel is not None:
+                print('--percentiles can not be combined with --dwell or --parallel')
+                return
+            world.percentiles = True
+        if args.wait_times:
+            if args.parallel is not None:
+                print('--wait-times can not be combined with --parallel')
+                return
+            world.wait_times = True
+        if args.snapshots:
+            if args.parallel is not None or world.experimental_mode:
+                print('--snapshots can not be combined with --parallel or experiments')
+                return
+            world.snapshot_interval = args.interval or world.stop_time / 100
+        if args.seed is not None:
+            world.seed = args.seed
+            if not args.no_cache:
+                world.cache = open_cache(ResultCache, args.cache_dir, cache_size)
+        if args.trace:
+            from simulator.trace import TraceWriter
+            with TraceWriter(os.path.join(cwd, args.trace)) as writer:
+                world.sink = event_filter(args, writer)
+                world.start()
+        else:
+            with RecordWriter(world.network) as writer:
+                world.sink = event_filter(args, writer)
+                world.start()
+        if args.snapshots:
+            world.snapshots.write(os.path.join(cwd, args.snapshots), world.stop_time)
     except SimulationException as e:
         print(e)
 
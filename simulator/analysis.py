@@ -0,0 +1,365 @@
+"""
+Accumulators of the summary statistics. They are kept in flat preallocated
+lists indexed by the indices the network gives to its stops, routes and buses
+(see Network.assign_indices) so the records of the simulation are in-place
+additions and a new experiment only zeroes them.
+"""
+from array import array
+
+from simulator.sketch import QuantileSketch
+
+
+class Analysis(object):
+    """
+    Summary statistics of a run.
+        missed_stop - number of missed passengers per stop
+        missed_route - number of missed passengers per route
+        pax_count - number of departures per bus
+        pax_sum - sum of the passengers on the bus at its departures
+        qtime - time integral of the number of queueing buses per stop
+        wtime - time integral of the number of waiting passengers per stop
+
+    The waiting passengers of a route are those waiting at its stops, so the
+    integral of a route is the sum of the integrals of its stops.
+    """
+
+    FIELDS = ('missed_stop', 'missed_route', 'pax_count', 'pax_sum', 'qtime', 'wtime')
+
+    def __init__(self, network):
+        self.shape = None
+        self.reset(network)
+
+    def reset(self, network):
+        """Zero all the accumulators in place. They are only reallocated if
+        the network has a different number of stops, routes or buses."""
+        shape = len(network.stop_list), len(network.route_list), len(network.bus_ids)
+        stops, routes, buses = shape
+        if shape != self.shape:
+            self.shape = shape
+            self.missed_stop = [0] * stops
+            self.missed_route = [0] * routes
+            self.pax_count = [0] * buses
+            self.pax_sum = [0.0] * buses
+            self.qtime = [0.0] * stops
+            self.wtime = [0.0] * stops
+            return
+        self.missed_stop[:] = [0] * stops
+        self.missed_route[:] = [0] * routes
+        self.pax_count[:] = [0] * buses
+        self.pax_sum[:] = [0.0] * buses
+        self.qtime[:] = [0.0] * stops
+        self.wtime[:] = [0.0] * stops
+
+    def route_wtime(self, network):
+        """Returns the time integral of the waiting passengers of every
+        route (a stop counts as many times as the route visits it)."""
+        wtime = self.wtime
+        return [sum(wtime[stop.index] for stop in route.stops) for route in network.route_list]
+
+    def summary(self, network, stop_time):
+        """Returns the summary statistics in lists indexed like the
+        accumulators, in the layout of formats.ANALYSIS."""
+        # Average Passengers Per Bus Per Road
+        bus_avg = [
+            0 if summa == 0 else summa / count
+            for count, summa in zip(self.pax_count, self.pax_sum)
+        ]
+        route_avg = []
+        for route in network.route_list:
+            buses = slice(route.bus_offset, route.bus_offset + route.bus_count)
+            count = sum(self.pax_count[buses])
+            summa = sum(self.pax_sum[buses])
+            route_avg.append(0 if summa == 0 else summa / count)
+        pax_count = sum(self.pax_count)
+        pax_sum = sum(self.pax_sum)
+
+        # Average Bus Queuing Time
+        visits = [stop.bus_count for stop in network.stop_list]
+        stop_qtime = [
+            0 if summa == 0 else summa / count
+            for summa, count in zip(self.qtime, visits)
+        ]
+        qtime = sum(self.qtime)
+
+        # Average Waiting Passengers
+        route_wtime = self.route_wtime(network)
+        wtime = sum(route_wtime)
+
+        return {
+            'missed_pax': {
+                'route': self.missed_route,
+                'stop': self.missed_stop,
+                'total': sum(self.missed_route),
+            },
+            'avg_pax': {
+                'bus': bus_avg,
+                'route': route_avg,
+                'total': 0 if pax_sum == 0 else pax_sum / pax_count,
+            },
+            'avg_qtime': {
+                'stop': stop_qtime,
+                'total': 0 if qtime == 0 else qtime / sum(visits),
+            },
+            'avg_wtime': {
+                'route': [0 if summa == 0 else summa / stop_time for summa in route_wtime],
+                'stop': [0 if summa == 0 else summa / stop_time for summa in self.wtime],
+                'total': 0 if wtime == 0 else wtime / stop_time,
+            },
+        }
+
+    def __eq__(self, other):
+        return all(getattr(self, field) == getattr(other, field) for field in self.FIELDS)
+
+    def __ne__(self, other):
+        return not self == other
+
+
+# Buckets of the histograms. The counts below EXACT_BUCKETS have a bucket
+# each, the larger ones share a bucket with the counts up to a quarter of
+# their power of two above them (16-19, 20-23, ..., 32-39, ...) and the
+# last bucket holds everything from its lower bound on.
+EXACT_BUCKETS = 16
+MAX_POWER = 24
+BUCKET_BOUNDS = tuple(range(EXACT_BUCKETS)) + tuple(
+    (4 + quarter) << (power - 2) for power in xrange(4, MAX_POWER) for quarter in xrange(4)
+)
+BUCKET_COUNT = len(BUCKET_BOUNDS)
+
+
+def bucket(count):
+    """Returns the index of the bucket of a count (see BUCKET_BOUNDS)."""
+    if count < EXACT_BUCKETS:
+        return count
+    power = count.bit_length() - 1
+    if power >= MAX_POWER:
+        return BUCKET_COUNT - 1
+    return EXACT_BUCKETS + (power - 4) * 4 + (count >> (power - 2)) - 4
+
+
+def percentile(weights, start, q):
+    """Returns the lower bound of the bucket of the q-th percentile of the
+    histogram at weights[start:start + BUCKET_COUNT] (0 if it is empty)."""
+    end = start + BUCKET_COUNT
+    target = sum(weights[start:end]) * q / 100.0
+    if target == 0:
+        return 0
+    total = 0.0
+    for i in xrange(start, end):
+        total += weights[i]
+        if total >= target:
+            return BUCKET_BOUNDS[i - start]
+    return BUCKET_BOUNDS[-1]
+
+
+class Histograms(object):
+    """
+    Time-weighted histograms of the number of queueing buses per stop and of
+    the waiting passengers per stop and route, for the percentiles which the
+    averages of Analysis do not show. Every stop or route has BUCKET_COUNT
+    buckets in a flat list, so they take the same memory however long the
+    run is.
+        queue - time spent with the queue lengths of the buckets per stop
+        stop_wait - time spent with the waiting counts of the buckets per stop
+        route_wait - the same per route, the count of a route is the sum of
+                     the counts of its stops like in Analysis
+        stop_routes - indices of the routes of every stop, once per visit
+        stop_count - waiting count of every stop included in route_count
+        route_count - waiting count of every route
+        route_time - time when the histogram of a route was last updated
+        changed - the stops recorded at changed_time, their counts may have
+                  changed since
+    """
+
+    FIELDS = ('queue', 'stop_wait', 'route_wait')
+    PERCENTILES = (50, 95, 99)
+
+    def __init__(self, network):
+        self.shape = None
+        self.reset(network)
+
+    def reset(self, network):
+        """Zero the histograms in place (see Analysis.reset) and map the
+        stops to the routes which visit them."""
+        shape = len(network.stop_list), len(network.route_list)
+        stops, routes = shape
+        if shape != self.shape:
+            self.shape = shape
+            self.queue = [0.0] * (stops * BUCKET_COUNT)
+            self.stop_wait = [0.0] * (stops * BUCKET_COUNT)
+            self.route_wait = [0.0] * (routes * BUCKET_COUNT)
+        else:
+            self.queue[:] = [0.0] * (stops * BUCKET_COUNT)
+            self.stop_wait[:] = [0.0] * (stops * BUCKET_COUNT)
+            self.route_wait[:] = [0.0] * (routes * BUCKET_COUNT)
+        self.stop_routes = [[] for _ in xrange(stops)]
+        for route in network.route_list:
+            for stop in route.stops:
+                self.stop_routes[stop.index].append(route.index)
+        self.stop_count = [0] * stops
+        self.route_count = [0] * routes
+        for stop in network.stop_list:
+            self.update_count(stop, stop.pax_count)
+        self.route_time = [0.0] * routes
+        self.changed = []
+        self.changed_time = 0.0
+
+    def update_count(self, stop, count):
+        """Add the change of the waiting count of the stop to the counts of
+        its routes, like Stop.route_pax."""
+        change = count - self.stop_count[stop.index]
+        if change:
+            self.stop_count[stop.index] = count
+            route_count = self.route_count
+            for index in self.stop_routes[stop.index]:
+                route_count[index] += change
+
+    def record_queue(self, stop, time_diff, qlength):
+        """Add the time the stop had the queue length."""
+        self.queue[stop.index * BUCKET_COUNT + bucket(qlength)] += time_diff
+
+    def record_wait(self, stop, time, time_diff, count):
+        """Add the time the stop had the waiting count and the time since
+        their last update to the routes of the stop. Called before the count
+        changes, so the counts of the routes are their counts since then
+        once the changes of the stops recorded before are added (the routes of
+        the stops recorded at the same time were updated at this time)."""
+        self.stop_wait[stop.index * BUCKET_COUNT + bucket(count)] += time_diff
+        changed = self.changed
+        if time != self.changed_time:
+            for changed_stop in changed:
+                self.update_count(changed_stop, changed_stop.pax_count)
+            del changed[:]
+            self.changed_time = time
+        changed.append(stop)
+        self.update_count(stop, count)
+        route_wait = self.route_wait
+        route_time = self.route_time
+        route_count = self.route_count
+        for index in self.stop_routes[stop.index]:
+            route_wait[index * BUCKET_COUNT + bucket(route_count[index])] += time - route_time[index]
+            route_time[index] = time
+
+    def cleanup(self, network, stop_time):
+        """Add the time from the last updates to the stop time (see
+        World.cleanup)."""
+        for stop in network.stop_list:
+            self.record_queue(stop, stop_time - stop.qtime, stop.queue_length)
+            self.stop_wait[stop.index * BUCKET_COUNT + bucket(stop.pax_count)] += stop_time - stop.wtime
+        for stop in self.changed:
+            self.update_count(stop, stop.pax_count)
+        del self.changed[:]
+        for index, route_count in enumerate(self.route_count):
+            self.route_wait[index * BUCKET_COUNT + bucket(route_count)] += stop_time - self.route_time[index]
+            self.route_time[index] = stop_time
+
+    def percentiles(self, field, index):
+        """Returns the PERCENTILES of the histogram of a stop or route (by
+        its index) in one of the FIELDS."""
+        weights = getattr(self, field)
+        return [percentile(weights, index * BUCKET_COUNT, q) for q in self.PERCENTILES]
+
+
+class ArrivalQueue(object):
+    """
+    FIFO of the arrival times of waiting passengers in a compact array. The
+    times are popped by moving the head, the array is only shifted once most
+    of it has been popped.
+        times - the arrival times
+        head - index of the first waiting passenger
+    """
+
+    __slots__ = ('times', 'head')
+
+    def __init__(self):
+        self.times = array('d')
+        self.head = 0
+
+    def push(self, time, count=1):
+        if count == 1:
+            self.times.append(time)
+        else:
+            self.times.extend([time] * count)
+
+    def pop(self, count=1):
+        """Returns the arrival times of the first count passengers (fewer if
+        there are not as many)."""
+        head = self.head
+        popped = self.times[head:head + count]
+        self.head = head = head + len(popped)
+        if head >= 1024 and head * 2 >= len(self.times):
+            del self.times[:head]
+            self.head = 0
+        return popped
+
+    def __len__(self):
+        return len(self.times) - self.head
+
+
+class PassengerWaits(object):
+    """
+    Waiting times of the individual passengers. The arrival times of the
+    waiting passengers are kept per stop and destination, the passengers
+    board in the order they came, and the wait of a boarding passenger goes
+    to the quantile sketches of its stop and of the route of its bus.
+        accuracy - relative accuracy of the sketches
+        queues - ArrivalQueue of every destination per stop
+        stop_sketches - QuantileSketch of the waits per stop
+        route_sketches - QuantileSketch of the waits per route
+    """
+
+    PERCENTILES = (50, 95, 99)
+
+    def __init__(self, network, accuracy=0.01):
+        self.accuracy = accuracy
+        self.reset(network)
+
+    def reset(self, network):
+        stops, routes = len(network.stop_list), len(network.route_list)
+        self.queues = [{} for _ in xrange(stops)]
+        self.stop_sketches = [QuantileSketch(self.accuracy) for _ in xrange(stops)]
+        self.route_sketches = [QuantileSketch(self.accuracy) for _ in xrange(routes)]
+
+    def arrive(self, stop, dest_id, time, count=1):
+        """Count passengers going to dest_id arrive at the stop."""
+        queues = self.queues[stop.index]
+        queue = queues.get(dest_id)
+        if queue is None:
+            queue = queues[dest_id] = ArrivalQueue()
+        queue.push(time, count)
+
+    def board(self, bus, dest_id, time, count=1):
+        """Count passengers going to dest_id board the bus at its stop."""
+        stop = bus.stop
+        queue = self.queues[stop.index].get(dest_id)
+        if queue is None:
+            return
+        stop_sketch = self.stop_sketches[stop.index]
+        route_sketch = self.route_sketches[bus.route.index]
+        for arrival in queue.pop(count):
+            stop_sketch.add(time - arrival)
+            route_sketch.add(time - arrival)
+
+    def total(self):
+        """Returns the sketch of all the waits, merged from the routes."""
+        total = QuantileSketch(self.accuracy)
+        for sketch in self.route_sketches:
+            total.merge(sketch)
+        return total
+
+    def percentiles(self, sketch):
+        """Returns the PERCENTILES of the waits of a sketch."""
+        return [sketch.quantile(q / 100.0) for q in self.PERCENTILES]
+
+    def dump(self):
+        """Returns the sketches as a JSON serialisable dictionary."""
+        return {
+            'stop': [sketch.dump() for sketch in self.stop_sketches],
+            'route': [sketch.dump() for sketch in self.route_sketches],
+        }
+
+    def load(self, dumped):
+        """Restore the sketches returned by dump."""
+        for sketch, counts in zip(self.stop_sketches, dumped['stop']):
+            sketch.load(counts)
+        for sketch, counts in zip(self.route_sketches, dumped['route']):
+            sketch.load(counts)
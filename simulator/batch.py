@@ -0,0 +1,109 @@
+"""
+Batch runs of many input files. The inputs are run by a pool of workers, each
+with its output in its own file, and a summary of the run times is printed.
+"""
+import glob
+import os
+import sys
+from multiprocessing import Pool, cpu_count
+from timeit import default_timer
+
+from simulator.errors import SimulationException
+from simulator.server import job_world
+
+OUTPUT_EXTENSION = '.out'
+
+
+def batch_inputs(pattern):
+    """Returns the input files of a directory or of a glob pattern, sorted.
+    Hidden files and the outputs written next to the inputs are skipped."""
+    if os.path.isdir(pattern):
+        filenames = [os.path.join(pattern, name) for name in os.listdir(pattern)]
+    else:
+        filenames = glob.glob(pattern)
+    return sorted(
+        filename for filename in filenames
+        if not os.path.basename(filename).startswith('.') and not filename.endswith(OUTPUT_EXTENSION)
+        and os.path.isfile(filename)
+    )
+
+
+def output_path(filename, output_dir=None):
+    """Returns the output file of an input, next to it or in output_dir."""
+    if output_dir:
+        filename = os.path.join(output_dir, os.path.basename(filename))
+    return filename + OUTPUT_EXTENSION
+
+
+def run_file(job):
+    """Run the input of a job (see server.job_world) in a worker with the
+    output written to job['output']. Returns the input, the run time, the
+    number of events logged and the error (or None). Any error only fails
+    this input, so the rest of the batch is still run."""
+    events = [0]
+    error = None
+    start = default_timer()
+    with open(job['output'], 'w') as output:
+        stdout = sys.stdout
+        sys.stdout = output
+        try:
+            world = job_world(job)
+            sink = world.sink
+
+            def counting_sink(event_type, time, args):
+                events[0] += 1
+                sink(event_type, time, args)
+            world.sink = counting_sink
+            world.start()
+        except IOError:
+            error = 'Input file does not exist!'
+            print(error)
+        except SimulationException as e:
+            error = str(e)
+            print(error)
+        except Exception as e:
+            error = 'Simulation failed: {0}: {1}'.format(type(e).__name__, e)
+            print(error)
+        finally:
+            sys.stdout = stdout
+    return job['input'], default_timer() - start, events[0], error
+
+
+def run_batch(pattern, output_dir=None, workers=None, **options):
+    """Run every input of the pattern (see batch_inputs) with the options of
+    a job (engine, epsilon, seed, cache_dir) and print the run time and
+    events per second of each. Returns the (input, time, events, error)
+    of the inputs."""
+    filenames = batch_inputs(pattern)
+    if not filenames:
+        print('No input files match {}'.format(pattern))
+        return []
+    if output_dir and not os.path.isdir(output_dir):
+        os.makedirs(output_dir)
+
+    jobs = [
+        dict(options, input=filename, output=output_path(filename, output_dir), events=True)
+        for filename in filenames
+    ]
+    width = max(len(filename) for filename in filenames)
+    start = default_timer()
+    results = []
+    pool = Pool(min(workers or cpu_count(), len(jobs)))
+    try:
+        for filename, run_time, events, error in pool.imap(run_file, jobs):
+            results.append((filename, run_time, events, error))
+            rate = '{:.0f}'.format(events / run_time) if events else '-'
+            print('{0:<{width}} {1:9.3f}s {2:10} events {3:>10} events/s{4}'.format(
+                filename, run_time, events, rate, '  ' + error if error else '', width=width
+            ))
+            sys.stdout.flush()
+    finally:
+        pool.close()
+        pool.join()
+
+    events = sum(result[2] for result in results)
+    failed = sum(1 for result in results if result[3])
+    print('{0} inputs ({1} failed), {2} events in {3:.3f}s'.format(
+        len(results), failed, events, default_timer() - start
+    ))
+    return results
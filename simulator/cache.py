@@ -0,0 +1,154 @@
+"""
+Persistent caches of the results of experiments and of the parsed inputs.
+Every entry is a file named by the hash of everything it depends on, the
+least recently used files are removed when the cache grows over its size
+limit.
+"""
+import cPickle
+import json
+import os
+import warnings
+from hashlib import sha1
+from tempfile import NamedTemporaryFile
+
+
+# Bump when the simulation changes so that old results are not used
+CACHE_VERSION = 3
+# Bump when the parser or the scenario it builds change so that old inputs are parsed again
+SCENARIO_VERSION = 1
+
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser('~'), '.cache', 'cslp')
+DEFAULT_CACHE_SIZE = 64 * 1024 * 1024  # bytes
+
+
+def result_key(world):
+    """Returns the hash of the scenario the world is initialised with: the
+    engine and its parameters, the network with the experimental bus counts
+    and capacities, the rates, the stop time and the seed."""
+    routes = [
+        (route.route_id, [stop.stop_id for stop in route.stops], route.bus_count, route.capacity)
+        for route in world.network.route_list
+    ]
+    rates = sorted(
+        ('{0},{1}'.format(*name) if isinstance(name, tuple) else name, rate)
+        for name, rate in world.rates.iteritems()
+    )
+    scenario = [
+        CACHE_VERSION, type(world).__name__, world.cache_params(), routes, rates, world.stop_time,
+        world.seed
+    ]
+    return sha1(json.dumps(scenario)).hexdigest()
+
+
+class ResultCache(object):
+    """
+    Directory of cached results.
+        directory - where the results are stored
+        max_size - the total size of the results in bytes kept after a put
+    """
+
+    EXTENSION = '.json'
+
+    def __init__(self, directory=DEFAULT_CACHE_DIR, max_size=DEFAULT_CACHE_SIZE):
+        self.directory = directory
+        self.max_size = max_size
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+
+    def path(self, key):
+        return os.path.join(self.directory, key + self.EXTENSION)
+
+    def read(self, f):
+        return json.load(f)
+
+    def write(self, result, f):
+        json.dump(result, f)
+
+    def get(self, key):
+        """Returns the result stored under the key or None. A hit marks the
+        result as recently used."""
+        path = self.path(key)
+        try:
+            with open(path, 'rb') as f:
+                result = self.read(f)
+            os.utime(path, None)
+        except (IOError, OSError, ValueError, EOFError, cPickle.UnpicklingError):
+            return None  # missing, just evicted or corrupted
+        return result
+
+    def put(self, key, result):
+        """Store the result under the key and evict the least recently used
+        results over the size limit. A result that can not be written is
+        not cached."""
+        try:
+            with NamedTemporaryFile(dir=self.directory, suffix='.tmp', delete=False) as f:
+                self.write(result, f)
+            os.rename(f.name, self.path(key))  # atomic, readers never see half a file
+        except (IOError, OSError) as e:
+            warnings.warn('Result not cached: {}'.format(e))
+            return
+        self.evict()
+
+    def evict(self):
+        """Remove the least recently used results until the cache fits into
+        max_size."""
+        entries = []
+        total = 0
+        for name in os.listdir(self.directory):
+            if not name.endswith(self.EXTENSION):
+                continue
+            path = os.path.join(self.directory, name)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+            total += stat.st_size
+
+        entries.sort()
+        for mtime, size, path in entries:
+            if total <= self.max_size:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            total -= size
+
+
+class ScenarioCache(ResultCache):
+    """
+    Directory of parsed and validated inputs, the (network, rates, params,
+    experiments) of parse_file. An input is keyed by the hash of its
+    contents and its modification time, so a changed input is parsed again.
+    """
+
+    EXTENSION = '.pickle'
+
+    def read(self, f):
+        return cPickle.load(f)
+
+    def write(self, scenario, f):
+        cPickle.dump(scenario, f, cPickle.HIGHEST_PROTOCOL)
+
+    def file_key(self, filename):
+        return input_key(filename)
+
+
+def open_cache(cache_class, directory, max_size=DEFAULT_CACHE_SIZE):
+    """Returns a cache of the class in the directory, or None with a warning
+    if the directory can not be created (caching is then disabled)."""
+    try:
+        return cache_class(directory, max_size)
+    except OSError as e:
+        warnings.warn('Caching disabled, {}'.format(e))
+        return None
+
+
+def input_key(filename):
+    """Returns the hash of the contents and modification time of an input
+    file, the key of its current version for the current parser."""
+    with open(filename, 'rb') as f:
+        digest = sha1(f.read()).hexdigest()
+    scenario = [CACHE_VERSION, SCENARIO_VERSION, digest, os.path.getmtime(filename)]
+    return sha1(json.dumps(scenario)).hexdigest()
@@ -0,0 +1,292 @@
+"""
+Exact aggregated simulation of the dwell of a bus at a stop. While a bus is
+alone at a stop only its own disembarks and boardings and the new passengers
+for its route at that stop can change it. All of these happen at constant
+rates, so the whole dwell is sampled in one step and applied when it ends or
+when another bus arrives at the stop.
+"""
+from bisect import bisect_left, insort
+from collections import defaultdict
+from math import log10
+from random import random
+
+from simulator.events import BOARD, DISEMBARKS, NEW_PASSENGERS
+from simulator.world import World
+
+
+class Dwell(object):
+    """
+    A sampled dwell of a bus at a stop. The times are on the clock of the
+    DwellWorld.
+        bus - the dwelling bus
+        start - time when the dwell started
+        events - (time, event_type, dest_id) triples of the dwell in time order
+        end - time of the last event, after it the bus is ready for departure
+    """
+
+    def __init__(self, bus, start, events, end):
+        self.bus = bus
+        self.start = start
+        self.events = events
+        self.end = end
+
+    def __repr__(self):
+        return 'Dwell({0} | S: {1} | E: {2} | {3}-{4})'.format(
+            self.bus.bus_id,
+            self.bus.stop.stop_id,
+            len(self.events),
+            self.start,
+            self.end
+        )
+
+
+class DwellWorld(World):
+    """
+    World which samples the dwell of a bus that arrives at an empty stop in
+    one step instead of choosing every disembark and boarding separately.
+        dwells - dictionary with stops as keys and their dwells as values
+        pax_rates - new passenger rates, <stop>: {<dest_id>: <rate>}
+        clock - time at which the last event fired (see below)
+        times - sorted firing times of the events which may still be needed
+                by event_time
+        prune_at - length of times at which its old times are dropped
+
+    New passengers for the route of a dwelling bus at its stop are part of
+    the sampled dwell, the same passengers chosen by choose_event are
+    therefore ignored (thinning keeps the process exact).
+
+    World.run applies an event at the current time and only then adds its
+    delay, so every event is applied at the time the event before it fired.
+    The events (including those of the dwells) fire on the clock here, after
+    their delays, so that the dwells can be interleaved with the other
+    events, and every event is applied at the firing time of the event
+    before it (see event_time). The statistics are then the same as those
+    of World.run.
+    """
+
+    def initialise(self, rates=None, routes=None):
+        """Initialise the world and the new passenger rates of all the
+        origin-destination pairs."""
+        super(DwellWorld, self).initialise(rates=rates, routes=routes)
+        self.dwells = {}
+        self.clock = 0.0
+        self.times = [0.0]
+        self.prune_at = 1024
+        self.pax_rates = defaultdict(dict)
+        for orig, dest, prob in self.network.passenger_pairs():
+            self.pax_rates[orig][dest.stop_id] = prob * self.rates['new_passengers']
+
+    def sample_dwell(self, bus):
+        """Sample the disembarks, boardings and new passengers at the bus's
+        stop from now until the bus is ready for departure."""
+        stop = bus.stop
+        rates = self.rates
+        dests = set(s.stop_id for s in bus.route.stops)
+        waiting = dict((dest, stop.pax_dests[dest]) for dest in dests)
+        pax_rates = [(dest, rate) for dest, rate in self.pax_rates[stop].iteritems() if dest in dests]
+        new_rate = sum(rate for dest, rate in pax_rates)
+        disembarks = bus.disembarks
+        free = bus.route.capacity - bus.pax_count
+
+        time = self.clock
+        events = []
+        while True:
+            boards = sum(waiting.itervalues()) if free else 0
+            if not disembarks and not boards:
+                break  # departure ready
+
+            disembark_rate = disembarks * rates['disembarks']
+            board_rate = boards * rates['board']
+            total_rate = disembark_rate + board_rate + new_rate
+            # Same distribution as World.sample_delay
+            time -= log10(random()) / total_rate
+            rand = random() * total_rate
+
+            if rand < disembark_rate:
+                disembarks -= 1
+                free += 1
+                events.append((time, DISEMBARKS, None))
+                continue
+            rand -= disembark_rate
+
+            if rand < board_rate:
+                rand /= rates['board']
+                for dest, count in waiting.iteritems():
+                    if count:
+                        chosen = dest
+                        rand -= count
+                        if rand < 0:
+                            break
+                waiting[chosen] -= 1
+                free -= 1
+                events.append((time, BOARD, chosen))
+                continue
+            rand -= board_rate
+
+            for dest, rate in pax_rates:
+                rand -= rate
+                if rand < 0:
+                    break
+            waiting[dest] += 1
+            events.append((time, NEW_PASSENGERS, dest))
+
+        return Dwell(bus, self.clock, events, time)
+
+    def event_time(self, time, start=0.0):
+        """Returns the time at which an event firing at the given time is
+        applied, the firing time of the event before it (but not before the
+        start of its dwell)."""
+        times = self.times
+        return max(times[bisect_left(times, time) - 1], start)
+
+    def forget(self, events):
+        """Remove the firing times of dwell events which are not applied."""
+        times = self.times
+        for time, event_type, dest in events:
+            i = bisect_left(times, time)
+            if i < len(times) and times[i] == time:
+                del times[i]
+
+    def prune(self):
+        """Drop the times which event_time does not need anymore, those
+        before both the clock and the starts of the dwells (except the last
+        of them)."""
+        horizon = min([self.clock] + [dwell.start for dwell in self.dwells.itervalues()])
+        del self.times[:max(bisect_left(self.times, horizon) - 1, 0)]
+        self.prune_at = max(1024, 2 * len(self.times))
+
+    def start_dwell(self, bus):
+        """Take the events of a bus which has arrived at an empty stop out
+        of the event map and sample its dwell instead."""
+        if len(bus.stop.bus_queue) != 1 or bus.departure_ready:
+            return
+        rates = self.rates
+        e_map = self.event_map
+        if bus in e_map.board:
+            self.total_rate -= sum(e_map.board[bus].itervalues()) * rates['board']
+            del e_map.board[bus]
+        if bus in e_map.disembarks:
+            self.total_rate -= bus.disembarks * rates['disembarks']
+            e_map.disembarks.remove(bus)
+        dwell = self.dwells[bus.stop] = self.sample_dwell(bus)
+        for time, event_type, dest in dwell.events:
+            insort(self.times, time)
+
+    def apply_dwell(self, dwell, until):
+        """Apply the events of the dwell which fire up to the given clock
+        time and are applied by the current time (see event_time), then give
+        the bus back its events in the event map. The waiting passengers
+        statistics charged in the meantime used the counts from the start of
+        the dwell, so they are corrected too (the routes are summed up from
+        the stops)."""
+        bus = dwell.bus
+        stop = bus.stop
+        del self.dwells[stop]
+
+        # Charge the stale counts up to now, then correct them
+        self.record_pax_wait(stop=stop)
+        pax_diff = 0
+        correction = 0.0
+        last = dwell.start
+        sink = None if self.silent else self.sink
+        waits = self.waits
+        snapshots = self.snapshots
+        applied = 0
+        for fired, event_type, dest in dwell.events:
+            if fired > until:
+                break  # the rest is resampled by the normal simulation
+            time = self.event_time(fired, dwell.start)
+            if time > self.time:
+                break  # after the stop time
+            applied += 1
+            correction += pax_diff * (time - last)
+            if snapshots:
+                snapshots.charge(snapshots.wtime, last, time, pax_diff)
+            last = time
+            if event_type == DISEMBARKS:
+                bus.disembark()
+                args = bus.args
+            elif event_type == BOARD:
+                if waits:
+                    waits.board(bus, dest, time)
+                bus.board(dest)
+                pax_diff -= 1
+                args = bus, dest
+            else:
+                if waits:
+                    waits.arrive(stop, dest, time)
+                stop.add_passengers(dest)
+                pax_diff += 1
+                args = stop, self.network.stops[dest]
+            if sink:
+                sink(event_type, time, args)
+        self.forget(dwell.events[applied:])
+        correction += pax_diff * (self.time - last)
+        if snapshots:
+            snapshots.charge(snapshots.wtime, last, self.time, pax_diff)
+
+        self.analysis.wtime[stop.index] += correction
+
+        self.index_bus_events(bus)
+
+    def update_arrivals(self, bus):
+        """Apply the dwell at the stop of the bus as it would not be alone
+        there anymore, then start its own dwell if it is."""
+        dwell = self.dwells.get(bus.stop)
+        if dwell:
+            self.apply_dwell(dwell, self.clock)
+        super(DwellWorld, self).update_arrivals(bus)
+        self.start_dwell(bus)
+
+    def update_new_passengers(self, orig, dest):
+        """Returns False if the passenger was ignored because it is part of
+        the dwell at its stop."""
+        dwell = self.dwells.get(orig)
+        if dwell and dwell.bus.satisfies(dest.stop_id):
+            return False
+        super(DwellWorld, self).update_new_passengers(orig, dest)
+
+    def steps(self, silent=False):
+        """The simulation loop (see World.steps). Dwells which end before
+        the next event fires are applied first."""
+        self.silent = silent
+        self.time = self.clock = 0.0
+        self.times = [0.0]
+        handlers = self.handlers
+        sink = None if silent else self.sink
+        while True:
+            delay = self.sample_delay()
+            if self.dwells:
+                dwell = min(self.dwells.itervalues(), key=lambda dwell: dwell.end)
+                if dwell.end <= self.clock + delay:
+                    # The sampled delay is discarded, which is fine since
+                    # the delays are memoryless
+                    self.clock = dwell.end
+                    time = self.event_time(dwell.end, dwell.start)
+                    if time > self.stop_time:
+                        break
+                    self.time = time
+                    self.apply_dwell(dwell, self.clock)
+                    yield
+                    continue
+
+            self.clock += delay
+            time = self.event_time(self.clock)
+            if time > self.stop_time:
+                insort(self.times, self.clock)  # the dwells may not apply events after it
+                break
+            self.time = time
+            event_type, args = self.choose_event()
+            if handlers[event_type](*args) is not False:
+                insort(self.times, self.clock)
+                if len(self.times) > self.prune_at:
+                    self.prune()
+                if sink:
+                    sink(event_type, self.time, args)
+            yield
+
+        # Apply the dwells still in progress at the stop time
+        self.time = self.stop_time
+        for dwell in self.dwells.values():
+            self.apply_dwell(dwell, float('inf'))
+        yield
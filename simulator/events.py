@@ -1,19 +1,105 @@
 from collections import defaultdict, Counter
+from itertools import izip
 from lib.termcolor import colored
 
 from simulator.formats import EVENTS, EVENT_COLOURS
 
 
-def log_event(event_type, **kwargs):
+# Event types - choose_event returns these codes and World.update uses them
+# to index its handlers. EVENT_NAMES are the names of the formats.
+BOARD, DISEMBARKS, DEPARTS, ARRIVALS, NEW_PASSENGERS = range(5)
+EVENT_NAMES = ('board', 'disembarks', 'departs', 'arrivals', 'new_passengers')
+
+# Names of the arguments of the events in the order of the args tuples of
+# choose_event (and of the parameters of the handlers)
+EVENT_FIELDS = (
+    ('bus', 'dest'),
+    ('bus',),
+    ('bus', 'dest'),
+    ('bus',),
+    ('orig', 'dest'),
+)
+
+
+# An event is recorded as its code, time and args tuple. Sinks get the
+# records and only they format them, so a silent run formats nothing.
+
+def event_kwargs(event_type, args):
+    """Returns the args of an event as a dictionary."""
+    return dict(izip(EVENT_FIELDS[event_type], args))
+
+
+def format_event(event_type, time, args):
+    """Returns the line of an event."""
+    return EVENTS[EVENT_NAMES[event_type]].format(time=time, **event_kwargs(event_type, args))
+
+
+def log_event(event_type, time, args):
     """Logs an event to the output."""
-    print(EVENTS[event_type].format(**kwargs))
+    print(format_event(event_type, time, args))
+
+
+def event_stop(event_type, args):
+    """Returns the stop where an event happens."""
+    if event_type == NEW_PASSENGERS:
+        return args[0]
+    if event_type == DEPARTS:
+        return args[1]
+    return args[0].stop
+
+
+def event_routes(event_type, args):
+    """Returns the ids of the routes of an event, the route of the bus or
+    the routes which can take the new passenger."""
+    if event_type == NEW_PASSENGERS:
+        orig, dest = args
+        return orig.dest_routes.get(dest.stop_id, ())
+    return (args[0].route.route_id,)
+
+
+class EventFilter(object):
+    """
+    Sink which passes on only some of the events to another sink, the
+    events of the chosen types, routes and stops and of those every n-th.
+    The events it drops are never formatted.
+        sink - the sink the events are passed on to
+        types - whether an event of a type is passed, indexed by the codes
+        routes - set of the route ids (or None for all)
+        stops - set of the stop ids (or None for all)
+        every - only every n-th event which passes is passed on
+        count - number of events which passed so far
+    """
+
+    def __init__(self, sink, types=None, routes=None, stops=None, every=1):
+        self.sink = sink
+        self.types = [types is None or name in types for name in EVENT_NAMES]
+        self.routes = set(routes) if routes is not None else None
+        self.stops = set(stops) if stops is not None else None
+        self.every = every
+        self.count = 0
+
+    def __call__(self, event_type, time, args):
+        if not self.types[event_type]:
+            return
+        if self.stops is not None and event_stop(event_type, args).stop_id not in self.stops:
+            return
+        if self.routes is not None and self.routes.isdisjoint(event_routes(event_type, args)):
+            return
+        self.count += 1
+        if self.count % self.every == 0:
+            self.sink(event_type, time, args)
+
+    def flush(self):
+        flush = getattr(self.sink, 'flush', None)
+        if flush:
+            flush()
 
 
-def color_log(event_type, **kwargs):
+def color_log(event_type, time, args):
     """Logs a colored event to the output."""
     print('{} {}'.format(
-        colored('o', EVENT_COLOURS[event_type]),
-        EVENTS[event_type].format(**kwargs)
+        colored('o', EVENT_COLOURS[EVENT_NAMES[event_type]]),
+        format_event(event_type, time, args)
     ))
 
 
@@ -123,6 +123,29 @@ ANALYSIS = {
         'route': 'average waiting passengers on route {0} {1}',
         'stop': 'average waiting passengers at stop {0} {1}',
         'total': 'average waiting passengers {}',
-    }
+    },
+    'qtime_percentiles': {
+        'stop': 'queueing percentiles at stop {0} p50 {1} p95 {2} p99 {3}',
+    },
+    'wtime_percentiles': {
+        'route': 'waiting passengers percentiles on route {0} p50 {1} p95 {2} p99 {3}',
+        'stop': 'waiting passengers percentiles at stop {0} p50 {1} p95 {2} p99 {3}',
+    },
+    'pax_waits': {
+        'route': 'waiting time percentiles on route {0} p50 {1} p95 {2} p99 {3}',
+        'stop': 'waiting time percentiles at stop {0} p50 {1} p95 {2} p99 {3}',
+        'total': 'waiting time percentiles p50 {0} p95 {1} p99 {2}',
+    },
 }
 
+
+
+#####################################################################
+### ENGINE COMPARISON FORMATS
+#####################################################################
+
+COMPARISON = {
+    'header': '{0:<32} {1:>22} {2:>22} {3:>12}',
+    'metric': '{0:<32} {1:>12.4f} +- {2:<7.4f} {3:>12.4f} +- {4:<7.4f} {5:>11.2%}',
+    'time': 'run time exact {0:.3f}s leaping {1:.3f}s speedup {2:.2f}x'
+}
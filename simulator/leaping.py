@@ -0,0 +1,375 @@
+"""
+Approximate tau-leaping engine. New passengers, boardings and disembarks are
+fired in batches while departs and arrivals of buses are still simulated
+exactly, one at a time. The event map is updated by the batches like by the
+handlers of the events, so a leap only touches the buses and stops in it.
+"""
+from collections import Counter
+from itertools import chain
+from math import log as ln, log10, sqrt
+from random import random, shuffle
+from time import time as clock
+
+import numpy as np
+
+from simulator.events import BOARD, DISEMBARKS, DEPARTS, ARRIVALS, NEW_PASSENGERS, PosCounter
+from simulator.formats import COMPARISON
+from simulator.world import World
+
+
+# World.sample_delay draws the delays with log10 so the events of the exact
+# engine fire ln(10) times more often than their nominal rates say.
+RATE_SCALE = ln(10)
+
+# Names of the metrics compared by compare_engines
+METRICS = (
+    'number of missed passengers',
+    'average passengers',
+    'average queueing at all stops',
+    'average waiting passengers',
+)
+
+
+class LeapingWorld(World):
+    """
+    World which leaps over many passenger events at once.
+        epsilon - error control, the largest relative change of a boarding
+                  rate allowed in one leap
+        min_events - exact steps are taken when fewer passenger events than
+                     this are expected in the leap
+        exact_steps - number of exact steps taken before trying to leap again
+        random - random number generator for the batch sizes
+        new_pax - (origin, destination) pairs of new passengers
+        new_rates - rates of the new_pax pairs
+        new_cum - cumulative rates of the new_pax pairs
+        into_rates - scaled new passenger rates of the destinations of a
+                     route at a stop, <stop_id, route_id>: [(<dest_id>, <rate>)]
+        slow_rate - total rate of the departs and arrivals events, kept up to
+                    date like the total rate
+
+    Every passenger gets off a bus at the same rate and independently of
+    the others, so the time in which each of them gets off is sampled
+    before a leap. The disembarks do not limit the leap then, except that
+    it ends when the last passenger gets off a bus (see ready_time).
+    """
+
+    def __init__(self, filename=None, epsilon=0.03, min_events=10, exact_steps=10, seed=None,
+                 scenarios=None):
+        super(LeapingWorld, self).__init__(filename, scenarios)
+        self.epsilon = epsilon
+        self.min_events = min_events
+        self.exact_steps = exact_steps
+        self.random = np.random.RandomState(seed)
+
+    def reseed(self, rand_seed):
+        """Seed the batch sizes too."""
+        super(LeapingWorld, self).reseed(rand_seed)
+        self.random = np.random.RandomState(rand_seed % 2 ** 32)
+
+    def cache_params(self):
+        return [self.epsilon, self.min_events, self.exact_steps]
+
+    def initialise(self, rates=None, routes=None):
+        """Initialise the world and split the new passengers rate between all
+        the origin-destination pairs."""
+        self.slow_rate = 0.0  # the departs of the buses are pushed below
+        super(LeapingWorld, self).initialise(rates=rates, routes=routes)
+        pairs = self.network.passenger_pairs()
+        self.new_pax = [(orig, dest) for orig, dest, prob in pairs]
+        self.new_rates = np.array([prob for orig, dest, prob in pairs])
+        self.new_rates *= self.rates['new_passengers']
+        self.new_cum = np.cumsum(self.new_rates)
+        pair_rates = dict(
+            ((orig.stop_id, dest.stop_id), rate * RATE_SCALE)
+            for (orig, dest), rate in zip(self.new_pax, self.new_rates)
+        )
+        self.into_rates = {}
+        for route in self.network.routes.itervalues():
+            for stop_id in route.stop_ids:
+                self.into_rates[stop_id, route.route_id] = [
+                    (dest_id, pair_rates.get((stop_id, dest_id), 0.0)) for dest_id in route.stop_ids
+                ]
+
+    def push_departs(self, bus):
+        super(LeapingWorld, self).push_departs(bus)
+        self.slow_rate += self.rates['departs']
+
+    def pop_departs(self, bus):
+        super(LeapingWorld, self).pop_departs(bus)
+        self.slow_rate -= self.rates['departs']
+
+    def update_departs(self, bus, dest=None):
+        super(LeapingWorld, self).update_departs(bus, dest)
+        self.slow_rate += bus.road_rate
+
+    def update_arrivals(self, bus):
+        self.slow_rate -= bus.road_rate
+        super(LeapingWorld, self).update_arrivals(bus)
+
+    def fast_rate(self):
+        """Returns the total nominal rate of passenger events."""
+        return self.total_rate - self.slow_rate
+
+    def heads(self):
+        """Generates the heads of the bus queues which are not full, they
+        are the buses with board events or the buses which can become
+        boardable when new passengers come."""
+        e_map = self.event_map
+        for bus in e_map.board:
+            yield bus
+        for bus in chain(e_map.disembarks, e_map.departs):
+            if bus not in e_map.board and bus.is_head and not bus.full():
+                yield bus
+
+    def select_tau(self):
+        """Returns the longest leap in which no boarding rate is expected to
+        change by more than epsilon relatively (the tau selection of Cao,
+        Gillespie and Petzold). The capacity of the buses is not a
+        constraint since the boarding batches are clipped to it."""
+        eps = self.epsilon
+        board = self.rates['board'] * RATE_SCALE
+        tau = float('inf')
+        if self.event_map.board:
+            # a bus whose boarding ends in the leap is ready for departure
+            # at its end, late by at most epsilon of its mean wait to depart
+            tau = eps / (self.rates['departs'] * RATE_SCALE)
+        for head in self.heads():
+            stop = head.stop
+            pax_dests = stop.pax_dests
+            for dest_id, into in self.into_rates[stop.stop_id, head.route.route_id]:
+                count = pax_dests[dest_id]
+                out = board * count
+                if not into + out:
+                    continue
+                bound = max(eps * count, 1.0)
+                drift = abs(into - out)
+                if drift:
+                    tau = min(tau, bound / drift)
+                tau = min(tau, bound * bound / (into + out))
+        return tau
+
+    def sample_disembarks(self):
+        """Returns the times from now in which the passengers who want to
+        get off the buses get off, <bus>: <array of times>."""
+        mean = 1 / (self.rates['disembarks'] * RATE_SCALE)
+        return dict(
+            (bus, self.random.exponential(mean, bus.disembarks)) for bus in self.event_map.disembarks
+        )
+
+    def ready_time(self, off_times):
+        """Returns the time from now in which the last passenger gets off the
+        first bus, it may become ready for departure or boardable then."""
+        return min([times.max() for times in off_times.itervalues()] or [float('inf')])
+
+    def choose_slow_event(self):
+        """Chooses one of the departs or arrivals events weighted by
+        their rates."""
+        rand = random() * self.slow_rate
+        event = None
+        for bus in self.event_map.departs:
+            event = DEPARTS, (bus, bus.stop)
+            rand -= self.rates['departs']
+            if rand < 0:
+                return event
+
+        for bus in self.event_map.arrivals:
+            event = ARRIVALS, bus.args
+            rand -= bus.road_rate
+            if rand < 0:
+                return event
+
+        return event  # rounding errors - take the last one (if any)
+
+    def leap(self, length, silent, off_times):
+        """Fire batches of passenger events for a leap of the given length
+        and update the event map with them like the handlers of the events
+        do. The passengers get off at the times sampled by
+        sample_disembarks. The waiting passengers statistics treat the
+        batches as if they happened in the middle of the leap."""
+        rates = self.rates
+        e_map = self.event_map
+        scale = length * RATE_SCALE
+        disembarks = {}
+        for bus, times in off_times.iteritems():
+            batch = int(np.count_nonzero(times <= length))
+            if batch:
+                disembarks[bus] = batch
+
+        board = rates['board']
+        boards = []
+        boardable = e_map.board.items()
+        # full heads can be boarded once their passengers got off
+        boardable.extend((bus, dict(bus.boards)) for bus in disembarks if bus.is_head and bus.full())
+        for bus, dests in boardable:
+            # seats freed by the disembarking passengers can be taken too
+            free = bus.route.capacity - bus.pax_count + disembarks.get(bus, 0)
+            dests = dests.items()
+            shuffle(dests)  # no destination gets to board first every time
+            for dest, count in dests:
+                batch = min(int(self.random.poisson(board * count * scale)), count, free)
+                if batch:
+                    boards.append((bus, dest, batch))
+                    free -= batch
+
+        # the new passengers of all the pairs are split between them, which
+        # is the same as a batch per pair but does not draw for every pair
+        new_cum = self.new_cum
+        count = self.random.poisson(new_cum[-1] * scale)
+        pairs = np.searchsorted(new_cum, self.random.random_sample(count) * new_cum[-1], side='right')
+        new_pax = [(self.new_pax[i], batch) for i, batch in Counter(pairs.tolist()).iteritems()]
+
+        start = self.time
+        self.time += length / 2
+        waiting = set(bus.stop for bus, dest, batch in boards)
+        waiting.update(orig for (orig, dest), batch in new_pax)
+        for stop in waiting:
+            self.record_pax_wait(stop=stop)
+
+        for bus, batch in disembarks.iteritems():
+            was_full = bus.full()
+            stop = bus.stop
+            bus.pax_dests[stop.stop_id] -= batch
+            self.total_rate -= batch * rates['disembarks']
+            if not bus.disembarks:
+                e_map.disembarks.remove(bus)
+            if was_full:
+                stop.index_bus(bus)
+                if bus.is_head:
+                    bus_boards = PosCounter(dict(bus.boards))
+                    self.total_rate += sum(bus_boards.itervalues()) * board
+                    e_map.board[bus] = bus_boards
+            if not silent:
+                for _ in xrange(batch):
+                    self.sink(DISEMBARKS, self.time, bus.args)
+
+        for bus, dest, batch in boards:
+            if self.waits:
+                self.waits.board(bus, dest, self.time, batch)
+            bus.pax_dests[dest] += batch
+            bus.stop.add_passengers(dest, -batch)
+            self.total_rate -= batch * board
+            e_map.board[bus][dest] -= batch
+            if bus.full():
+                bus.stop.unindex_bus(bus)
+                self.total_rate -= sum(e_map.board.pop(bus).itervalues()) * board
+            if not silent:
+                for _ in xrange(batch):
+                    self.sink(BOARD, self.time, (bus, dest))
+
+        for (orig, dest), batch in new_pax:
+            if self.waits:
+                self.waits.arrive(orig, dest.stop_id, self.time, batch)
+            orig.add_passengers(dest.stop_id, batch)
+            buses = orig.dest_buses.get(dest.stop_id)
+            if buses:
+                head = orig.bus_queue[0]
+                if head in buses:
+                    self.total_rate += batch * board
+                    e_map.board[head][dest.stop_id] += batch
+            if not silent:
+                for _ in xrange(batch):
+                    self.sink(NEW_PASSENGERS, self.time, (orig, dest))
+
+        # The batches may have changed which buses can depart
+        waiting.update(bus.stop for bus in disembarks)
+        for stop in waiting:
+            for bus in stop.bus_queue:
+                ready = bus.departure_ready
+                if ready and not bus.ready:
+                    self.push_departs(bus)
+                elif bus.ready and not ready:
+                    self.pop_departs(bus)
+
+        self.time = start + length
+
+    def step(self, silent):
+        """One step of the exact simulation (see World.run)."""
+        delay = self.sample_delay()
+        event_type, args = self.choose_event()
+        self.handlers[event_type](*args)
+        if not silent:
+            self.sink(event_type, self.time, args)
+        self.time += delay
+
+    def steps(self, silent=False):
+        """The simulation loop (see World.steps). Leap over passenger
+        events whenever enough of them are expected in a leap, otherwise
+        take a burst of exact steps."""
+        silent = silent or self.sink is None
+        self.time = 0.0
+        while self.time < self.stop_time:
+            fast_rate = self.fast_rate()
+            off_times = self.sample_disembarks()
+            tau = min(self.select_tau(), self.ready_time(off_times), self.stop_time - self.time)
+            if tau * fast_rate * RATE_SCALE < self.min_events:
+                for _ in xrange(self.exact_steps):
+                    self.step(silent)
+                    yield
+                    if self.time >= self.stop_time:
+                        break
+                continue
+
+            if self.slow_rate > 0:
+                # Same distribution as World.sample_delay
+                slow_delay = -log10(random()) / self.slow_rate
+                if slow_delay < tau:
+                    self.leap(slow_delay, silent, off_times)
+                    event = self.choose_slow_event()
+                    if event:
+                        event_type, args = event
+                        self.update(event_type, *args)
+                        if not silent:
+                            self.sink(event_type, self.time, args)
+                    yield
+                    continue
+            self.leap(tau, silent, off_times)
+            yield
+
+
+def totals(world):
+    """Returns the network-wide summary statistics of a finished run in the
+    order of METRICS."""
+    summary = world.analysis.summary(world.network, world.stop_time)
+    return tuple(summary[key]['total'] for key in ('missed_pax', 'avg_pax', 'avg_qtime', 'avg_wtime'))
+
+
+def compare_engines(filename, runs=10, epsilon=0.03, min_events=10):
+    """Run the input file with the exact and with the leaping engine and
+    print the mean and standard deviation of the summary statistics of both
+    together with their relative difference and run times."""
+    results = {}
+    run_times = {}
+    for name, factory in (
+        ('exact', lambda: World(filename)),
+        ('leaping', lambda: LeapingWorld(filename, epsilon=epsilon, min_events=min_events)),
+    ):
+        results[name] = []
+        run_times[name] = 0.0
+        for _ in xrange(runs):
+            world = factory()
+            world.validate()
+            start = clock()
+            world.initialise()
+            world.run(silent=True)
+            world.cleanup()
+            run_times[name] += clock() - start
+            results[name].append(totals(world))
+
+    print(COMPARISON['header'].format('metric', 'exact', 'leaping', 'difference'))
+    for i, metric in enumerate(METRICS):
+        exact_mean, exact_std = mean_std([res[i] for res in results['exact']])
+        leap_mean, leap_std = mean_std([res[i] for res in results['leaping']])
+        diff = (leap_mean - exact_mean) / exact_mean if exact_mean else 0.0
+        print(COMPARISON['metric'].format(metric, exact_mean, exact_std, leap_mean, leap_std, diff))
+    print(COMPARISON['time'].format(
+        run_times['exact'], run_times['leaping'], run_times['exact'] / run_times['leaping']
+    ))
+
+
+def mean_std(values):
+    """Returns the mean and the sample standard deviation of the values."""
+    mean = sum(values) / float(len(values))
+    if len(values) < 2:
+        return mean, 0.0
+    var = sum((val - mean) ** 2 for val in values) / (len(values) - 1)
+    return mean, sqrt(var)
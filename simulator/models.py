@@ -1,3 +1,4 @@
+from collections import defaultdict, Counter
 from itertools import cycle, chain, izip
 from random import choice
 
@@ -9,16 +10,29 @@ class Bus(object):
     Model representing a bus object of the simulation.
         route - the route of this bus
         bus_id - unique id of this bus
+        bus_no - number of this bus on its route
         pax_dests - dictionary with destinations as keys and counts as values
         _cur_stop - the stop of the route the bus is on
-        road_rate - rate of the road the bus is on"""
+        road_rate - rate of the road the bus is on
+        ready - whether the departs event of the bus is possible, kept by
+                the world when the departure readiness changes
+        index - position of the bus in the analysis (see Network.assign_indices)"""
 
     def __init__(self, route, bus_id):
         self.route = route
         self.bus_id = '{}.{}'.format(route.route_id, bus_id)
+        self.bus_no = bus_id
         self.pax_dests = PosCounter()
-        self._cur_stop = bus_id % len(route.stops)
+        self.args = (self,)  # args of the disembarks and arrivals events
+        self.reset()
+
+    def reset(self):
+        """Put the bus back on its initial stop, empty and waiting."""
+        self.index = self.route.bus_offset + self.bus_no
+        self.pax_dests.clear()
+        self._cur_stop = self.bus_no % len(self.route.stops)
         self.road_rate = None
+        self.ready = False
 
     @property
     def in_motion(self):
@@ -36,8 +50,11 @@ class Bus(object):
         Bus is ready for departure when:
             - no one wants to disembark the bus
             - it has either full capacity or no passengers want to board.
+        The waiting passengers are counted per route by the stop.
         """
-        return self.disembarks == 0 and (self.full() or list(self.boards) == [])
+        if self.disembarks:
+            return False
+        return self.full() or not self.stop.route_pax[self.route.route_id]
 
     @property
     def is_head(self):
@@ -76,17 +93,25 @@ class Bus(object):
         return sum(self.pax_dests.itervalues())
 
     def board(self, dest):
-        """Board a passenger with destination dest."""
+        """Board a passenger with destination dest. A full bus is taken out
+        of the destination index of its stop."""
         self.pax_dests[dest] += 1
-        self.stop.pax_dests[dest] -= 1
+        self.stop.add_passengers(dest, -1)
+        if self.full():
+            self.stop.unindex_bus(self)
 
     def disembark(self):
-        """Disembark one passenger at the current stop."""
+        """Disembark one passenger at the current stop. A bus which was full
+        is put back into the destination index of its stop."""
         self.pax_dests[self.stop.stop_id] -= 1
+        if self.full(offset=1):
+            self.stop.index_bus(self)
 
     def arrive(self):
         """Arrive to the current stop. We need to set road_rate to None."""
         self.stop.bus_queue.append(self)
+        if not self.full():
+            self.stop.index_bus(self)
         self.road_rate = None
 
     def full(self, offset=0):
@@ -97,12 +122,13 @@ class Bus(object):
 
     def satisfies(self, dest):
         """Checks if the destination is on this bus's route."""
-        return dest in (stop.stop_id for stop in self.route.stops)
+        return dest in self.route.stop_ids
 
     def dequeue(self, rates):
         """Departs the bus from its stop.
         Also sets the road_rate and the stop to the next stop on the route."""
         self.stop.bus_queue.remove(self)
+        self.stop.unindex_bus(self)
         next_stop = self.next_stop  # set next stop
         self.road_rate = rates[self.stop.stop_id, next_stop.stop_id]
         self._cur_stop = (self._cur_stop + 1) % len(self.route.stops)
@@ -131,14 +157,22 @@ class Route(object):
     Model representing a route object of the simulation.
         route_id - unique id of this route
         stops - list of stops of this route
+        stop_ids - set of the ids of the stops of this route
         bus_count - number of buses on this route
-        capacity - capacity of buses on this route"""
+        capacity - capacity of buses on this route
+        index - position of the route in the analysis
+        bus_offset - position of the first bus of the route in the analysis
+        buses - the buses of this route, reused by every initialise"""
 
     def __init__(self, route_id, stops, bus_count, capacity):
         self.route_id = route_id
         self.stops = stops
+        self.stop_ids = frozenset(stop.stop_id for stop in stops)
         self.bus_count = bus_count
         self.capacity = capacity
+        self.index = 0
+        self.bus_offset = 0
+        self.buses = []
 
     def __hash__(self):
         return hash(self.route_id)
@@ -162,16 +196,37 @@ class Stop(object):
         pax_dests - dictionary with destinations as keys and counts as values
         qtime - time when the average queueing buses stat was last updated
         bus_count - number of bus visists (arrival-departs) on this stop
-        wtime - time when the average waiting passengers was last updated"""
+        wtime - time when the average waiting passengers was last updated
+        dest_buses - dictionary with destinations as keys and sets of the
+                     queued buses which are not full and serve them as values
+        dest_routes - dictionary with destinations as keys and sets of the
+                      ids of the routes which go from here to them as values
+        route_pax - number of waiting passengers the buses of a route can
+                    take, <route_id>: <count>
+        index - position of the stop in the analysis"""
 
     def __init__(self, stop_id):
         self.stop_id = stop_id
         self.bus_queue = []
+        self.dest_buses = defaultdict(set)
+        self.dest_routes = defaultdict(set)
+        self.route_pax = Counter()
+        self.index = 0
         self.pax_dests = PosCounter()
         self.qtime = 0.0
         self.bus_count = 0
         self.wtime = 0.0
 
+    def reset(self):
+        """Clear out the buses, passengers and statistics of the stop."""
+        del self.bus_queue[:]
+        self.dest_buses.clear()
+        self.route_pax.clear()
+        self.pax_dests.clear()
+        self.qtime = 0.0
+        self.wtime = 0.0
+        self.bus_count = 0
+
     @property
     def queue_length(self):
         """Returns the number of buses that are queueing (not head)."""
@@ -183,6 +238,23 @@ class Stop(object):
         """Returns the number of passengers on this bus."""
         return sum(self.pax_dests.itervalues())
 
+    def add_passengers(self, dest_id, count=1):
+        """Add count waiting passengers going to dest_id (remove them if
+        count is negative). Keeps the waiting counts of the routes."""
+        self.pax_dests[dest_id] += count
+        for route_id in self.dest_routes.get(dest_id, ()):
+            self.route_pax[route_id] += count
+
+    def index_bus(self, bus):
+        """Add the bus to the destination index."""
+        for dest_id in bus.route.stop_ids:
+            self.dest_buses[dest_id].add(bus)
+
+    def unindex_bus(self, bus):
+        """Remove the bus from the destination index (if it is there)."""
+        for dest_id in bus.route.stop_ids:
+            self.dest_buses[dest_id].discard(bus)
+
     def __hash__(self):
         return hash(self.stop_id)
 
@@ -203,24 +275,52 @@ class Stop(object):
 class Network(object):
     """Model representing a network object of the simulation.
         routes - dict with route_id as key route as value
-        stops - dict with stop_id as key stop as value"""
+        stops - dict with stop_id as key stop as value
+        stop_list - stops in the order of their indices
+        route_list - routes in the order of their indices
+        bus_ids - ids of the buses in the order of their indices
+        dests - passenger_dests of every stop"""
 
     def __init__(self):
         self.routes = {}  # <route_id> : <route>
         self.stops = {}  # <stop_id> : <stop>
+        self.stop_list = []
+        self.route_list = []
+        self.bus_ids = []
+        self.dests = {}
+
+    def assign_indices(self):
+        """Number the stops and routes in the order of their ids and the
+        buses route by route. The analysis is stored in lists in this order."""
+        self.stop_list = [self.stops[stop_id] for stop_id in sorted(self.stops)]
+        for index, stop in enumerate(self.stop_list):
+            stop.index = index
+        self.dests = dict((stop, self.passenger_dests(stop)) for stop in self.stop_list)
+
+        self.route_list = [self.routes[route_id] for route_id in sorted(self.routes)]
+        self.bus_ids = []
+        for index, route in enumerate(self.route_list):
+            route.index = index
+            route.bus_offset = len(self.bus_ids)
+            self.bus_ids.extend('{}.{}'.format(route.route_id, bus_no) for bus_no in xrange(route.bus_count))
 
     def initialise(self):
         """Initialise the network. Clear out all the bus stops from buses and
-        passengers and add buses to stops."""
+        passengers and add buses to stops. The stops and buses are reset in
+        place, buses are only created or dropped when the bus count of a
+        route changed."""
+        self.assign_indices()
         for stop in self.stops.itervalues():
-             stop.bus_queue = []
-             stop.qtime = 0.0
-             stop.pax_dests = PosCounter()
+            stop.reset()
 
         for route in self.routes.itervalues():
-            for bus_id, stop in izip(xrange(route.bus_count), cycle(route.stops)):
-                bus = Bus(route, bus_id)
+            buses = route.buses
+            del buses[route.bus_count:]
+            buses.extend(Bus(route, bus_no) for bus_no in xrange(len(buses), route.bus_count))
+            for bus, stop in izip(buses, cycle(route.stops)):
+                bus.reset()
                 stop.bus_queue.append(bus)
+                stop.index_bus(bus)
                 stop.bus_count += 1
 
     def add_route(self, route_id, stop_ids, bus_count, cap, **kwargs):
@@ -236,13 +336,22 @@ class Network(object):
                 stop = Stop(stop_id)
                 self.stops[stop_id] = stop
             stops.append(stop)
-        self.routes[route_id] = Route(route_id, stops, bus_count, cap)
+        route = Route(route_id, stops, bus_count, cap)
+        self.routes[route_id] = route
+        for stop in stops:
+            for dest_id in route.stop_ids:
+                stop.dest_routes[dest_id].add(route_id)
 
     def generate_passenger(self):
         """Generates a passenger on the network.
         His destination stop must be satisfiable from his origin stop."""
-        orig = choice(self.stops.values())
+        orig = choice(self.stop_list)
+        dest = choice(self.dests[orig])
+        return orig, dest
 
+    def passenger_dests(self, orig):
+        """Returns the stops a passenger from the origin stop can travel to.
+        A stop is listed once for every route that takes him there."""
         dests = []
         for route in self.routes.itervalues():
             try:
@@ -252,47 +361,74 @@ class Network(object):
             except ValueError:
                 # raised when the origin stop is not on this route
                 continue
-
-        dest = choice(dests)
-        return dict(orig=orig, dest=dest)
+        return dests
+
+    def passenger_pairs(self):
+        """Returns (origin, destination, probability) triples of all the
+        passengers generate_passenger can generate."""
+        stops = self.stops.values()
+        pairs = []
+        for orig in stops:
+            dests = self.passenger_dests(orig)
+            for dest in set(dests):
+                prob = dests.count(dest) / float(len(dests) * len(stops))
+                pairs.append((orig, dest, prob))
+        return pairs
+
+    def components(self):
+        """Returns the connected components of the network as (route_ids,
+        stop_ids) pairs of sorted lists. Routes are connected when they share
+        a stop, routes of different components never interact."""
+        components = []  # [route_ids, stops] pairs
+        for route_id, route in self.routes.iteritems():
+            route_ids = [route_id]
+            stops = set(route.stops)
+            for component in components[:]:
+                if component[1] & stops:
+                    route_ids.extend(component[0])
+                    stops |= component[1]
+                    components.remove(component)
+            components.append([route_ids, stops])
+        return [
+            (sorted(route_ids), sorted(stop.stop_id for stop in stops))
+            for route_ids, stops in components
+        ]
+
+    def restrict(self, route_ids):
+        """Remove all the routes except the given ones and the stops which
+        are not on any of them."""
+        self.routes = dict((route_id, self.routes[route_id]) for route_id in route_ids)
+        stop_ids = set()
+        for route in self.routes.itervalues():
+            stop_ids |= route.stop_ids
+        self.stops = dict((stop_id, self.stops[stop_id]) for stop_id in stop_ids)
 
     def validate(self, rates, ignore_warn):
         """Validate the network. The exception messages describe what we
-        are checking."""
+        are checking. The roads of the routes are collected into a set, so
+        every road rate is checked in constant time."""
+        roads = set()  # (orig, dest) pairs of consecutive stops of the routes
         for route_id, route in self.routes.iteritems():
             stop_ids = [stop.stop_id for stop in route.stops]
             first_last = (stop_ids[-1], stop_ids[0])
             for orig, dest in chain(izip(stop_ids, stop_ids[1:]), [first_last]):
                 if orig == dest:
                     raise InputError('Route {} has the same stop twice in a row'.format(route_id))
-                try:
-                    rates[orig, dest]
-                except KeyError:
+                if (orig, dest) not in rates:
                     raise InputError('Road {0}-{1} is missing a rate.'.format(orig, dest))
+                roads.add((orig, dest))
+
+        if ignore_warn:
+            return  # the rest are warnings
 
-        for key, rate in rates.iteritems():
+        for key in rates:
             if isinstance(key, tuple):
                 # We're dealing with a road
                 orig, dest = key
-                try:
-                    orig_stop = self.stops[orig]
-                    dest_stop = self.stops[dest]
-                except KeyError:
-                    # One of the stops is not on any route
-                    if not ignore_warn:
-                        raise InputWarning('Road {0}-{1} has a rate but at least one of the stops is not on any route.'.format(orig, dest))
-
-                found = False
-                for route in self.routes.itervalues():
-                    stops = route.stops
-                    try:
-                        found = stops.index(dest_stop) - stops.index(orig_stop) == 0
-                        found = True
-                    except ValueError:
-                        continue  # One of them is not in stops
-                if not found:
-                    if not ignore_warn:
-                        raise InputWarning('Road {0}-{1} has a rate but no route contains it'.format(orig, dest))
+                if orig not in self.stops or dest not in self.stops:
+                    raise InputWarning('Road {0}-{1} has a rate but at least one of the stops is not on any route.'.format(orig, dest))
+                if key not in roads:
+                    raise InputWarning('Road {0}-{1} has a rate but no route contains it'.format(orig, dest))
 
     def __repr__(self):
         return """
@@ -0,0 +1,185 @@
+"""
+Output files and the log of the events. A compressed output is written by a
+background thread, so the simulation does not wait for the compression (zlib
+releases the interpreter lock while it compresses). The events can be
+formatted by a background thread too, from compact records of them.
+"""
+import gzip
+import sys
+from Queue import Queue
+from threading import Thread
+
+from simulator.events import EVENT_NAMES, DEPARTS, NEW_PASSENGERS
+from simulator.formats import EVENTS
+from simulator.trace import event_record
+
+
+def record_format(event_type):
+    """Returns the format of an event (see formats.EVENTS) with the fields
+    of its record (see trace.event_record) and the bus id."""
+    fmt = EVENTS[EVENT_NAMES[event_type]].replace('{bus.stop}', '{stop}')
+    if event_type == DEPARTS:
+        fmt = fmt.replace('{dest}', '{stop}')
+    elif event_type == NEW_PASSENGERS:
+        fmt = fmt.replace('{orig}', '{stop}')
+    return fmt + '\n'
+
+
+RECORD_FORMATS = tuple(record_format(event_type) for event_type in xrange(len(EVENT_NAMES)))
+
+
+def open_output(filename, level=None):
+    """Opens the output file, gzipped with the compression level if one is
+    given or if the file name ends with .gz."""
+    if level is None and not filename.endswith('.gz'):
+        return open(filename, 'w')
+    return BackgroundWriter(gzip.open(filename, 'wb', level or 6))
+
+
+class BackgroundWriter(object):
+    """
+    File-like object which writes to a file in a background thread.
+        f - the file written by the thread
+        buffer - strings written since the last chunk was queued
+        size - length of the buffer
+        chunk_size - length of the chunks given to the thread
+        queue - queue of the chunks, a full queue blocks the writes
+        thread - the writing thread
+        error - exception raised by the thread, raised again by close
+    """
+
+    def __init__(self, f, chunk_size=1 << 16, queue_size=16):
+        self.f = f
+        self.buffer = []
+        self.size = 0
+        self.chunk_size = chunk_size
+        self.queue = Queue(queue_size)
+        self.error = None
+        self.thread = Thread(target=self.work, name='output writer')
+        self.thread.daemon = True
+        self.thread.start()
+
+    def write(self, string):
+        self.buffer.append(string)
+        self.size += len(string)
+        if self.size >= self.chunk_size:
+            self.flush()
+
+    def writelines(self, strings):
+        for string in strings:
+            self.write(string)
+
+    def flush(self):
+        """Queue the buffer for the thread (it is not waited for)."""
+        if self.buffer:
+            self.queue.put(''.join(self.buffer))
+            self.buffer = []
+            self.size = 0
+
+    def work(self):
+        while True:
+            chunk = self.queue.get()
+            if chunk is None:
+                break
+            if self.error is None:
+                try:
+                    self.f.write(chunk)
+                except Exception as e:
+                    self.error = e  # keep taking the chunks so writes do not block
+
+    def close(self):
+        """Write the rest and close the file."""
+        if self.thread is None:
+            return
+        self.flush()
+        self.queue.put(None)
+        self.thread.join()
+        self.thread = None
+        self.f.close()
+        if self.error is not None:
+            raise self.error
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class RecordWriter(object):
+    """
+    Sink which logs the events like log_event but formats and writes them in
+    a background thread. The simulation only takes compact records of the
+    events (the objects change as the simulation goes on) and hands them to
+    the thread in batches.
+        network - the network of the events, for the ids of the buses
+        f - the output (sys.stdout by default)
+        batch - records not handed to the thread yet
+        batch_size - number of records in a batch
+        queue - queue of the batches, a full queue blocks the simulation
+        thread - the formatting thread
+        error - exception raised by the thread, raised again by flush
+    """
+
+    def __init__(self, network, f=None, batch_size=4096, queue_size=8):
+        self.network = network
+        self.f = f or sys.stdout
+        self.batch = []
+        self.batch_size = batch_size
+        self.queue = Queue(queue_size)
+        self.error = None
+        self.thread = Thread(target=self.work, name='event log writer')
+        self.thread.daemon = True
+        self.thread.start()
+
+    def __call__(self, event_type, time, args):
+        self.batch.append(event_record(event_type, time, args))
+        if len(self.batch) >= self.batch_size:
+            self.queue.put(self.batch)
+            self.batch = []
+
+    def work(self):
+        formats = RECORD_FORMATS
+        while True:
+            batch = self.queue.get()
+            try:
+                if batch is None:
+                    break
+                if self.error is None:
+                    bus_ids = self.network.bus_ids
+                    self.f.write(''.join([
+                        formats[code].format(time=time, bus=bus_ids[bus], stop=stop, dest=dest)
+                        for time, bus, stop, dest, code in batch
+                    ]))
+            except Exception as e:
+                self.error = e  # keep taking the batches so the simulation does not block
+            finally:
+                self.queue.task_done()
+
+    def flush(self):
+        """Wait until all the events are written. The world does this before
+        it logs anything else."""
+        if self.batch:
+            self.queue.put(self.batch)
+            self.batch = []
+        self.queue.join()
+        if self.error is not None:
+            error, self.error = self.error, None
+            raise error
+
+    def close(self):
+        """Write the rest and stop the thread."""
+        if self.thread is None:
+            return
+        try:
+            self.flush()
+        finally:
+            self.queue.put(None)
+            self.thread.join()
+            self.thread = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
@@ -0,0 +1,123 @@
+"""
+Parallel simulation of the connected components of the network. Routes which
+share no stops never interact, so every component is simulated by its own
+worker with its share of the new passengers and the analysis is merged.
+"""
+from multiprocessing import Pool, cpu_count
+from random import getrandbits, seed
+
+from simulator.world import World
+
+
+class PartitionedWorld(World):
+    """
+    World which simulates the connected components of its network in
+    parallel. Only the summary statistics are logged, the events of the
+    components are not.
+        filename - the input file the workers read the network from
+        workers - number of worker processes
+        components - (route_ids, stop_ids) pairs of the components
+        pool - pool of the workers, created for the first run
+    """
+
+    def __init__(self, filename=None, workers=None, scenarios=None):
+        super(PartitionedWorld, self).__init__(filename, scenarios)
+        self.filename = filename
+        self.workers = workers or cpu_count()
+        self.pool = None
+
+    def initialise(self, rates=None, routes=None):
+        """Initialise the world and remember the experimental parameters
+        for the workers."""
+        super(PartitionedWorld, self).initialise(rates=rates, routes=routes)
+        self.exp_params = dict(rates=rates, routes=routes)
+        self.components = self.network.components()
+        self.partitioned = False
+
+    def run(self, silent=False):
+        """Run every component in a worker and merge their analysis. A
+        single component, or a world without an input file for the workers
+        to read (see World.from_scenario), is simulated here like in
+        World.run."""
+        if len(self.components) < 2 or not self.filename:
+            super(PartitionedWorld, self).run(silent=silent)
+            return
+
+        if self.pool is None:
+            self.pool = Pool(min(self.workers, len(self.components)))
+
+        stop_count = float(len(self.network.stops))
+        jobs = [
+            (self.filename, route_ids, len(stop_ids) / stop_count, self.exp_params, getrandbits(32))
+            for route_ids, stop_ids in self.components
+        ]
+        for stops, routes, buses in self.pool.map(run_component, jobs):
+            self.merge(stops, routes, buses)
+        self.time = self.stop_time
+        self.partitioned = True
+
+    def merge(self, stops, routes, buses):
+        """Copy the analysis of a component into the analysis of the world.
+        The components are indexed differently so the values come keyed by
+        the ids (see run_component)."""
+        analysis = self.analysis
+        for stop_id, (missed, qtime, wtime, bus_count) in stops.iteritems():
+            stop = self.network.stops[stop_id]
+            analysis.missed_stop[stop.index] = missed
+            analysis.qtime[stop.index] = qtime
+            analysis.wtime[stop.index] = wtime
+            stop.bus_count = bus_count
+        for route_id, missed in routes.iteritems():
+            analysis.missed_route[self.network.routes[route_id].index] = missed
+        index = dict((bus_id, i) for i, bus_id in enumerate(self.network.bus_ids))
+        for bus_id, (count, summa) in buses.iteritems():
+            analysis.pax_count[index[bus_id]] = count
+            analysis.pax_sum[index[bus_id]] = summa
+
+    def cleanup(self):
+        """The workers have cleaned up their components already."""
+        if not self.partitioned:
+            super(PartitionedWorld, self).cleanup()
+
+    def start(self):
+        """Validate and run like World.start, then stop the workers."""
+        try:
+            super(PartitionedWorld, self).start()
+        finally:
+            if self.pool is not None:
+                self.pool.close()
+                self.pool.join()
+                self.pool = None
+
+
+def run_component(job):
+    """Simulate one component of the network in a worker and return its
+    analysis keyed by the ids: <stop_id>: (missed, qtime, wtime, visits),
+    <route_id>: missed and <bus_id>: (departures, passengers)."""
+    filename, route_ids, share, exp_params, rand_seed = job
+    seed(rand_seed)  # forked workers would share the random state
+    world = World(filename)
+    world.network.restrict(route_ids)
+    world.rates.update(exp_params['rates'] or {})
+    world.rates['new_passengers'] *= share
+    # the experiments of the routes of the other components do not apply
+    routes = dict(
+        (route_id, params) for route_id, params in (exp_params['routes'] or {}).iteritems()
+        if route_id in route_ids
+    )
+    world.initialise(routes=routes)
+    world.run(silent=True)
+    world.cleanup()
+
+    analysis = world.analysis
+    network = world.network
+    stops = dict(
+        (stop.stop_id, (analysis.missed_stop[i], analysis.qtime[i], analysis.wtime[i], stop.bus_count))
+        for i, stop in enumerate(network.stop_list)
+    )
+    routes = dict((route.route_id, analysis.missed_route[i]) for i, route in enumerate(network.route_list))
+    buses = dict(
+        (bus_id, (analysis.pax_count[i], analysis.pax_sum[i]))
+        for i, bus_id in enumerate(network.bus_ids)
+    )
+    return stops, routes, buses
@@ -0,0 +1,171 @@
+"""
+Replay of recorded events. The events of a text log or a binary trace are
+applied to the world by its handlers at their recorded times, so the summary
+statistics of a run are recomputed without choosing events or sampling
+delays.
+"""
+import re
+
+from simulator.errors import SimulationException
+from simulator.events import BOARD, DISEMBARKS, DEPARTS, ARRIVALS, NEW_PASSENGERS, EVENT_NAMES
+from simulator.formats import EVENTS
+from simulator.trace import HEADER, MAGIC, TraceReader
+from simulator.world import World
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+
+class ReplayError(SimulationException):
+    """This exception is raised when the events do not match the network."""
+    pass
+
+
+def event_regex(fmt):
+    """Returns the regex matching the lines of an event format and the names
+    of its fields in the order of the groups."""
+    parts = re.split(r'\{([\w.]+)\}', fmt)
+    regex = ''.join(re.escape(part) if i % 2 == 0 else r'(\S+)' for i, part in enumerate(parts))
+    return re.compile(regex + '$'), parts[1::2]
+
+
+# Regexes of the logged events, they are searched for so that the lines
+# of color_log match too
+EVENT_RX = [event_regex(EVENTS[name]) for name in EVENT_NAMES]
+
+
+def is_trace(filename):
+    """Returns True if the file is a binary trace."""
+    with open(filename, 'rb') as f:
+        return f.read(HEADER.size)[:len(MAGIC)] == MAGIC
+
+
+def text_event(line):
+    """Returns the (time, code, fields) of the event logged in the line or
+    None if it is another line (e.g. of the summary statistics), fields are
+    the strings of the event format fields."""
+    line = line.rstrip('\n')
+    for event_type, (regex, names) in enumerate(EVENT_RX):
+        match = regex.search(line)
+        if match:
+            fields = dict(zip(names, match.groups()))
+            return float(fields['time']), event_type, fields
+    return None
+
+
+def text_events(lines):
+    """Yields the (time, code, fields) of the events logged in the lines,
+    other lines are skipped."""
+    for line in lines:
+        event = text_event(line)
+        if event is not None:
+            yield event
+
+
+class ReplayWorld(World):
+    """
+    World which replays recorded events instead of simulating.
+        bus_list - buses in the order of their indices
+        bus_map - dictionary with bus ids as keys and buses as values
+
+    The events have to be in time order. Logs of the dwell engine are not
+    (a dwell is logged when it is applied), only their traces are sorted.
+    """
+
+    def initialise(self, rates=None, routes=None):
+        """Initialise the world and look up the buses of the events."""
+        super(ReplayWorld, self).initialise(rates=rates, routes=routes)
+        self.bus_list = [bus for route in self.network.route_list for bus in route.buses]
+        self.bus_map = dict((bus.bus_id, bus) for bus in self.bus_list)
+
+    def text_args(self, event_type, fields):
+        """Returns the args tuple of a logged event."""
+        stops = self.network.stops
+        if event_type == NEW_PASSENGERS:
+            return stops[int(fields['orig'])], stops[int(fields['dest'])]
+        bus = self.bus_map[fields['bus']]
+        if event_type == BOARD:
+            return bus, int(fields['dest'])
+        if event_type == DEPARTS:
+            return bus, stops[int(fields['dest'])]
+        return bus.args
+
+    def trace_args(self, event_type, bus, stop, dest):
+        """Returns the args tuple of a traced event."""
+        stops = self.network.stops
+        if event_type == NEW_PASSENGERS:
+            return stops[stop], stops[dest]
+        bus = self.bus_list[bus]
+        if event_type == BOARD:
+            return bus, dest
+        if event_type == DEPARTS:
+            return bus, stops[stop]
+        return bus.args
+
+    def replay(self, events, silent=True):
+        """Apply the (time, code, args) events. The events after the stop
+        time are ignored like World.run would not simulate them."""
+        handlers = self.handlers
+        sink = None if silent else self.sink
+        stop_time = self.stop_time
+        for time, event_type, args in events:
+            if time > stop_time:
+                break
+            self.time = time
+            handlers[event_type](*args)
+            if sink:
+                sink(event_type, time, args)
+        self.time = stop_time
+
+    def read_text(self, filename):
+        """Yields the (time, code, args) of the events in a text log as they
+        are read. The events have to be in time order."""
+        last_time = 0.0
+        with open(filename) as f:
+            for number, line in enumerate(f, 1):
+                event = text_event(line)
+                if event is None:
+                    continue
+                time, event_type, fields = event
+                if time < last_time:
+                    raise ReplayError('Line {} of {} is out of time order (replay a trace instead): {}'.format(
+                        number, filename, line.strip()
+                    ))
+                last_time = time
+                try:
+                    args = self.text_args(event_type, fields)
+                except (KeyError, IndexError, ValueError):
+                    raise ReplayError('Line {} of {} is not in the network: {}'.format(
+                        number, filename, line.strip()
+                    ))
+                yield time, event_type, args
+
+    def read_trace(self, filename):
+        """Yields the (time, code, args) of the events in a binary trace.
+        The records are only sorted (by a copy) if they are out of order."""
+        with TraceReader(filename) as reader:
+            if np is not None:
+                times = reader.columns()['time']
+                ordered = bool((times[1:] >= times[:-1]).all())
+                del times
+            else:
+                ordered = False
+            records = reader if ordered else sorted(reader, key=lambda record: record[0])
+            for number, (time, bus, stop, dest, event_type) in enumerate(records):
+                try:
+                    args = self.trace_args(event_type, bus, stop, dest)
+                except (KeyError, IndexError):
+                    raise ReplayError('Record {} of {} is not in the network'.format(number, filename))
+                yield time, event_type, args
+
+    def replay_file(self, filename, silent=True):
+        """Replay a text log or a binary trace of a run of the world's input
+        and log the summary statistics."""
+        self.validate()
+        self.initialise()
+        events = self.read_trace(filename) if is_trace(filename) else self.read_text(filename)
+        self.replay(events, silent=silent)
+        self.cleanup()
+        self.log_stats()
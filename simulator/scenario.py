@@ -0,0 +1,121 @@
+"""
+Builder of the scenarios the world simulates. The parser adds the lines of an
+input file to a Scenario one by one, scenarios generated by a program can be
+built the same way without formatting and parsing any text.
+"""
+from numbers import Number
+
+from simulator.errors import InputError, InputWarning
+from simulator.formats import RATES_RX
+from simulator.models import Network
+
+
+class Scenario(object):
+    """
+    The network, rates, parameters and experiments of a simulation. Every
+    value of a route, road or rate can be a list of values to experiment
+    with instead of a single value.
+        network - the bus network
+        rates - dictionary of the rates (the first value of experiments)
+        params - stop_time, ignore_warn, optimise and experimental_mode
+        experiments - dictionary of experiment values (see World)
+        warning - InputWarning raised by build unless warnings are ignored
+
+    Scenario().add_route(1, [1, 2], 2, 10).add_road(1, 2, 0.3)... builds
+    the same scenario as the lines of the input file would.
+    """
+
+    def __init__(self):
+        self.network = Network()
+        self.rates = {}
+        self.params = {'optimise': False, 'ignore_warn': False, 'experimental_mode': False}
+        self.experiments = {'routes': {}, 'rates': {}}
+        self.warning = None
+
+    def values(self, value, description):
+        """Returns the first value and the list of experimental values (or
+        None) of a value or a list of values."""
+        if not isinstance(value, (list, tuple)):
+            return positive(value, description), None
+        if not value:
+            raise InputError('{} has no values.'.format(description))
+        values = [positive(val, description) for val in value]
+        self.params['experimental_mode'] = True
+        return values[0], values
+
+    def add_route(self, route_id, stop_ids, bus_count, cap):
+        """Add a route with its stops, number of buses and capacity."""
+        if route_id in self.network.routes:
+            raise InputError('Route {} specified twice.'.format(route_id))
+        params = {}
+        for name, value, description in (
+            ('bus_count', bus_count, 'Number of buses on route {}'.format(route_id)),
+            ('cap', cap, 'Capacity on route {}'.format(route_id)),
+        ):
+            params[name], ex_values = self.values(value, description)
+            if ex_values:
+                self.experiments['routes'].setdefault(route_id, {})[name] = ex_values
+        self.network.add_route(route_id, list(stop_ids), params['bus_count'], params['cap'])
+        return self
+
+    def add_road(self, orig, dest, rate):
+        """Add the rate of the road from stop orig to stop dest."""
+        if (orig, dest) in self.rates:
+            raise InputError('Road rate {0} - {1} specified twice.'.format(orig, dest))
+        if orig == dest:
+            self.warning = InputWarning('Rate from stop {} to itself specified'.format(orig))
+        self.add_rate_values((orig, dest), rate, 'Road rate {0} - {1}'.format(orig, dest))
+        return self
+
+    def add_rate(self, name, rate):
+        """Add one of the event rates (board, disembarks, departs or
+        new_passengers)."""
+        if name not in RATES_RX:
+            raise InputError('Unknown rate {}.'.format(name))
+        if name in self.rates:
+            raise InputError('Rate {0} specified twice.'.format(name))
+        self.add_rate_values(name, rate, 'Rate {}'.format(name))
+        return self
+
+    def add_rate_values(self, key, rate, description):
+        rate, ex_rates = self.values(rate, description)
+        self.rates[key] = float(rate)
+        if ex_rates:
+            self.experiments['rates'][key] = map(float, ex_rates)
+
+    def set_stop_time(self, stop_time):
+        if 'stop_time' in self.params:
+            raise InputError('Stop time specified twice.')
+        self.params['stop_time'] = float(positive(stop_time, 'Stop time'))
+        return self
+
+    def ignore_warnings(self):
+        if self.params['ignore_warn']:
+            raise InputError('Ignore warnings specified twice.')
+        self.params['ignore_warn'] = True
+        return self
+
+    def optimise_parameters(self):
+        if self.params['optimise']:
+            raise InputError('Optimise parameters specified twice.')
+        self.params['optimise'] = True
+        return self
+
+    def build(self):
+        """Returns the network, rates, params and experiments of the
+        scenario like parse_lines."""
+        if 'stop_time' not in self.params:
+            raise InputError('Stop time is missing from the input.')
+
+        if self.warning and not self.params['ignore_warn']:
+            raise self.warning
+
+        return self.network, self.rates, self.params, self.experiments
+
+
+def positive(value, description):
+    """Returns the value if it is a positive number. The input format can
+    not express anything else."""
+    if not isinstance(value, Number) or value <= 0:
+        raise InputError('{0} has to be positive, not {1!r}.'.format(description, value))
+    return value
@@ -0,0 +1,276 @@
+"""
+Simulation server. Jobs are JSON lines sent over a Unix domain socket or a
+localhost TCP port and run by a pool of workers which stays warm between the
+jobs. The workers keep the inputs they have parsed and validated in memory,
+so a job of a known input neither reads nor parses it again.
+
+A job is {"input": <path>, "engine": "exact" | "dwell" | "leap",
+"epsilon": <float>, "seed": <int>, "events": <bool>}, only the input is
+required. The output of the job (the summary statistics, or the results of
+the experiments) is sent back in chunks while the job runs and the
+connection is closed. An input which can not be run only gets a fixed error
+message, the server does not send back the contents of its files.
+"""
+import cPickle
+import json
+import os
+import signal
+import socket
+import sys
+from collections import OrderedDict
+from multiprocessing import Manager, Pool, cpu_count
+from SocketServer import StreamRequestHandler, ThreadingMixIn, TCPServer, UnixStreamServer
+
+from simulator.cache import ResultCache, input_key, open_cache
+from simulator.errors import SimulationException
+from simulator.world import World
+
+
+ENGINES = ('exact', 'dwell', 'leap')
+
+# Fixed replies to the jobs which can not be run
+NO_INPUT = 'Input file does not exist!'
+INVALID_INPUT = 'Invalid input file!'
+FAILED = 'Simulation failed!'
+
+
+class MemoryScenarioCache(object):
+    """
+    In-memory cache of the parsed and validated inputs of a worker, used by
+    the world like a ScenarioCache. The inputs are kept pickled since the
+    worlds change their networks.
+        entries - pickled inputs by their keys, least recently used first
+        size - number of inputs kept
+    """
+
+    def __init__(self, size=32):
+        self.entries = OrderedDict()
+        self.size = size
+
+    def file_key(self, filename):
+        return input_key(filename)
+
+    def get(self, key):
+        data = self.entries.pop(key, None)
+        if data is None:
+            return None
+        self.entries[key] = data  # most recently used
+        return cPickle.loads(data)
+
+    def put(self, key, scenario):
+        self.entries[key] = cPickle.dumps(scenario, cPickle.HIGHEST_PROTOCOL)
+        while len(self.entries) > self.size:
+            self.entries.popitem(last=False)
+
+
+# The inputs of the jobs run by this worker process
+scenarios = MemoryScenarioCache()
+
+
+def job_world(job):
+    """Returns the world of a job."""
+    engine = job.get('engine', 'exact')
+    if engine == 'leap':
+        from simulator.leaping import LeapingWorld
+        world = LeapingWorld(job['input'], epsilon=job.get('epsilon') or 0.03, scenarios=scenarios)
+    elif engine == 'dwell':
+        from simulator.dwell import DwellWorld
+        world = DwellWorld(job['input'], scenarios=scenarios)
+    else:
+        world = World(job['input'], scenarios=scenarios)
+    if job.get('seed') is not None:
+        world.seed = job['seed']
+        if job.get('cache_dir'):
+            world.cache = open_cache(ResultCache, job['cache_dir'])
+    if not job.get('events'):
+        world.sink = None
+    return world
+
+
+class ChunkWriter(object):
+    """
+    File of the output of a job which puts it into a queue in chunks, the
+    end of the output is marked by None.
+        chunks - the queue, a full queue blocks the job
+        buffered - strings written since the last chunk
+        size - total length of the buffered strings
+        chunk_size - length of a chunk
+    """
+
+    def __init__(self, chunks, chunk_size=65536):
+        self.chunks = chunks
+        self.buffered = []
+        self.size = 0
+        self.chunk_size = chunk_size
+
+    def write(self, data):
+        self.buffered.append(data)
+        self.size += len(data)
+        if self.size >= self.chunk_size:
+            self.flush()
+
+    def flush(self):
+        if self.buffered:
+            self.chunks.put(''.join(self.buffered))
+            self.buffered = []
+            self.size = 0
+
+    def close(self):
+        self.flush()
+        self.chunks.put(None)
+
+
+def write_job(job, output):
+    """Run a job in a worker with its output written to the file."""
+    stdout = sys.stdout
+    sys.stdout = output
+    try:
+        job_world(job).start()
+    except IOError:
+        print(NO_INPUT)
+    except SimulationException:
+        print(INVALID_INPUT)
+    except Exception:
+        print(FAILED)
+    finally:
+        sys.stdout = stdout
+
+
+def stream_job(job, chunks):
+    """Run a job in a worker with its output put into the queue (see
+    ChunkWriter)."""
+    output = ChunkWriter(chunks)
+    try:
+        write_job(job, output)
+    finally:
+        output.close()
+
+
+def check_job(job):
+    """Raises ValueError if the job is not valid."""
+    if not isinstance(job, dict) or not isinstance(job.get('input'), basestring):
+        raise ValueError('the input is missing')
+    if job.get('engine', 'exact') not in ENGINES:
+        raise ValueError('unknown engine {}'.format(job['engine']))
+
+
+class JobHandler(StreamRequestHandler):
+    """Reads a job from the connection and writes back its output as it
+    comes from the worker."""
+
+    def handle(self):
+        try:
+            job = json.loads(self.rfile.readline())
+            check_job(job)
+        except ValueError as e:
+            self.wfile.write('Invalid job: {}\n'.format(e))
+            return
+        job['cache_dir'] = self.server.cache_dir
+        chunks = self.server.manager.Queue(8)
+        result = self.server.pool.apply_async(stream_job, (job, chunks))
+        connected = True
+        for chunk in iter(chunks.get, None):
+            if not connected:
+                continue  # the worker is still drained, or it blocks
+            try:
+                self.wfile.write(chunk)
+                self.wfile.flush()
+            except socket.error:
+                connected = False
+        result.get()
+
+    def finish(self):
+        try:
+            StreamRequestHandler.finish(self)
+        except socket.error:
+            pass  # the client has gone, the rest of its output is dropped
+
+
+class UnixJobServer(ThreadingMixIn, UnixStreamServer):
+    daemon_threads = True
+
+
+class TCPJobServer(ThreadingMixIn, TCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+def parse_address(address):
+    """Returns the (host, port) of a port number or the path of a Unix
+    domain socket."""
+    if str(address).isdigit():
+        return 'localhost', int(address)
+    return address
+
+
+def make_server(address, workers=None, cache_dir=None):
+    """Returns a server of the address (see parse_address) with a pool of
+    workers (one per CPU by default). The results of the experiments of
+    seeded jobs are cached in cache_dir (if given)."""
+    address = parse_address(address)
+    # The workers and the manager of the output queues are forked before
+    # the server has any threads
+    pool = Pool(workers or cpu_count())
+    manager = Manager()
+    try:
+        if isinstance(address, tuple):
+            server = TCPJobServer(address, JobHandler)
+        else:
+            if os.path.exists(address):
+                os.remove(address)  # left over by a server which was killed
+            server = UnixJobServer(address, JobHandler)
+    except Exception:
+        pool.terminate()
+        manager.shutdown()
+        raise
+    server.pool = pool
+    server.manager = manager
+    server.cache_dir = cache_dir
+    return server
+
+
+def close_server(server):
+    """Stop the workers and remove the Unix domain socket."""
+    server.server_close()
+    server.pool.terminate()
+    server.pool.join()
+    server.manager.shutdown()
+    if not isinstance(server.server_address, tuple):
+        try:
+            os.remove(server.server_address)
+        except OSError:
+            pass
+
+
+def serve(address, workers=None, cache_dir=None):
+    """Run jobs until interrupted or terminated."""
+    server = make_server(address, workers, cache_dir)
+    # Only here, the workers are stopped by the default SIGTERM
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit())
+    print('Serving on {}'.format(address))
+    sys.stdout.flush()
+    try:
+        server.serve_forever()
+    except (KeyboardInterrupt, SystemExit):
+        pass
+    finally:
+        close_server(server)
+
+
+def request(address, job):
+    """Send a job to the server and return its output."""
+    address = parse_address(address)
+    family = socket.AF_INET if isinstance(address, tuple) else socket.AF_UNIX
+    sock = socket.socket(family, socket.SOCK_STREAM)
+    try:
+        sock.connect(address)
+        sock.sendall(json.dumps(job) + '\n')
+        chunks = []
+        while True:
+            chunk = sock.recv(65536)
+            if not chunk:
+                break
+            chunks.append(chunk)
+    finally:
+        sock.close()
+    return ''.join(chunks)
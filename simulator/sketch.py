@@ -0,0 +1,95 @@
+"""
+Streaming quantiles. A sketch counts positive values in buckets whose bounds
+grow geometrically, so any quantile is known within a relative error while
+the memory only depends on the range of the values. Sketches of the same
+accuracy are merged by adding up their buckets.
+"""
+from math import ceil, log
+
+
+class QuantileSketch(object):
+    """
+    Mergeable sketch of the quantiles of positive values (like DDSketch).
+        accuracy - relative error of the quantiles
+        gamma - ratio of the upper and lower bound of every bucket
+        buckets - counts of the values by the index of their bucket, the
+                  bucket i holds the values in (gamma ** (i - 1), gamma ** i]
+        zeros - count of the values below min_value
+        count - number of values added
+        max_buckets - the lowest buckets are collapsed beyond this many
+    """
+
+    min_value = 1e-9
+
+    def __init__(self, accuracy=0.01, max_buckets=2048):
+        self.accuracy = accuracy
+        self.gamma = (1 + accuracy) / (1 - accuracy)
+        self.log_gamma = log(self.gamma)
+        self.buckets = {}
+        self.zeros = 0
+        self.count = 0
+        self.max_buckets = max_buckets
+
+    def add(self, value, count=1):
+        """Add the value count times."""
+        self.count += count
+        if value < self.min_value:
+            self.zeros += count
+            return
+        index = int(ceil(log(value) / self.log_gamma))
+        buckets = self.buckets
+        buckets[index] = buckets.get(index, 0) + count
+        if len(buckets) > self.max_buckets:
+            self.collapse()
+
+    def collapse(self):
+        """Merge the lowest buckets into the lowest one kept, so only the
+        small quantiles lose accuracy."""
+        indices = sorted(self.buckets)
+        excess = indices[:len(indices) - self.max_buckets + 1]
+        lowest = indices[len(excess)]
+        self.buckets[lowest] += sum(self.buckets.pop(index) for index in excess)
+
+    def merge(self, other):
+        """Add the values of another sketch of the same accuracy."""
+        if other.gamma != self.gamma:
+            raise ValueError('sketches of accuracy {} and {} can not be merged'.format(
+                self.accuracy, other.accuracy
+            ))
+        buckets = self.buckets
+        for index, count in other.buckets.iteritems():
+            buckets[index] = buckets.get(index, 0) + count
+        self.zeros += other.zeros
+        self.count += other.count
+        while len(buckets) > self.max_buckets:
+            self.collapse()
+
+    def quantile(self, q):
+        """Returns the q-quantile (0 <= q <= 1) of the values, 0 if there are
+        none."""
+        if self.count == 0:
+            return 0
+        rank = q * (self.count - 1)
+        total = self.zeros
+        if rank < total:
+            return 0
+        for index in sorted(self.buckets):
+            total += self.buckets[index]
+            if rank < total:
+                # the middle of the bucket in relative terms
+                return 2 * self.gamma ** index / (self.gamma + 1)
+        return 2 * self.gamma ** max(self.buckets) / (self.gamma + 1)
+
+    def dump(self):
+        """Returns the counts as a JSON serialisable list."""
+        return [self.zeros, sorted(self.buckets.iteritems())]
+
+    def load(self, dumped):
+        """Restore the counts returned by dump."""
+        zeros, buckets = dumped
+        self.zeros = zeros
+        self.buckets = dict((index, count) for index, count in buckets)
+        self.count = zeros + sum(self.buckets.itervalues())
+
+    def __len__(self):
+        return self.count
@@ -0,0 +1,104 @@
+"""
+Time series of the summary statistics. The simulated time is cut into
+intervals of a fixed length and everything the analysis records goes to the
+interval it happened in, so the series is kept up to date without ever
+scanning the network. The series is kept in columns (a list per statistic)
+and written to a CSV or a NumPy .npz file at the end of the run.
+"""
+import csv
+
+# Columns of the written series
+COLUMNS = ('time', 'missed', 'departures', 'avg_pax', 'queueing', 'waiting')
+
+
+class Snapshots(object):
+    """
+    Statistics of the intervals of a run, every list has a value per
+    interval (the last may only be partly simulated).
+        interval - length of the intervals in simulated time
+        missed - passengers missed by full buses
+        departures - number of departures
+        pax_sum - sum of the passengers on the buses at their departures
+        qtime - time integral of the number of queueing buses at all stops
+        wtime - time integral of the number of waiting passengers at all stops
+    """
+
+    FIELDS = ('missed', 'departures', 'pax_sum', 'qtime', 'wtime')
+
+    def __init__(self, interval):
+        if interval <= 0:
+            raise ValueError('the interval has to be positive, not {}'.format(interval))
+        self.interval = float(interval)
+        self.reset()
+
+    def reset(self):
+        for field in self.FIELDS:
+            setattr(self, field, [])
+
+    def row(self, time):
+        """Returns the index of the interval of the time, the intervals up
+        to it are added if they are not there yet."""
+        index = int(time / self.interval)
+        if index >= len(self.missed):
+            added = index + 1 - len(self.missed)
+            for field in self.FIELDS:
+                getattr(self, field).extend([0] * added)
+        return index
+
+    def record_missed(self, time, count):
+        self.missed[self.row(time)] += count
+
+    def record_departure(self, time, pax_count):
+        index = self.row(time)
+        self.departures[index] += 1
+        self.pax_sum[index] += pax_count
+
+    def charge(self, values, start, end, count):
+        """Add count times the part of the time from start to end in every
+        interval to the values of the intervals (an integral like qtime)."""
+        if not count or end <= start:
+            return
+        interval = self.interval
+        first = int(start / interval)
+        last = self.row(end)
+        if first == last:
+            values[last] += count * (end - start)
+            return
+        values[first] += count * ((first + 1) * interval - start)
+        for index in xrange(first + 1, last):
+            values[index] += count * interval
+        values[last] += count * (end - last * interval)
+
+    def series(self, stop_time):
+        """Returns the columns (see COLUMNS) of the intervals up to the stop
+        time. The integrals are turned into averages over the intervals."""
+        self.row(stop_time)
+        count = len(self.missed)
+        if count > 1 and (count - 1) * self.interval >= stop_time:
+            count -= 1  # the stop time is the end of the last interval
+        times = [min((index + 1) * self.interval, stop_time) for index in xrange(count)]
+        lengths = [end - index * self.interval for index, end in enumerate(times)]
+        return {
+            'time': times,
+            'missed': self.missed[:count],
+            'departures': self.departures[:count],
+            'avg_pax': [
+                0 if summa == 0 else summa / float(departures)
+                for departures, summa in zip(self.departures, self.pax_sum[:count])
+            ],
+            'queueing': [0 if not length else qtime / length for qtime, length in zip(self.qtime, lengths)],
+            'waiting': [0 if not length else wtime / length for wtime, length in zip(self.wtime, lengths)],
+        }
+
+    def write(self, filename, stop_time):
+        """Write the series to a NumPy .npz file if the filename ends with
+        .npz, otherwise to a CSV file with a header."""
+        series = self.series(stop_time)
+        if filename.endswith('.npz'):
+            import numpy as np  # only imported when needed, it is slow to import
+            np.savez(filename, **dict((column, np.array(series[column])) for column in COLUMNS))
+            return
+        with open(filename, 'wb') as f:
+            writer = csv.writer(f)
+            writer.writerow(COLUMNS)
+            writer.writerows(zip(*[series[column] for column in COLUMNS]))
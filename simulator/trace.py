@@ -0,0 +1,150 @@
+"""
+Binary traces of the events of a run. Every event is a fixed-width record of
+its time, bus, stop, destination and code, so a trace is written without
+formatting any text and read back by memory-mapping the file.
+"""
+import mmap
+from struct import Struct
+
+from simulator.events import BOARD, DEPARTS, NEW_PASSENGERS
+
+
+MAGIC = 'CSLPTRC\0'
+TRACE_VERSION = 1
+
+# magic, version, record size
+HEADER = Struct('<8sII')
+# time, bus index, stop id, destination id, event code (padded to 24 bytes)
+RECORD = Struct('<diiiB3x')
+FIELDS = ('time', 'bus', 'stop', 'dest', 'code')
+
+# Fields of an event missing from its record (e.g. the bus of a new
+# passenger or the destination of a departure)
+NONE = -1
+
+
+def event_record(event_type, time, args):
+    """Returns the (time, bus, stop, dest, code) record of an event. The bus
+    is its index in the network (see Network.assign_indices), the stop and
+    destination are ids."""
+    if event_type == NEW_PASSENGERS:
+        orig, dest = args
+        return time, NONE, orig.stop_id, dest.stop_id, event_type
+    bus = args[0]
+    if event_type == BOARD:
+        return time, bus.index, bus.stop.stop_id, args[1], event_type
+    if event_type == DEPARTS:
+        return time, bus.index, args[1].stop_id, NONE, event_type
+    return time, bus.index, bus.stop.stop_id, NONE, event_type
+
+
+class TraceWriter(object):
+    """
+    Sink which writes the events of a run to a binary trace.
+        f - the trace file
+        buffer - packed records not written yet
+        buffer_size - number of records written at once
+        count - number of records given to the writer
+    """
+
+    def __init__(self, filename, buffer_size=4096):
+        self.f = open(filename, 'wb')
+        self.f.write(HEADER.pack(MAGIC, TRACE_VERSION, RECORD.size))
+        self.buffer = []
+        self.buffer_size = buffer_size
+        self.count = 0
+
+    def __call__(self, event_type, time, args):
+        self.buffer.append(RECORD.pack(*event_record(event_type, time, args)))
+        self.count += 1
+        if len(self.buffer) >= self.buffer_size:
+            self.flush()
+
+    def flush(self):
+        self.f.write(''.join(self.buffer))
+        self.buffer = []
+
+    def close(self):
+        self.flush()
+        self.f.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class TraceReader(object):
+    """
+    Memory-mapped binary trace.
+        f - the trace file
+        map - the memory map of the file
+    """
+
+    def __init__(self, filename):
+        self.f = open(filename, 'rb')
+        self.map = mmap.mmap(self.f.fileno(), 0, access=mmap.ACCESS_READ)
+        if len(self.map) < HEADER.size:
+            self.close()
+            raise ValueError('{} is not an event trace'.format(filename))
+        magic, version, size = HEADER.unpack_from(self.map)
+        if magic != MAGIC or version != TRACE_VERSION or size != RECORD.size:
+            self.close()
+            raise ValueError('{} is not an event trace of version {}'.format(filename, TRACE_VERSION))
+
+    def __len__(self):
+        return (len(self.map) - HEADER.size) // RECORD.size
+
+    def __getitem__(self, i):
+        """Returns the (time, bus, stop, dest, code) record of the i-th event."""
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError('trace record out of range')
+        return RECORD.unpack_from(self.map, HEADER.size + i * RECORD.size)
+
+    def __iter__(self):
+        unpack_from = RECORD.unpack_from
+        for offset in xrange(HEADER.size, HEADER.size + len(self) * RECORD.size, RECORD.size):
+            yield unpack_from(self.map, offset)
+
+    def records(self):
+        """Returns the records as a NumPy structured array backed by the
+        memory map (nothing is copied, so it is valid until close)."""
+        import numpy as np  # only imported when needed, it is slow to import
+        dtype = np.dtype({
+            'names': FIELDS,
+            'formats': ['<f8', '<i4', '<i4', '<i4', 'u1'],
+            'offsets': [0, 8, 12, 16, 20],
+            'itemsize': RECORD.size,
+        })
+        return np.frombuffer(self.map, dtype=dtype, count=len(self), offset=HEADER.size)
+
+    def columns(self):
+        """Returns a dictionary of the columns (see FIELDS) as arrays. With
+        NumPy they are views of the memory map, otherwise they are read
+        into the arrays of the array module."""
+        try:
+            records = self.records()
+        except ImportError:
+            pass
+        else:
+            return dict((field, records[field]) for field in FIELDS)
+        from array import array
+        columns = dict(zip(FIELDS, (array('d'), array('i'), array('i'), array('i'), array('B'))))
+        appends = [columns[field].append for field in FIELDS]
+        for record in self:
+            for append, value in zip(appends, record):
+                append(value)
+        return columns
+
+    def close(self):
+        self.map.close()
+        self.f.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
@@ -0,0 +1,283 @@
+"""
+Lock-step simulation of many replicas of the same network. The state of
+every replica is held in stacked NumPy arrays (one row per replica) so the
+interpreter overhead of a simulation step is shared by all the replicas.
+"""
+import numpy as np
+
+from simulator.analysis import Analysis
+
+
+class ReplicaWorld(object):
+    """
+    Runs replicas of a world in lock-step. Every step chooses and applies one
+    event per replica using array operations.
+        world - the world whose network, rates and stop time are replicated
+        replicas - number of replicas
+        random - random number generator (seeded by the seed argument)
+
+    Per-replica state (R replicas, B buses, S stops, T routes):
+        stop_pax - R x S x S waiting passengers by origin and destination
+        bus_pax - R x B x S passengers on the buses by destination
+        pos - R x B index of the bus's current stop on its route
+        moving - R x B whether the bus is on the road
+        seq - R x B order in which the buses joined their stop's queue
+        time - R current time of every replica
+    """
+
+    def __init__(self, world, replicas, seed=None):
+        self.world = world
+        self.replicas = replicas
+        self.random = np.random.RandomState(seed)
+
+    def initialise(self, rates=None, routes=None):
+        """Initialise the replicas. Experimental rates and routes are applied
+        to the world the same way as World.initialise does."""
+        world = self.world
+        world.initialise(rates=rates, routes=routes)
+        network = world.network
+
+        self.stop_ids = sorted(network.stops)
+        stop_idx = dict((stop_id, i) for i, stop_id in enumerate(self.stop_ids))
+        # keep the order of Network.initialise so the initial queues match
+        self.routes = list(network.routes.itervalues())
+        stop_count = len(self.stop_ids)
+        route_count = len(self.routes)
+        max_len = max(len(route.stops) for route in self.routes)
+
+        self.route_stops = np.zeros((route_count, max_len), dtype=np.int64)
+        self.route_len = np.zeros(route_count, dtype=np.int64)
+        self.road_into = np.zeros((route_count, max_len))
+        self.serves = np.zeros((route_count, stop_count), dtype=np.int64)
+        for r, route in enumerate(self.routes):
+            ids = [stop.stop_id for stop in route.stops]
+            self.route_len[r] = len(ids)
+            for i, stop_id in enumerate(ids):
+                self.route_stops[r, i] = stop_idx[stop_id]
+                # road leading into the i-th stop (from the previous one)
+                self.road_into[r, i] = world.rates[ids[i - 1], stop_id]
+                self.serves[r, stop_idx[stop_id]] = 1
+
+        self.bus_ids = []
+        bus_route = []
+        bus_pos = []
+        for r, route in enumerate(self.routes):
+            for bus_no in xrange(route.bus_count):
+                self.bus_ids.append('{}.{}'.format(route.route_id, bus_no))
+                bus_route.append(r)
+                bus_pos.append(bus_no % len(route.stops))
+        self.bus_route = np.array(bus_route, dtype=np.int64)
+        self.capacity = np.array([self.routes[r].capacity for r in bus_route], dtype=np.int64)
+        bus_count = len(bus_route)
+
+        # Destination distribution of new passengers
+        dest_weights = np.zeros((stop_count, stop_count))
+        for orig, dest, prob in network.passenger_pairs():
+            dest_weights[stop_idx[orig.stop_id], stop_idx[dest.stop_id]] = prob
+        self.dest_cum = np.cumsum(dest_weights, axis=1)
+        self.dest_cum /= self.dest_cum[:, -1:]
+
+        shape = (self.replicas,)
+        self.stop_pax = np.zeros(shape + (stop_count, stop_count), dtype=np.int64)
+        self.bus_pax = np.zeros(shape + (bus_count, stop_count), dtype=np.int64)
+        self.pos = np.tile(np.array(bus_pos, dtype=np.int64), shape + (1,))
+        self.moving = np.zeros(shape + (bus_count,), dtype=bool)
+        self.seq = np.tile(np.arange(bus_count, dtype=np.int64), shape + (1,))
+        self.next_seq = np.full(shape, bus_count, dtype=np.int64)
+        self.time = np.zeros(shape)
+
+        # Analysis
+        self.missed_route = np.zeros(shape + (route_count,), dtype=np.int64)
+        self.missed_stop = np.zeros(shape + (stop_count,), dtype=np.int64)
+        self.pax_count = np.zeros(shape + (bus_count,), dtype=np.int64)
+        self.pax_sum = np.zeros(shape + (bus_count,))
+        self.qtime = np.zeros(shape + (stop_count,))
+        self.qstamp = np.zeros(shape + (stop_count,))
+        self.wtime_stop = np.zeros(shape + (stop_count,))
+        self.wstamp = np.zeros(shape + (stop_count,))
+        self.visits = np.tile(
+            np.bincount(self.route_stops[self.bus_route, bus_pos], minlength=stop_count),
+            shape + (1,)
+        )
+
+    def current_stops(self):
+        """Returns the R x B stop indices of the buses. Buses on the road
+        already point to the stop they are driving to."""
+        return self.route_stops[self.bus_route, self.pos]
+
+    def queue_lengths(self, rows, stops):
+        """Returns the number of queueing (not head) buses at the given stop
+        of every given replica."""
+        at_stop = (self.current_stops()[rows] == stops[:, None]) & ~self.moving[rows]
+        return np.maximum(at_stop.sum(axis=1) - 1, 0)
+
+    def record_bus_wait(self, rows, stops):
+        """Update 'Average Bus Queuing Time' of a stop in every given replica."""
+        time = self.time[rows]
+        qlength = self.queue_lengths(rows, stops)
+        self.qtime[rows, stops] += (time - self.qstamp[rows, stops]) * qlength
+        self.qstamp[rows, stops] = time
+
+    def record_pax_wait(self, rows, stops):
+        """Update 'Average Waiting Passengers' of a stop in every given
+        replica."""
+        time = self.time[rows]
+        pax_count = self.stop_pax[rows, stops].sum(axis=1)
+        self.wtime_stop[rows, stops] += pax_count * (time - self.wstamp[rows, stops])
+        self.wstamp[rows, stops] = time
+
+    def rates(self):
+        """Returns the R x K matrix of the rates of all possible events and
+        the stops of the buses. The K columns are board events (bus, dest),
+        then disembarks, departs and arrivals of every bus and lastly new
+        passengers."""
+        rates = self.world.rates
+        replicas = self.replicas
+        rows = np.arange(replicas)[:, None]
+        stops = self.current_stops()
+        at_stop = ~self.moving
+
+        load = self.bus_pax.sum(axis=2)
+        full = load >= self.capacity
+        disembarks = self.bus_pax[rows, np.arange(len(self.bus_ids)), stops] * at_stop
+        boards = self.stop_pax[rows, stops] * self.serves[self.bus_route] * at_stop[:, :, None]
+
+        # Only the bus at the front of the queue can be boarded
+        seq = np.where(at_stop, self.seq, np.iinfo(np.int64).max)
+        first = np.full((replicas, len(self.stop_ids)), np.iinfo(np.int64).max, dtype=np.int64)
+        np.minimum.at(first, (np.broadcast_to(rows, stops.shape), stops), seq)
+        head = at_stop & (self.seq == first[rows, stops])
+
+        ready = at_stop & (disembarks == 0) & (full | ~boards.any(axis=2))
+
+        return np.concatenate([
+            (boards * (head & ~full)[:, :, None]).reshape(replicas, -1) * rates['board'],
+            disembarks * rates['disembarks'],
+            ready * rates['departs'],
+            self.moving * self.road_into[self.bus_route, self.pos],
+            np.full((replicas, 1), rates['new_passengers']),
+        ], axis=1), stops, load, full
+
+    def step(self, live):
+        """Chooses and applies one event in every live replica."""
+        rates, stops, load, full = self.rates()
+        cum_rates = np.cumsum(rates, axis=1)
+        total_rate = cum_rates[:, -1]
+
+        # Same distribution as World.sample_delay
+        delay = -np.log10(self.random.random_sample(self.replicas)) / total_rate
+        rand = self.random.random_sample(self.replicas) * total_rate
+        chosen = np.minimum((cum_rates <= rand[:, None]).sum(axis=1), rates.shape[1] - 1)
+
+        bus_count = len(self.bus_ids)
+        stop_count = len(self.stop_ids)
+        board_end = bus_count * stop_count
+        disembarks_end = board_end + bus_count
+        departs_end = disembarks_end + bus_count
+        arrivals_end = departs_end + bus_count
+
+        rows = np.flatnonzero(live & (chosen < board_end))
+        if rows.size:
+            bus, dest = np.divmod(chosen[rows], stop_count)
+            stop = stops[rows, bus]
+            self.record_pax_wait(rows, stop)
+            self.bus_pax[rows, bus, dest] += 1
+            self.stop_pax[rows, stop, dest] -= 1
+
+        rows = np.flatnonzero(live & (chosen >= board_end) & (chosen < disembarks_end))
+        if rows.size:
+            bus = chosen[rows] - board_end
+            self.bus_pax[rows, bus, stops[rows, bus]] -= 1
+
+        rows = np.flatnonzero(live & (chosen >= disembarks_end) & (chosen < departs_end))
+        if rows.size:
+            bus = chosen[rows] - disembarks_end
+            stop = stops[rows, bus]
+            route = self.bus_route[bus]
+            # Record passengers who couldn't get on
+            missed = (self.stop_pax[rows, stop] * self.serves[route]).sum(axis=1) * full[rows, bus]
+            self.missed_route[rows, route] += missed
+            self.missed_stop[rows, stop] += missed
+            self.pax_count[rows, bus] += 1
+            self.pax_sum[rows, bus] += load[rows, bus]
+            self.record_bus_wait(rows, stop)
+            self.moving[rows, bus] = True
+            self.pos[rows, bus] = (self.pos[rows, bus] + 1) % self.route_len[route]
+
+        rows = np.flatnonzero(live & (chosen >= departs_end) & (chosen < arrivals_end))
+        if rows.size:
+            bus = chosen[rows] - departs_end
+            stop = stops[rows, bus]
+            self.record_bus_wait(rows, stop)
+            self.visits[rows, stop] += 1
+            self.moving[rows, bus] = False
+            self.seq[rows, bus] = self.next_seq[rows]
+            self.next_seq[rows] += 1
+
+        rows = np.flatnonzero(live & (chosen == arrivals_end))
+        if rows.size:
+            orig = self.random.randint(stop_count, size=rows.size)
+            rand = self.random.random_sample(rows.size)
+            dest = np.minimum((self.dest_cum[orig] <= rand[:, None]).sum(axis=1), stop_count - 1)
+            self.record_pax_wait(rows, orig)
+            self.stop_pax[rows, orig, dest] += 1
+
+        self.time[live] += delay[live]
+
+    def run(self):
+        """Run all the replicas until their time is over the stop time and
+        return their analysis."""
+        stop_time = self.world.stop_time
+        live = self.time <= stop_time
+        while live.any():
+            self.step(live)
+            live = self.time <= stop_time
+        self.cleanup()
+        return self.analyses()
+
+    def cleanup(self):
+        """Add whatever happened between the last relevant event and the stop
+        time to the analysis of every replica."""
+        stop_time = self.world.stop_time
+        rows = np.arange(self.replicas)
+        stops = self.current_stops()
+        queued = np.zeros((self.replicas, len(self.stop_ids)), dtype=np.int64)
+        np.add.at(queued, (np.broadcast_to(rows[:, None], stops.shape), stops), ~self.moving)
+        self.qtime += (stop_time - self.qstamp) * np.maximum(queued - 1, 0)
+
+        stop_counts = self.stop_pax.sum(axis=2)
+        self.wtime_stop += (stop_time - self.wstamp) * stop_counts
+
+    def analyses(self):
+        """Returns the analysis of every replica as an Analysis of the
+        world's network together with the number of bus visits of the stops.
+        The stops are indexed the same way, the routes and buses are not."""
+        network = self.world.network
+        routes = [route.index for route in self.routes]
+        buses = [
+            route.bus_offset + bus_no
+            for route in self.routes for bus_no in xrange(route.bus_count)
+        ]
+        results = []
+        for r in xrange(self.replicas):
+            analysis = Analysis(network)
+            analysis.missed_stop = self.missed_stop[r].tolist()
+            analysis.qtime = self.qtime[r].tolist()
+            analysis.wtime = self.wtime_stop[r].tolist()
+            for i, index in enumerate(routes):
+                analysis.missed_route[index] = int(self.missed_route[r, i])
+            for i, index in enumerate(buses):
+                analysis.pax_count[index] = int(self.pax_count[r, i])
+                analysis.pax_sum[index] = float(self.pax_sum[r, i])
+            visits = dict((stop_id, int(self.visits[r, i])) for i, stop_id in enumerate(self.stop_ids))
+            results.append((analysis, visits))
+        return results
+
+    def log_stats(self):
+        """Log the summary statistics of every replica."""
+        world = self.world
+        for analysis, visits in self.analyses():
+            world.analysis = analysis
+            for stop_id, stop in world.network.stops.iteritems():
+                stop.bus_count = visits[stop_id]
+            world.log_stats()
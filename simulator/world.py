@@ -1,13 +1,16 @@
-from random import random
-from collections import defaultdict, Counter
+from random import random, seed
 from itertools import product, izip
 from math import log10
 from sys import maxint
 
+from simulator.analysis import Analysis, Histograms, PassengerWaits
+from simulator.cache import result_key
 from simulator.errors import InputError
-from simulator.events import log_event as log, EventMap, PosCounter
+from simulator.events import log_event as log, EventMap, PosCounter, \
+    BOARD, DISEMBARKS, DEPARTS, ARRIVALS, NEW_PASSENGERS
 from simulator.formats import ANALYSIS, EXPERIMENTS_PARAMS, RATES_RX
 from simulator.parser import parse_file
+from simulator.snapshots import Snapshots
 
 
 class World(object):
@@ -19,21 +22,80 @@ class World(object):
         experiments - dictionary of experiment values
                 routes: <route_id>: {bus_count: <bus_count>, cap: <capacity>}
                 rates: <rate_name or dest,orig>: <rate>
-        wtime - time since the last avg waiting passenger update for all routes
+        handlers - update functions of the events indexed by the event codes
         stop_time - Time for which to run the simulation
         ignore_warn - Whether to ignore warnings
         optimise - Whether to choose optimal combination of experimental
                 parameters
+        seed - seed of the random numbers, every experiment is seeded with
+               a hash of the seed and its parameters
+        cache - ResultCache of the experiments of seeded worlds (or None)
+        sink - function called with the code, time and args of every event
+               of a run which is not silent (log_event by default, None
+               logs nothing)
+        scenarios - ScenarioCache of the parsed and validated inputs (or None)
+        validated - whether the input is known to be valid
+        compiled - key and parsed input to store in scenarios once validated
+        percentiles - whether to keep the histograms of the queues and
+                      waiting passengers and log their percentiles (the
+                      exact and leap engines only)
+        histograms - the Histograms of the run (None unless percentiles)
+        wait_times - whether to track the waits of the individual passengers
+                     and log their percentiles (not in the parallel engine)
+        waits - the PassengerWaits of the run (None unless wait_times)
+        snapshot_interval - length of the intervals of the time series of
+                            the statistics (None keeps no series)
+        snapshots - the Snapshots of the run (None unless snapshot_interval)
     """
 
-    def __init__(self, filename=None):
+    def __init__(self, filename=None, scenarios=None):
+        # Handlers of the events indexed by the event codes
+        self.handlers = [
+            self.update_board,
+            self.update_disembarks,
+            self.update_departs,
+            self.update_arrivals,
+            self.update_new_passengers,
+        ]
+        self.seed = None
+        self.cache = None
+        self.sink = log
+        self.scenarios = scenarios
+        self.validated = False
+        self.compiled = None
+        self.percentiles = False
+        self.histograms = None
+        self.wait_times = False
+        self.waits = None
+        self.snapshot_interval = None
+        self.snapshots = None
         if not filename:
             return  # mainly for testing - init the world add params later
-        network, rates, params, exps = parse_file(filename)
+        key = scenarios.file_key(filename) if scenarios else None
+        scenario = scenarios.get(key) if key else None
+        if scenario:
+            self.load(*scenario)
+            self.validated = True
+            return
+        scenario = parse_file(filename)
+        self.load(*scenario)
+        if key:
+            self.compiled = key, scenario
+
+    @classmethod
+    def from_scenario(cls, scenario, **kwargs):
+        """Returns a world of a Scenario built in memory. The keyword
+        arguments are passed to the constructor."""
+        world = cls(**kwargs)
+        world.load(*scenario.build())
+        return world
+
+    def load(self, network, rates, params, exps):
+        """Set the network, rates, params and experiments of the input."""
         self.network = network
         self.rates = rates
         self.experiments = exps
-        self.wtime = 0.0
+        self.analysis = None
         self.stop_time = None
         self.ignore_warn = None
         self.optimise = None
@@ -44,236 +106,305 @@ class World(object):
 
     def initialise(self, rates=None, routes=None):
         """Initialise the world. Run before every experiment."""
-        self.network.initialise()
-
-        # Clear out the analysis dicts
-        tuple_counter = lambda: defaultdict(lambda: (0, 0.0))
-        self.analysis = {
-            'missed_pax': {'stop': Counter(), 'route': Counter()},
-            'avg_pax': tuple_counter(),
-            'avg_qtime': Counter(),
-            'avg_wtime': {'stop': Counter(), 'route': Counter()}
-        }
-
         if rates:
             self.rates.update(rates)  # Update experimental rates
 
         if routes:
-            # Update experimental bus counts and capacities
+            # Update experimental bus counts and capacities before the
+            # buses are created
             for route_id, params in routes.iteritems():
                 route = self.network.routes[route_id]
                 route.bus_count = params.get('bus_count', route.bus_count)
                 route.capacity = params.get('cap', route.capacity)
 
+        self.network.initialise()
+
+        # Clear out the analysis
+        if getattr(self, 'analysis', None) is None:
+            self.analysis = Analysis(self.network)
+        else:
+            self.analysis.reset(self.network)
+        if not self.percentiles:
+            self.histograms = None
+        elif self.histograms is None:
+            self.histograms = Histograms(self.network)
+        else:
+            self.histograms.reset(self.network)
+        if not self.wait_times:
+            self.waits = None
+        elif self.waits is None:
+            self.waits = PassengerWaits(self.network)
+        else:
+            self.waits.reset(self.network)
+        if not self.snapshot_interval:
+            self.snapshots = None
+        elif self.snapshots is None or self.snapshots.interval != self.snapshot_interval:
+            self.snapshots = Snapshots(self.snapshot_interval)
+        else:
+            self.snapshots.reset()
+
         # new passengers is always possible
         self.total_rate = self.rates['new_passengers']
 
         # Buses departing from stops are the only possible events at the start
         self.event_map = EventMap()
         for stop in self.network.stops.itervalues():
-            self.event_map.departs.extend(stop.bus_queue)
-            self.total_rate += len(stop.bus_queue) * self.rates['departs']
+            for bus in stop.bus_queue:
+                self.push_departs(bus)
 
     def record_missed_pax(self, bus):
         """Update 'Number of Missed Passengers'. Done on per route and
         per stop basis. Only update the counts for passengers which the bus
-        can satisfy."""
-        for dest_id, count in bus.stop.pax_dests.iteritems():
-            if bus.satisfies(dest_id):
-                route_id = bus.route.route_id
-                stop_id = bus.stop.stop_id
-                self.analysis['missed_pax']['route'][route_id] += count
-                self.analysis['missed_pax']['stop'][stop_id] += count
+        can satisfy (the waiting passengers of the bus's route)."""
+        count = bus.stop.route_pax[bus.route.route_id]
+        self.analysis.missed_route[bus.route.index] += count
+        self.analysis.missed_stop[bus.stop.index] += count
+        if self.snapshots:
+            self.snapshots.record_missed(self.time, count)
 
     def record_avg_pax(self, bus):
         """Update 'Average Passengers Per Bus Per Road'. Done on per bus basis
         only since we can reconstruct the route average from that."""
-        count, summa = self.analysis['avg_pax'][bus.bus_id]
-        self.analysis['avg_pax'][bus.bus_id] = count + 1, summa + bus.pax_count
+        self.analysis.pax_count[bus.index] += 1
+        self.analysis.pax_sum[bus.index] += bus.pax_count
+        if self.snapshots:
+            self.snapshots.record_departure(self.time, bus.pax_count)
 
     def record_bus_wait(self, stop):
         """Update 'Average Bus Queuing Time'. Done on per stop basis. Need to
         update the stop qtime at the end."""
         qlength = stop.queue_length
         time_diff = self.time - stop.qtime
-        self.analysis['avg_qtime'][stop.stop_id] += time_diff * qlength
+        self.analysis.qtime[stop.index] += time_diff * qlength
+        if self.histograms:
+            self.histograms.record_queue(stop, time_diff, qlength)
+        if self.snapshots:
+            self.snapshots.charge(self.snapshots.qtime, stop.qtime, self.time, qlength)
         stop.qtime = self.time
 
     def record_pax_wait(self, bus=None, stop=None):
-        """Update 'Average Waiting Passengers'. Done on per stop and
-        per route basis. We can either use the bus or stop kwarg to get
-        our stop of interest. We update all the routes. Need to update
-        wtime of routes and the stop."""
+        """Update 'Average Waiting Passengers'. Done on per stop basis, the
+        routes are summed up from their stops at the end. We can either use
+        the bus or stop kwarg to get our stop of interest. Need to update
+        wtime of the stop."""
         if bus:
             stop = bus.stop
-        pax_count = stop.pax_count
-        stop_id = stop.stop_id
         time_diff = self.time - stop.wtime
-        self.analysis['avg_wtime']['stop'][stop_id] += pax_count * time_diff
+        pax_count = stop.pax_count
+        self.analysis.wtime[stop.index] += pax_count * time_diff
+        if self.histograms:
+            self.histograms.record_wait(stop, self.time, time_diff, pax_count)
+        if self.snapshots:
+            self.snapshots.charge(self.snapshots.wtime, stop.wtime, self.time, pax_count)
         stop.wtime = self.time
 
-        time_diff = self.time - self.wtime
-        for route_id, route in self.network.routes.iteritems():
-            pax_count = sum(s.pax_count for s in route.stops)
-            self.analysis['avg_wtime']['route'][route_id] += pax_count * time_diff
-        self.wtime = self.time
-
-    def update(self, event_type, bus=None, orig=None, dest=None):
+    def update(self, event_type, *args, **kwargs):
         """Updates the world and the event map based on the last event
-        and its parameters."""
+        and its parameters. Dispatches to the handler of the event type."""
+        return self.handlers[event_type](*args, **kwargs)
+
+    def wrap_handler(self, event_type, wrapper):
+        """Replace the handler of the event type with wrapper(handler). Used
+        by engines and instrumentation to hook into the updates."""
+        self.handlers[event_type] = wrapper(self.handlers[event_type])
+
+    def push_departs(self, bus):
+        """The bus became ready for departure - its departs event is
+        possible now."""
+        bus.ready = True
+        self.total_rate += self.rates['departs']
+        self.event_map.departs.append(bus)
+
+    def pop_departs(self, bus):
+        """The bus is not ready for departure anymore."""
+        bus.ready = False
+        self.total_rate -= self.rates['departs']
+        self.event_map.departs.remove(bus)
+
+    def update_board(self, bus, dest):
+        """A passenger boards the bus."""
         rates = self.rates
         e_map = self.event_map
+        self.record_pax_wait(bus=bus)
+        if self.waits:
+            self.waits.board(bus, dest, self.time)
 
-        if event_type == 'board':
-            self.record_pax_wait(bus=bus)
+        bus.board(dest)  # Put the passenger on the bus
 
-            bus.board(dest)  # Put the passenger on the bus
+        # Other buses going to dest may be ready for departure now
+        for other_bus in bus.stop.dest_buses.get(dest, ()):
+            if other_bus != bus and other_bus.departure_ready:
+                self.push_departs(other_bus)
 
-            # Other buses may be ready for departure now
-            for other_bus in bus.stop.bus_queue[1:]:
-                if other_bus.satisfies(dest) and not other_bus.full():
-                    if other_bus.departure_ready:
-                        self.total_rate += rates['departs']
-                        e_map.departs.append(other_bus)
+        # The person can not board this bus
+        self.total_rate -= rates['board']
+        e_map.board[bus][dest] -= 1
 
-            # The person can not board this bus
-            self.total_rate -= rates['board']
-            e_map.board[bus][dest] -= 1
+        # This bus could be ready for departure
+        if bus.departure_ready:
+            self.push_departs(bus)
 
-            # This bus could be ready for departure
-            if bus.departure_ready:
-                self.total_rate += rates['departs']
-                e_map.departs.append(bus)
+        if bus.full():
+            # No one can board this bus anymore - it's full
+            bus_boards = sum(e_map.board[bus].itervalues())
+            self.total_rate -= bus_boards * rates['board']
+            del(e_map.board[bus])
 
-            if bus.full():
-                # No one can board this bus anymore - it's full
-                bus_boards = sum(e_map.board[bus].itervalues())
-                self.total_rate -= bus_boards * rates['board']
-                del(e_map.board[bus])
+    def update_disembarks(self, bus):
+        """A passenger gets off the bus."""
+        rates = self.rates
+        e_map = self.event_map
+        bus.disembark()  # Remove a passenger from the bus
+
+        # Event not available anymore
+        self.total_rate -= rates['disembarks']
+        if bus.disembarks == 0:
+            e_map.disembarks.remove(bus)
+
+        # If the bus was full and it's the head then people can board it
+        if bus.full(offset=1) and bus.is_head:
+            bus_boards = PosCounter(dict(bus.boards))
+            self.total_rate += sum(bus_boards.itervalues()) * rates['board']
+            e_map.board[bus] = bus_boards
+
+        # If no one wants to disembark or embark then it's departure ready
+        if bus.departure_ready:
+            self.push_departs(bus)
+
+    def update_departs(self, bus, dest=None):
+        """The bus leaves its stop. The dest is the stop it leaves, it is
+        only used by the log."""
+        rates = self.rates
+        e_map = self.event_map
+        # Record passengers who couldn't get on
+        if bus.full():
+            self.record_missed_pax(bus)
+        self.record_avg_pax(bus)
+        self.record_bus_wait(bus.stop)
+
+        # Event is not available anymore
+        self.pop_departs(bus)
+
+        # If this was the head bus then the next bus can be boarded now
+        if bus.is_head and len(bus.stop.bus_queue) >= 2:
+            new_head = bus.stop.bus_queue[1]
+            bus_boards = PosCounter(dict(new_head.boards))
+            if bus_boards and not new_head.full():
+                # Some people want to board the bus
+                self.total_rate += sum(bus_boards.itervalues()) * rates['board']
+                e_map.board[new_head] = bus_boards
+
+        # Update the world
+        bus.dequeue(self.rates)
+
+        # Bus is on the road now
+        self.total_rate += bus.road_rate
+        e_map.arrivals.append(bus)
+
+    def update_arrivals(self, bus):
+        """The bus arrives at the next stop of its route."""
+        rates = self.rates
+        e_map = self.event_map
+        # Record stop waiting time
+        self.record_bus_wait(bus.stop)
+        bus.stop.bus_count += 1
 
-        elif event_type == 'disembarks':
-            bus.disembark()  # Remove a passenger from the bus
+        # Event not available anymore
+        e_map.arrivals.remove(bus)
+        self.total_rate -= bus.road_rate
 
-            # Event not available anymore
-            self.total_rate -= rates['disembarks']
-            if bus.disembarks == 0:
-                e_map.disembarks.remove(bus)
+        bus.arrive()  # Bus arrives at the stop
 
-            # If the bus was full and it's the head then people can board it
-            if bus.full(offset=1) and bus.is_head:
-                bus_boards = PosCounter(dict(bus.boards))
+        # People on the stop can board the bus if it's not full and is head
+        if bus.is_head and not bus.full():
+            bus_boards = PosCounter(dict(bus.boards))
+            if bus_boards:
+                # Some people want to board the bus
                 self.total_rate += sum(bus_boards.itervalues()) * rates['board']
                 e_map.board[bus] = bus_boards
 
-            # If no one wants to disembark or embark then it's departure ready
-            if bus.departure_ready:
-                self.total_rate += rates['departs']
-                e_map.departs.append(bus)
-
-        elif event_type == 'departs':
-            # Record passengers who couldn't get on
-            if bus.full():
-                self.record_missed_pax(bus)
-            self.record_avg_pax(bus)
-            self.record_bus_wait(bus.stop)
-
-            # Event is not available anymore
-            self.total_rate -= rates['departs']
-            e_map.departs.remove(bus)
-
-            # If this was the head bus then the next bus can be boarded now
-            if bus.is_head and len(bus.stop.bus_queue) >= 2:
-                new_head = bus.stop.bus_queue[1]
-                bus_boards = PosCounter(dict(new_head.boards))
-                if bus_boards and not new_head.full():
-                    # Some people want to board the bus
-                    self.total_rate += sum(bus_boards.itervalues()) * rates['board']
-                    e_map.board[new_head] = bus_boards
-
-            # Update the world
-            bus.dequeue(self.rates)
-
-            # Bus is on the road now
-            self.total_rate += bus.road_rate
-            e_map.arrivals.append(bus)
-
-        elif event_type == 'arrivals':
-            # Record stop waiting time
-            self.record_bus_wait(bus.stop)
-            bus.stop.bus_count += 1
-
-            # Event not available anymore
-            e_map.arrivals.remove(bus)
-            self.total_rate -= bus.road_rate
-
-            bus.arrive()  # Bus arrives at the stop
-
-            # People on the stop can board the bus if it's not full and is head
-            if bus.is_head and not bus.full():
-                bus_boards = PosCounter(dict(bus.boards))
-                if bus_boards:
-                    # Some people want to board the bus
-                    self.total_rate += sum(bus_boards.itervalues()) * rates['board']
-                    e_map.board[bus] = bus_boards
-
-            if bus.departure_ready:
-                # No one wants to board the bus - it can depart
-                self.total_rate += rates['departs']
-                e_map.departs.append(bus)
-            else:
-                # People want to disembark the bus
-                bus_disembarks = bus.disembarks
-                self.total_rate += bus_disembarks * rates['disembarks']
-                if bus_disembarks and bus not in e_map.disembarks:
-                    e_map.disembarks.append(bus)
+        if bus.departure_ready:
+            # No one wants to board the bus - it can depart
+            self.push_departs(bus)
         else:
-            # We're dealing with a new passenger event here
-            self.record_pax_wait(stop=orig)
-
-            # Update the world
-            orig.pax_dests[dest.stop_id] += 1
-
-            if orig.bus_queue:
-                head = orig.bus_queue[0]
-                if head.satisfies(dest.stop_id) and not head.full():
-                    # The person can board the head of the origin stop
-                    self.total_rate += rates['board']
-                    e_map.board[head][dest.stop_id] += 1
-
-                # Buses cannot depart now if they satisfy the destination
-                for bus in orig.bus_queue:
-                    if bus.satisfies(dest.stop_id) and not bus.full():
-                        if bus in e_map.departs:
-                            self.total_rate -= rates['departs']
-                            e_map.departs.remove(bus)
+            # People want to disembark the bus
+            bus_disembarks = bus.disembarks
+            self.total_rate += bus_disembarks * rates['disembarks']
+            if bus_disembarks and bus not in e_map.disembarks:
+                e_map.disembarks.append(bus)
+
+    def update_new_passengers(self, orig, dest):
+        """A new passenger going to dest appears at the orig stop."""
+        rates = self.rates
+        e_map = self.event_map
+        self.record_pax_wait(stop=orig)
+        if self.waits:
+            self.waits.arrive(orig, dest.stop_id, self.time)
+
+        # Update the world
+        orig.add_passengers(dest.stop_id)
+
+        # Only the queued buses going to dest which are not full are affected
+        buses = orig.dest_buses.get(dest.stop_id)
+        if buses:
+            head = orig.bus_queue[0]
+            if head in buses:
+                # The person can board the head of the origin stop
+                self.total_rate += rates['board']
+                e_map.board[head][dest.stop_id] += 1
+
+            # Buses cannot depart now if they satisfy the destination
+            for bus in buses:
+                if bus.ready:
+                    self.pop_departs(bus)
+
+    def index_bus_events(self, bus):
+        """Add the board, disembarks and departs events of a bus at a stop
+        to the event map. The bus must not have any events yet."""
+        rates = self.rates
+        e_map = self.event_map
+        if bus.is_head and not bus.full():
+            bus_boards = PosCounter(dict(bus.boards))
+            if bus_boards:
+                self.total_rate += sum(bus_boards.itervalues()) * rates['board']
+                e_map.board[bus] = bus_boards
+
+        bus_disembarks = bus.disembarks
+        if bus_disembarks:
+            self.total_rate += bus_disembarks * rates['disembarks']
+            e_map.disembarks.append(bus)
+
+        if bus.departure_ready:
+            self.push_departs(bus)
 
     def choose_event(self):
         """Chooses an event based on the rates and all possible events.
         This is basically a weighted choice function that stops after
-        a random number between 0 and total rate is less than 0."""
+        a random number between 0 and total rate is less than 0. Returns the
+        event code and the args tuple of its handler."""
         rand = random() * self.total_rate
 
         for bus, dest, count in self.event_map.gen_board():
             rand -= count * self.rates['board']
             if rand < 0:
-                return 'board', dict(dest=dest, bus=bus)
+                return BOARD, (bus, dest)
 
         for bus in self.event_map.disembarks:
             rand -= bus.disembarks * self.rates['disembarks']
             if rand < 0:
-                return 'disembarks', dict(bus=bus)
+                return DISEMBARKS, bus.args
 
         for bus in self.event_map.departs:
             rand -= self.rates['departs']
             if rand < 0:
-                return 'departs', dict(dest=bus.stop, bus=bus)
+                return DEPARTS, (bus, bus.stop)
 
         for bus in self.event_map.arrivals:
             rand -= bus.road_rate
             if rand < 0:
-                return 'arrivals', dict(bus=bus)
+                return ARRIVALS, bus.args
 
-        return 'new_passengers', self.network.generate_passenger()
+        return NEW_PASSENGERS, self.network.generate_passenger()
 
     def sample_delay(self):
         """Return a delay sampled from an exponential distribution
@@ -283,81 +414,76 @@ class World(object):
 
     def validate(self):
         """If any of the needed rates was not set the simulation is not valid.
-        Validate the network."""
+        Validate the network. A valid input is stored in the scenario cache
+        so that it is neither parsed nor validated next time."""
+        if self.validated:
+            return
         for rate_name in RATES_RX:
             try:
                 self.rates[rate_name]
             except KeyError:
                 raise InputError('Rate {} is missing from the input.'.format(rate_name))
         self.network.validate(self.rates, self.ignore_warn)
+        self.validated = True
+        if self.compiled:
+            self.scenarios.put(*self.compiled)
+            self.compiled = None
 
     def log_stats(self):
         """Logging the summary statistics"""
-        # Number of Missed Passengers
-        total = 0
-        for route_id in self.network.routes.iterkeys():
-            count = self.analysis['missed_pax']['route'][route_id]
-            total += count  # Use sum of route missed_pax for total
-            log_ans('missed_pax', 'route', route_id, count)
-
-        for stop_id in self.network.stops.iterkeys():
-            count = self.analysis['missed_pax']['stop'][stop_id]
-            log_ans('missed_pax', 'stop', stop_id, count)
+        summary = self.analysis.summary(self.network, self.stop_time)
+        routes = self.network.routes
+        stops = self.network.stops
 
-        log_ans('missed_pax', 'total', total)
+        # Number of Missed Passengers
+        missed_pax = summary['missed_pax']
+        for route_id, route in routes.iteritems():
+            log_ans('missed_pax', 'route', route_id, missed_pax['route'][route.index])
+        for stop_id, stop in stops.iteritems():
+            log_ans('missed_pax', 'stop', stop_id, missed_pax['stop'][stop.index])
+        log_ans('missed_pax', 'total', missed_pax['total'])
 
         # Average Passengers Per Bus Per Road
-        total_count = total_sum = 0.0
-        for route_id, route in self.network.routes.iteritems():
-            route_count = route_sum = 0
-            for bus_no in xrange(route.bus_count):
-                # construct bus_id dynamically because we don't
-                # hold a reference to routes' buses
-                bus_id = '{}.{}'.format(route_id, bus_no)
-                count, summa = self.analysis['avg_pax'][bus_id]
-                # Use sum of bus avg_pax for the route
-                route_count += count
-                route_sum += summa
-                avg = 0 if summa == 0 else summa / count
-                log_ans('avg_pax', 'bus', bus_id, avg)
-
-            # Use sum of route avg_pax for the total
-            total_count += route_count
-            total_sum += route_sum
-            route_avg = 0 if route_sum == 0 else route_sum / route_count
-            log_ans('avg_pax', 'route', route_id, route_avg)
-
-        total_avg = 0 if total_sum == 0 else total_sum / total_count
-        log_ans('avg_pax', 'total', total_avg)
+        avg_pax = summary['avg_pax']
+        bus_ids = self.network.bus_ids
+        for route_id, route in routes.iteritems():
+            for index in xrange(route.bus_offset, route.bus_offset + route.bus_count):
+                log_ans('avg_pax', 'bus', bus_ids[index], avg_pax['bus'][index])
+            log_ans('avg_pax', 'route', route_id, avg_pax['route'][route.index])
+        log_ans('avg_pax', 'total', avg_pax['total'])
 
         # Average Bus Queuing Time
-        total_sum = total_count = 0.0
-        for stop_id, stop in self.network.stops.iteritems():
-            summa = self.analysis['avg_qtime'][stop_id]
-            # Use sum of stop avg_qtime for the total
-            total_sum += summa
-            total_count += stop.bus_count
-            avg = 0 if summa == 0 else summa / stop.bus_count
-            log_ans('avg_qtime', 'stop', stop_id,  avg)
-
-        total_avg = 0 if total_sum == 0 else total_sum / total_count
-        log_ans('avg_qtime', 'total', total_avg)
+        avg_qtime = summary['avg_qtime']
+        for stop_id, stop in stops.iteritems():
+            log_ans('avg_qtime', 'stop', stop_id, avg_qtime['stop'][stop.index])
+        log_ans('avg_qtime', 'total', avg_qtime['total'])
 
         # Average Waiting Passengers
-        total_sum = 0.0
-        for route_id in self.network.routes.iterkeys():
-            summa = self.analysis['avg_wtime']['route'][route_id]
-            total_sum += summa  # Use sum of route avg_wtime for total
-            avg = 0 if summa == 0 else summa / self.stop_time
-            log_ans('avg_wtime', 'route', route_id, avg)
-
-        for stop_id in self.network.stops.iterkeys():
-            summa = self.analysis['avg_wtime']['stop'][stop_id]
-            avg = 0 if summa == 0 else summa / self.stop_time
-            log_ans('avg_wtime', 'stop', stop_id, avg)
-
-        total_avg = 0 if total_sum == 0 else total_sum / self.stop_time
-        log_ans('avg_wtime', 'total', total_avg)
+        avg_wtime = summary['avg_wtime']
+        for route_id, route in routes.iteritems():
+            log_ans('avg_wtime', 'route', route_id, avg_wtime['route'][route.index])
+        for stop_id, stop in stops.iteritems():
+            log_ans('avg_wtime', 'stop', stop_id, avg_wtime['stop'][stop.index])
+        log_ans('avg_wtime', 'total', avg_wtime['total'])
+
+        # Percentiles of the queues and the waiting passengers
+        if self.histograms:
+            percentiles = self.histograms.percentiles
+            for stop_id, stop in stops.iteritems():
+                log_ans('qtime_percentiles', 'stop', stop_id, *percentiles('queue', stop.index))
+            for route_id, route in routes.iteritems():
+                log_ans('wtime_percentiles', 'route', route_id, *percentiles('route_wait', route.index))
+            for stop_id, stop in stops.iteritems():
+                log_ans('wtime_percentiles', 'stop', stop_id, *percentiles('stop_wait', stop.index))
+
+        # Percentiles of the waits of the passengers who boarded
+        if self.waits:
+            percentiles = self.waits.percentiles
+            for route_id, route in routes.iteritems():
+                log_ans('pax_waits', 'route', route_id, *percentiles(self.waits.route_sketches[route.index]))
+            for stop_id, stop in stops.iteritems():
+                log_ans('pax_waits', 'stop', stop_id, *percentiles(self.waits.stop_sketches[stop.index]))
+            log_ans('pax_waits', 'total', *percentiles(self.waits.total()))
 
         print('')
 
@@ -383,20 +509,20 @@ class World(object):
         """Run after every run of the simulation. Ensures that the analysis
         is correct by adding whatever happened between last relevant event
         and the stop time to analysis."""
-        for stop_id, stop in self.network.stops.iteritems():
+        for stop in self.network.stops.itervalues():
             # Add remaining queueing buses to stops
             time_diff = self.stop_time - stop.qtime
-            queueing_buses = stop.queue_length
-            self.analysis['avg_qtime'][stop_id] += time_diff * queueing_buses
+            self.analysis.qtime[stop.index] += time_diff * stop.queue_length
             # Add remamining waiting passengers to stops
             time_diff = self.stop_time - stop.wtime
-            self.analysis['avg_wtime']['stop'][stop_id] += time_diff * stop.pax_count
-
-        time_diff = self.stop_time - self.wtime
-        # Add remamining waiting passengers to routes
-        for route_id, route in self.network.routes.iteritems():
-            pax_count = sum(s.pax_count for s in route.stops)
-            self.analysis['avg_wtime']['route'][route_id] += time_diff * pax_count
+            self.analysis.wtime[stop.index] += time_diff * stop.pax_count
+        if self.histograms:
+            self.histograms.cleanup(self.network, self.stop_time)
+        if self.snapshots:
+            snapshots = self.snapshots
+            for stop in self.network.stop_list:
+                snapshots.charge(snapshots.qtime, stop.qtime, self.stop_time, stop.queue_length)
+                snapshots.charge(snapshots.wtime, stop.wtime, self.stop_time, stop.pax_count)
 
     def experiment(self):
         """Run all experiments. If the optimise parameters flag is set,
@@ -427,8 +553,7 @@ class World(object):
             if not self.optimise:
                 self.log_experiment(**exp_params)
             self.initialise(**exp_params)
-            self.run(silent=True)
-            self.cleanup()
+            self.simulate()
             if not self.optimise:
                 self.log_stats()
             else:
@@ -436,43 +561,135 @@ class World(object):
                 if cost < best_cost:
                     best_cost = cost
                     best_exp = dict(exp_params)
-                    best_ans = dict(self.analysis)
+                    best_ans = self.dump_result()
                     if cost == 0:
                         break  # 0 is the best possible cost
 
         if self.optimise:
+            # the network is that of the last experiment, so the buses of
+            # the best one have to be put back before its results
+            self.initialise(**best_exp)
             self.log_experiment(**best_exp)
-            self.analysis = best_ans
+            self.load_result(best_ans)
             self.log_stats()
 
+    def simulate(self):
+        """Run an initialised experiment silently and clean up. Results of
+        seeded experiments are looked up in and stored to the cache."""
+        if self.seed is None:
+            self.run(silent=True)
+            self.cleanup()
+            return
+
+        key = result_key(self)
+        if self.cache is not None:
+            result = self.cache.get(key)
+            # results cached without the histograms do not have them
+            if result is not None and (self.histograms is None or 'histograms' in result) \
+                    and (self.waits is None or 'waits' in result):
+                self.load_result(result)
+                return
+
+        self.reseed(int(key, 16))  # same numbers whatever experiments ran before
+        self.run(silent=True)
+        self.cleanup()
+        if self.cache is not None:
+            self.cache.put(key, self.dump_result())
+
+    def reseed(self, rand_seed):
+        """Seed all the random numbers of the engine."""
+        seed(rand_seed)
+
+    def cache_params(self):
+        """Returns the parameters of the engine which its results depend on
+        (see cache.result_key), the exact simulation has none."""
+        return []
+
+    def dump_result(self):
+        """Returns the analysis and the bus visits of the stops of the last
+        run as a JSON serialisable dictionary."""
+        result = dict((field, list(getattr(self.analysis, field))) for field in Analysis.FIELDS)
+        result['visits'] = [stop.bus_count for stop in self.network.stop_list]
+        if self.histograms:
+            result['histograms'] = [list(getattr(self.histograms, field)) for field in Histograms.FIELDS]
+        if self.waits:
+            result['waits'] = self.waits.dump()
+        return result
+
+    def load_result(self, result):
+        """Restore the analysis and the bus visits returned by dump_result."""
+        for field in Analysis.FIELDS:
+            setattr(self.analysis, field, list(result[field]))
+        for stop, visits in izip(self.network.stop_list, result['visits']):
+            stop.bus_count = visits
+        if self.histograms and 'histograms' in result:
+            for field, values in izip(Histograms.FIELDS, result['histograms']):
+                setattr(self.histograms, field, list(values))
+        if self.waits and 'waits' in result:
+            self.waits.load(result['waits'])
+
     def start(self):
         """Validate and then start the run loop or experiment."""
         self.validate()
         if self.experimental_mode:
             self.experiment()
         else:
+            if self.seed is not None:
+                self.reseed(self.seed)
             self.initialise()
             self.run()
+            self.flush_sink()
             self.cleanup()
             self.log_stats()
 
     def run(self, silent=False):
         """Run the simulation while time is less than stop time."""
+        for _ in self.steps(silent):
+            pass
+
+    def steps(self, silent=False):
+        """The simulation loop, yields after every step. The events of a
+        step are given to the sink unless silent."""
         self.time = 0.0
+        handlers = self.handlers
+        sink = None if silent else self.sink
         while self.time <= self.stop_time:
             delay = self.sample_delay()
-            event_type, kwargs = self.choose_event()
-            self.update(event_type, **kwargs)
-            if not silent:
-                log(event_type, time=self.time, **kwargs)
+            event_type, args = self.choose_event()
+            handlers[event_type](*args)
+            if sink:
+                sink(event_type, self.time, args)
+            yield
             self.time += delay
 
+    def flush_sink(self):
+        """Wait until the sink has written all the events of the run (a sink
+        may write them later, see output.RecordWriter)."""
+        flush = getattr(self.sink, 'flush', None)
+        if flush:
+            flush()
+
+    def iter_events(self):
+        """Yields the (code, time, args) records of the events of a run as
+        it is simulated (the world has to be initialised like for run). The
+        simulation only advances when the next event is asked for, so a slow
+        consumer holds it back instead of the events piling up. At most the
+        events of one step are held (one event, a dwell or a leap)."""
+        pending = []
+        sink = self.sink
+        self.sink = lambda *record: pending.append(record)
+        try:
+            for _ in self.steps():
+                for record in pending:
+                    yield record
+                del pending[:]
+        finally:
+            self.sink = sink
+
     def get_cost(self, exp_params):
         """Returns the total costs of given experiment parameters. Based on
         the Number of Missed Passengers."""
-        total = 0
-        for route_id in self.network.routes.iterkeys():
-            total += self.analysis['missed_pax']['route'][route_id]
+        total = sum(self.analysis.missed_route)
 
         # sum up all the experimentation parameters
         params_sum = sum(rate for rate in exp_params['rates'].itervalues())
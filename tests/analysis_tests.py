@@ -2,7 +2,10 @@ import unittest
 from random import choice
 
 from tests.fake import FakeWorld
+from simulator.analysis import BUCKET_BOUNDS, BUCKET_COUNT, ArrivalQueue, Histograms, bucket, percentile
 from simulator.models import *
+from simulator.world import World
+from simulator.events import BOARD, DISEMBARKS, DEPARTS, ARRIVALS, NEW_PASSENGERS
 
 
 class TestAnalysis(unittest.TestCase):
@@ -25,20 +28,20 @@ stop time 80
     def test_missed_pax_incremented_after_departs(self):
         """This verifies that the Number of Missed Passengers is
         incremented after a departs event if the bus is full."""
-        kwargs = self.world.run(stop_at='departs')
+        kwargs = self.world.run(stop_at=DEPARTS)
 
         bus = kwargs['bus']
-        stop_id = bus.stop.stop_id
-        route_id = bus.route.route_id
+        stop_index = bus.stop.index
+        route_index = bus.route.index
         stop_pax_count = sum(bus.stop.pax_dests.itervalues())
 
-        missed_stop = self.world.analysis['missed_pax']['stop'][stop_id]
-        missed_route = self.world.analysis['missed_pax']['route'][route_id]
+        missed_stop = self.world.analysis.missed_stop[stop_index]
+        missed_route = self.world.analysis.missed_route[route_index]
 
         # Update the world to confirm
-        self.world.update('departs', **kwargs)
-        now_stop = self.world.analysis['missed_pax']['stop'][stop_id]
-        now_route = self.world.analysis['missed_pax']['route'][route_id]
+        self.world.update(DEPARTS, **kwargs)
+        now_stop = self.world.analysis.missed_stop[stop_index]
+        now_route = self.world.analysis.missed_route[route_index]
 
         if bus.full() and stop_pax_count:
             self.assertTrue(missed_stop + stop_pax_count == now_stop, msg='{} < {}'.format(missed_stop, now_stop))
@@ -50,19 +53,19 @@ stop time 80
     def test_missed_pax_not_incremented_after_other_events(self):
         """This verifies that the Number of Missed Passengers is not
         incremented after any other event."""
-        event_type = choice(['arrivals', 'board', 'new_passengers', 'disembarks'])
+        event_type = choice([ARRIVALS, BOARD, NEW_PASSENGERS, DISEMBARKS])
         kwargs = self.world.run(stop_at=event_type)
 
         if self.world.time >= self.world.stop_time:
             return  # Event did not happen
 
-        missed_stop = self.world.analysis['missed_pax']['stop']
-        missed_route = self.world.analysis['missed_pax']['route']
+        missed_stop = list(self.world.analysis.missed_stop)
+        missed_route = list(self.world.analysis.missed_route)
 
         # Update the world to confirm
         self.world.update(event_type, **kwargs)
-        now_stop = self.world.analysis['missed_pax']['stop']
-        now_route = self.world.analysis['missed_pax']['route']
+        now_stop = self.world.analysis.missed_stop
+        now_route = self.world.analysis.missed_route
 
         self.assertTrue(missed_stop == now_stop, msg='{} < {}'.format(missed_stop, now_stop))
         self.assertTrue(missed_route == now_route, msg='{} < {}'.format(missed_stop, now_stop))
@@ -70,62 +73,65 @@ stop time 80
     def test_avg_pax_incremented_after_departs(self):
         """This verifies that the Average Passengers Per Bus Per Road is
         incremented after a departs event."""
-        kwargs = self.world.run(stop_at='departs')
+        kwargs = self.world.run(stop_at=DEPARTS)
 
         bus = kwargs['bus']
         bus_pax = sum(bus.pax_dests.itervalues())
-        avg_pax_count, avg_pax_sum = self.world.analysis['avg_pax'][bus.bus_id]
-        self.world.update('departs', **kwargs)
+        analysis = self.world.analysis
+        avg_pax_count, avg_pax_sum = analysis.pax_count[bus.index], analysis.pax_sum[bus.index]
+        self.world.update(DEPARTS, **kwargs)
 
-        self.assertTrue((avg_pax_count + 1, avg_pax_sum + bus_pax) == self.world.analysis['avg_pax'][bus.bus_id])
+        self.assertTrue((avg_pax_count + 1, avg_pax_sum + bus_pax) == (analysis.pax_count[bus.index], analysis.pax_sum[bus.index]))
 
     def test_avg_pax_not_incremented_after_other_events(self):
         """This verifies that the Average Passengers Per Bus Per Road is not
         incremented after any other event."""
-        event_type = choice(['arrivals', 'board', 'new_passengers', 'disembarks'])
+        event_type = choice([ARRIVALS, BOARD, NEW_PASSENGERS, DISEMBARKS])
         kwargs = self.world.run(stop_at=event_type)
 
         if self.world.time >= self.world.stop_time:
             return  # Event did not happen
 
-        avg_pax = self.world.analysis['avg_pax']
+        pax_count = list(self.world.analysis.pax_count)
+        pax_sum = list(self.world.analysis.pax_sum)
         self.world.update(event_type, **kwargs)
 
-        self.assertTrue(avg_pax == self.world.analysis['avg_pax'])
+        self.assertEqual(pax_count, self.world.analysis.pax_count)
+        self.assertEqual(pax_sum, self.world.analysis.pax_sum)
 
     def test_avg_qtime_incremented_after_departs_or_arrivals(self):
         """This verifies that the Average Bus Queuing Time is incremented
         after a departs or arrivals event."""
-        event_type = choice(['arrivals', 'departs'])
+        event_type = choice([ARRIVALS, DEPARTS])
         kwargs = self.world.run(stop_at=event_type)
         stop = kwargs['bus'].stop
 
         time_diff = self.world.time - stop.qtime
         wait = stop.queue_length * time_diff
 
-        qtime = self.world.analysis['avg_qtime'][stop.stop_id]
+        qtime = self.world.analysis.qtime[stop.index]
         self.world.update(event_type, **kwargs)
 
-        self.assertTrue(qtime + wait == self.world.analysis['avg_qtime'][stop.stop_id])
+        self.assertTrue(qtime + wait == self.world.analysis.qtime[stop.index])
 
     def test_avg_qtime_not_incremented_after_other_events(self):
         """This verifies that the Average Bus Queuing Time is not incremented
         after any other event."""
-        event_type = choice(['disembarks', 'board', 'new_passengers'])
+        event_type = choice([DISEMBARKS, BOARD, NEW_PASSENGERS])
         kwargs = self.world.run(stop_at=event_type)
 
         if self.world.time >= self.world.stop_time:
             return  # Event did not happen
 
-        avg_qtime = self.world.analysis['avg_qtime']
+        avg_qtime = list(self.world.analysis.qtime)
         self.world.update(event_type, **kwargs)
 
-        self.assertTrue(avg_qtime == self.world.analysis['avg_qtime'])
+        self.assertTrue(avg_qtime == self.world.analysis.qtime)
 
     # def test_avg_wtime_incremented_after_new_passengers_or_board(self):
     #     """This verifies that the Average Waiting Passengers is incremented
     #     after a new_passengers or board event."""
-    #     event_type = choice(['board', 'new_passengers'])
+    #     event_type = choice([BOARD, NEW_PASSENGERS])
     #     kwargs = self.world.run(stop_at=event_type)
 
     #     bus = kwargs['bus']
@@ -140,8 +146,184 @@ stop time 80
     #     self.assertTrue(stop_wtime < self.world.analysis['avg_wtime']['stop'][stop_id])
     #     # self.assertTrue(route_wtime < self.world.analysis['avg_wtime']['route'][route_id])
 
+
+class TestHistograms(unittest.TestCase):
+
+    input_str = """
+route 1 stops 1 2 3 buses 3 capacity 5
+route 2 stops 3 4 buses 2 capacity 3
+road 1 2 0.3
+road 2 3 0.5
+road 3 1 0.8
+road 3 4 0.4
+road 4 3 0.6
+board 0.5
+disembarks 0.6
+departs 0.5
+new passengers 5
+stop time 80
+"""
+
+    def setUp(self):
+        self.world = FakeWorld(self.input_str)
+        self.world.percentiles = True
+        self.world.initialise()
+        World.run(self.world, silent=True)
+        self.world.cleanup()
+
+    def test_buckets(self):
+        """Verifies that every count is in the bucket of the largest bound
+        not above it."""
+        for count in range(200) + [1000, 12345, 2 ** 24 - 1, 2 ** 30]:
+            index = bucket(count)
+            self.assertLessEqual(BUCKET_BOUNDS[index], count)
+            if index < BUCKET_COUNT - 1:
+                self.assertLess(count, BUCKET_BOUNDS[index + 1])
+
+    def test_percentile(self):
+        """Verifies the percentiles of a histogram."""
+        weights = [0.0] * (2 * BUCKET_COUNT)
+        weights[BUCKET_COUNT + 0] = 50.0
+        weights[BUCKET_COUNT + 3] = 45.0
+        weights[BUCKET_COUNT + bucket(100)] = 5.0
+        self.assertEqual(percentile(weights, BUCKET_COUNT, 50), 0)
+        self.assertEqual(percentile(weights, BUCKET_COUNT, 95), 3)
+        self.assertEqual(percentile(weights, BUCKET_COUNT, 99), 96)
+        self.assertEqual(percentile(weights, 0, 95), 0)
+
+    def test_histograms_cover_the_run(self):
+        """Verifies that the histogram of every stop and route adds up to
+        the stop time."""
+        histograms = self.world.histograms
+        for field in Histograms.FIELDS:
+            weights = getattr(histograms, field)
+            for start in xrange(0, len(weights), BUCKET_COUNT):
+                self.assertAlmostEqual(sum(weights[start:start + BUCKET_COUNT]), self.world.stop_time)
+
+    def test_route_counts_are_kept(self):
+        """Verifies that the kept waiting counts of the routes are the sums
+        of the counts of their stops."""
+        histograms = self.world.histograms
+        for route in self.world.network.route_list:
+            self.assertEqual(histograms.route_count[route.index], sum(stop.pax_count for stop in route.stops))
+
+    def test_histograms_match_the_integrals(self):
+        """Verifies that the histograms of the stops give the time
+        integrals of the analysis (up to the widths of the buckets)."""
+        histograms = self.world.histograms
+        analysis = self.world.analysis
+        for stop in self.world.network.stop_list:
+            for weights, integral in ((histograms.queue, analysis.qtime), (histograms.stop_wait, analysis.wtime)):
+                start = stop.index * BUCKET_COUNT
+                lower = sum(bound * weight for bound, weight in zip(BUCKET_BOUNDS, weights[start:start + BUCKET_COUNT]))
+                self.assertLessEqual(lower, integral[stop.index] + 1e-6)
+                self.assertGreaterEqual(lower * 1.25 + 1e-6, integral[stop.index])
+        wtime = analysis.route_wtime(self.world.network)
+        for route in self.world.network.route_list:
+            start = route.index * BUCKET_COUNT
+            lower = sum(bound * weight for bound, weight in zip(BUCKET_BOUNDS, histograms.route_wait[start:start + BUCKET_COUNT]))
+            self.assertLessEqual(lower, wtime[route.index] + 1e-6)
+
+    def test_reset(self):
+        """Verifies that a new run starts from empty histograms."""
+        histograms = self.world.histograms
+        self.world.initialise()
+        self.assertIs(self.world.histograms, histograms)
+        self.assertFalse(any(histograms.queue) or any(histograms.stop_wait) or any(histograms.route_wait))
+
+
+class TestRepeatedStopHistograms(TestHistograms):
+    """The histograms of a route which visits a stop twice, the stop counts
+    once per visit like in Analysis.route_wtime."""
+
+    input_str = """
+route 1 stops 1 2 3 2 buses 3 capacity 5
+route 2 stops 3 4 buses 2 capacity 3
+road 1 2 0.3
+road 2 3 0.5
+road 3 2 0.4
+road 2 1 0.8
+road 3 4 0.4
+road 4 3 0.6
+board 0.5
+disembarks 0.6
+departs 0.5
+new passengers 5
+stop time 80
+"""
+
+    def test_route_visits_are_counted(self):
+        """Verifies that the stop visited twice counts twice."""
+        histograms = self.world.histograms
+        stop = self.world.network.stops[2]
+        self.assertEqual(histograms.stop_routes[stop.index].count(self.world.network.routes[1].index), 2)
+
+
+class TestPassengerWaits(unittest.TestCase):
+
+    def setUp(self):
+        self.world = FakeWorld("""
+route 1 stops 1 2 3 buses 3 capacity 5
+road 1 2 0.3
+road 2 3 0.5
+road 3 1 0.8
+board 0.5
+disembarks 0.6
+departs 0.5
+new passengers 5
+stop time 80
+""")
+        self.world.wait_times = True
+        self.world.initialise()
+
+    def test_arrival_queue(self):
+        """Verifies that the passengers leave the queue in the order they
+        came and that popping more than are there is safe."""
+        queue = ArrivalQueue()
+        for time in xrange(3000):
+            queue.push(float(time))
+        queue.push(3000.0, count=3)
+        popped = []
+        while len(queue) > 7:
+            popped.extend(queue.pop(7))
+        self.assertEqual(popped, [float(time) for time in xrange(2996)])
+        self.assertEqual(list(queue.pop(10)), [2996.0, 2997.0, 2998.0, 2999.0] + [3000.0] * 3)
+        self.assertEqual(len(queue), 0)
+        self.assertEqual(list(queue.pop()), [])
+
+    def test_every_boarding_is_counted(self):
+        """Verifies that the wait of every boarding passenger is added to
+        its stop and route and that the passengers still waiting are in the
+        queues."""
+        boards = []
+
+        def sink(event_type, time, args):
+            if event_type == BOARD:
+                boards.append(args[0].stop.stop_id)
+        self.world.sink = sink
+        World.run(self.world)
+        waits = self.world.waits
+        self.assertTrue(boards)
+        self.assertEqual(len(waits.total()), len(boards))
+        for stop in self.world.network.stop_list:
+            self.assertEqual(len(waits.stop_sketches[stop.index]), boards.count(stop.stop_id))
+            for dest_id, count in stop.pax_dests.iteritems():
+                self.assertEqual(len(waits.queues[stop.index].get(dest_id, ())), count)
+
+    def test_waits_are_positive(self):
+        """Verifies that the waits are no longer than the run."""
+        World.run(self.world, silent=True)
+        waits = self.world.waits
+        for sketch in waits.stop_sketches + waits.route_sketches:
+            for wait in waits.percentiles(sketch):
+                self.assertTrue(0 <= wait <= self.world.stop_time * 1.01)
+
+
 if __name__ == '__main__':
     suite = unittest.TestSuite()
+    suite.addTest(unittest.TestLoader().loadTestsFromTestCase(TestHistograms))
+    suite.addTest(unittest.TestLoader().loadTestsFromTestCase(TestRepeatedStopHistograms))
+    suite.addTest(unittest.TestLoader().loadTestsFromTestCase(TestPassengerWaits))
 
     for i in xrange(100):
         suite.addTest(unittest.TestLoader().loadTestsFromTestCase(TestAnalysis))
@@ -0,0 +1,95 @@
+import os
+import shutil
+import unittest
+from tempfile import mkdtemp
+from StringIO import StringIO
+
+from simulator import batch as batch_module
+from simulator.batch import run_batch, batch_inputs, output_path
+from tests.fake import job_output
+
+
+class TestBatch(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = mkdtemp()
+        for name in ('test1', 'test3'):
+            shutil.copy(os.path.join('tests', name), self.directory)
+        with open(os.path.join(self.directory, 'broken'), 'w') as f:
+            f.write('route 1 stops 1 buses 1 capacity 1\n')
+        self.job_world = batch_module.job_world
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+        batch_module.job_world = self.job_world
+
+    def run_batch(self, pattern, output_dir=None):
+        stdout = os.sys.stdout
+        os.sys.stdout = StringIO()
+        try:
+            results = run_batch(pattern, output_dir, workers=2, seed=4)
+            return results, os.sys.stdout.getvalue()
+        finally:
+            os.sys.stdout = stdout
+
+    def test_outputs_next_to_inputs(self):
+        """Verifies that every input of the directory is run into its output
+        and that a summary line is printed for each."""
+        results, summary = self.run_batch(self.directory)
+        self.assertEqual([result[0] for result in results], batch_inputs(self.directory))
+        self.assertEqual(len(summary.splitlines()), 4)
+        for filename, run_time, events, error in results:
+            with open(output_path(filename)) as f:
+                output = f.read()
+            if filename.endswith('broken'):
+                self.assertTrue(error)
+                self.assertEqual(output, error + '\n')
+            else:
+                self.assertIsNone(error)
+                self.assertEqual(output.count('at time'), events)
+                job = {'input': filename, 'seed': 4, 'events': True}
+                self.assertEqual(output, job_output(job))
+        # the outputs are not inputs of the next batch
+        self.assertEqual(len(batch_inputs(self.directory)), 3)
+
+    def test_glob_and_output_dir(self):
+        """Verifies that a glob selects the inputs and that the outputs are
+        written into the output directory."""
+        output_dir = os.path.join(self.directory, 'out')
+        results, summary = self.run_batch(os.path.join(self.directory, 'test*'), output_dir)
+        self.assertEqual(len(results), 2)
+        self.assertEqual(sorted(os.listdir(output_dir)), ['test1.out', 'test3.out'])
+
+    def test_glob_rerun(self):
+        """Verifies that the outputs written next to the inputs matched by a
+        glob are not inputs of a rerun."""
+        pattern = os.path.join(self.directory, '*')
+        results, summary = self.run_batch(pattern)
+        rerun, summary = self.run_batch(pattern)
+        self.assertEqual([result[0] for result in rerun], [result[0] for result in results])
+        self.assertIn('3 inputs (1 failed)', summary)
+
+    def test_failed_input_does_not_stop_batch(self):
+        """Verifies that an unexpected error of one input is recorded in its
+        result and output and that the other inputs are still run."""
+        shutil.copy(os.path.join('tests', 'test1'), os.path.join(self.directory, 'malformed'))
+        job_world = self.job_world
+
+        def failing_job_world(job):
+            if job['input'].endswith('malformed'):
+                raise ValueError('malformed scenario')
+            return job_world(job)
+        batch_module.job_world = failing_job_world
+        results, summary = self.run_batch(self.directory)
+        self.assertEqual(len(results), 4)
+        errors = dict((os.path.basename(result[0]), result[3]) for result in results)
+        self.assertTrue(errors['malformed'].startswith('Simulation failed: ValueError'))
+        self.assertIsNone(errors['test1'])
+        self.assertIsNone(errors['test3'])
+        with open(output_path(os.path.join(self.directory, 'malformed'))) as f:
+            self.assertEqual(f.read(), errors['malformed'] + '\n')
+        self.assertIn('4 inputs (2 failed)', summary)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,209 @@
+import os
+import shutil
+import unittest
+import warnings
+from tempfile import mkdtemp
+from StringIO import StringIO
+
+from tests.fake import FakeWorld
+from simulator.cache import ResultCache, ScenarioCache, open_cache, result_key
+from simulator.errors import InputError
+from simulator import cache as cache_module, world as world_module
+from simulator.world import World
+
+
+INPUT = """
+route 1 stops 1 2 3 buses experiment 2 3 capacity 10
+road 1 2 0.3
+road 2 3 0.5
+road 3 1 0.8
+board 2
+disembarks 2
+departs 1
+new passengers experiment 2 4
+stop time 50
+"""
+
+
+class TestResultCache(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = mkdtemp()
+        self.cache = ResultCache(self.directory, max_size=1000)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_put_get(self):
+        """Verifies that a stored result is returned."""
+        self.cache.put('abc', {'wtime': [1.5, 2.0]})
+        self.assertEqual(self.cache.get('abc'), {'wtime': [1.5, 2.0]})
+        self.assertEqual(self.cache.get('xyz'), None)
+
+    def test_least_recently_used_is_evicted(self):
+        """Verifies that the least recently used results are removed when
+        the cache is over its size limit."""
+        for i, key in enumerate(('a', 'b', 'c')):
+            self.cache.put(key, {'wtime': [0.0] * 50})
+            os.utime(self.cache.path(key), (i, i))
+        self.cache.get('a')  # used again
+        self.cache.put('d', {'wtime': [0.0] * 50})
+        self.assertNotEqual(self.cache.get('a'), None)
+        self.assertEqual(self.cache.get('b'), None)
+        self.assertNotEqual(self.cache.get('d'), None)
+
+    def test_corrupted_result_is_a_miss(self):
+        """Verifies that a corrupted file is not used."""
+        with open(self.cache.path('abc'), 'w') as f:
+            f.write('{"wtime": [1.')
+        self.assertEqual(self.cache.get('abc'), None)
+
+    def test_unusable_directory_disables_cache(self):
+        """Verifies that a cache directory which can not be created only
+        disables the cache with a warning."""
+        filename = os.path.join(self.directory, 'file')
+        open(filename, 'w').close()
+        with warnings.catch_warnings(record=True) as caught:
+            warnings.simplefilter('always')
+            self.assertEqual(open_cache(ResultCache, filename), None)
+            self.assertEqual(open_cache(ScenarioCache, os.path.join(filename, 'cache')), None)
+        self.assertEqual(len(caught), 2)
+
+    def test_failed_put_is_not_cached(self):
+        """Verifies that a result which can not be written is skipped with a
+        warning."""
+        shutil.rmtree(self.directory)
+        with warnings.catch_warnings(record=True) as caught:
+            warnings.simplefilter('always')
+            self.cache.put('abc', {'wtime': [1.5]})
+        os.mkdir(self.directory)
+        self.assertEqual(len(caught), 1)
+        self.assertEqual(self.cache.get('abc'), None)
+
+
+class TestCachedExperiments(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = mkdtemp()
+        self.world = FakeWorld(INPUT)
+        self.world.seed = 5
+        self.world.cache = ResultCache(self.directory)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def experiment(self):
+        """Run the experiments and return the runs and the output."""
+        runs = []
+        self.world.run = lambda silent: runs.append(1) or World.run(self.world, silent)
+        output = StringIO()
+        stdout = os.sys.stdout
+        os.sys.stdout = output
+        try:
+            self.world.experiment()
+        finally:
+            os.sys.stdout = stdout
+            del self.world.run
+        return len(runs), output.getvalue()
+
+    def test_key_depends_on_parameters(self):
+        """Verifies that different parameters give different keys."""
+        self.world.initialise(rates={'new_passengers': 2}, routes={1: {'bus_count': 2}})
+        key = result_key(self.world)
+        self.world.initialise(rates={'new_passengers': 4}, routes={1: {'bus_count': 2}})
+        self.assertNotEqual(key, result_key(self.world))
+        self.world.seed = 6
+        self.assertNotEqual(key, result_key(self.world))
+
+    def test_rerun_uses_cache(self):
+        """Verifies that a rerun of the experiments does not simulate them
+        again and gives the same results."""
+        runs, output = self.experiment()
+        self.assertEqual(runs, 4)
+        runs, cached = self.experiment()
+        self.assertEqual(runs, 0)
+        self.assertEqual(output, cached)
+
+    def test_seeded_results_do_not_depend_on_cache(self):
+        """Verifies that the cached results are the results of a rerun."""
+        runs, output = self.experiment()
+        self.world.cache = None
+        runs, rerun = self.experiment()
+        self.assertEqual(runs, 4)
+        self.assertEqual(output, rerun)
+
+    def test_optimise_logs_best_experiment(self):
+        """Verifies that the best experiment is logged with its own buses
+        when it is not the last one."""
+        runs, output = self.experiment()
+        self.world.optimise = True
+        # the first experiment has the fewest buses
+        self.world.get_cost = lambda exp_params: exp_params['routes'][1]['bus_count']
+        runs, best = self.experiment()
+        self.assertIn('buses 2', best)
+        self.assertTrue(output.startswith(best))
+
+
+class TestScenarioCache(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = mkdtemp()
+        self.cache = ScenarioCache(self.directory)
+        self.filename = os.path.join(self.directory, 'input')
+        with open(self.filename, 'w') as f:
+            f.write(INPUT)
+        self.parse_file = world_module.parse_file
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+        world_module.parse_file = self.parse_file
+
+    def no_parsing(self):
+        def parse_file(filename):
+            self.fail('input parsed again')
+        world_module.parse_file = parse_file
+
+    def test_validated_input_is_loaded(self):
+        """Verifies that a validated input is loaded without parsing and
+        validating it again."""
+        world = World(self.filename, scenarios=self.cache)
+        world.validate()
+        self.no_parsing()
+        cached = World(self.filename, scenarios=self.cache)
+        self.assertTrue(cached.validated)
+        self.assertEqual(cached.rates, world.rates)
+        self.assertEqual(cached.experiments, world.experiments)
+        self.assertEqual(repr(cached.network), repr(world.network))
+
+    def test_invalid_input_is_not_cached(self):
+        """Verifies that only a valid input is cached."""
+        with open(self.filename, 'a') as f:
+            f.write('road 3 3 0.1\nignore warnings\nroute 2 stops 4 5 buses 1 capacity 1\n')
+        world = World(self.filename, scenarios=self.cache)
+        self.assertRaises(InputError, world.validate)
+        self.assertEqual(self.cache.get(self.cache.file_key(self.filename)), None)
+
+    def test_changed_input_is_parsed(self):
+        """Verifies that a modified input is parsed again."""
+        World(self.filename, scenarios=self.cache).validate()
+        with open(self.filename, 'w') as f:
+            f.write(INPUT.replace('stop time 50', 'stop time 60'))
+        os.utime(self.filename, (0, 0))
+        world = World(self.filename, scenarios=self.cache)
+        self.assertFalse(world.validated)
+        self.assertEqual(world.stop_time, 60)
+
+    def test_key_depends_on_parser_version(self):
+        """Verifies that the inputs parsed by another version of the parser
+        are not used."""
+        key = self.cache.file_key(self.filename)
+        version = cache_module.SCENARIO_VERSION
+        cache_module.SCENARIO_VERSION += 1
+        try:
+            self.assertNotEqual(self.cache.file_key(self.filename), key)
+        finally:
+            cache_module.SCENARIO_VERSION = version
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,166 @@
+import math
+import random
+import unittest
+
+from tests.fake import FakeWorld, check_events
+from simulator.world import World
+from simulator.dwell import DwellWorld
+from simulator.events import BOARD, ARRIVALS, NEW_PASSENGERS
+
+
+class FakeDwellWorld(FakeWorld, DwellWorld):
+    pass
+
+
+INPUT = """
+route 1 stops 1 2 3 buses 2 capacity 20
+route 2 stops 2 4 buses 1 capacity 10
+road 1 2 0.3
+road 2 3 0.5
+road 3 1 0.8
+road 2 4 0.4
+road 4 2 0.6
+board 2
+disembarks 2
+departs 0.5
+new passengers 6
+stop time 100
+"""
+
+
+class TestDwellWorld(unittest.TestCase):
+
+    def setUp(self):
+        self.world = FakeDwellWorld(INPUT)
+        self.world.initialise()
+        self.world.silent = True
+
+    def first_dwell(self):
+        """Run the simulation until the first dwell starts."""
+        while not self.world.dwells:
+            kwargs = self.world.run(stop_at=ARRIVALS)
+            self.world.clock = self.world.time
+            self.world.update(ARRIVALS, **kwargs)
+        return self.world.dwells.values()[0]
+
+    def test_dwell_ends_departure_ready(self):
+        """Verifies that the bus is ready for departure after its whole
+        dwell is applied."""
+        dwell = self.first_dwell()
+        self.world.time = dwell.end
+        self.world.apply_dwell(dwell, dwell.end)
+        self.assertTrue(dwell.bus.departure_ready)
+        self.assertIn(dwell.bus, self.world.event_map.departs)
+
+    def test_dwelling_bus_has_no_events(self):
+        """Verifies that the events of a dwelling bus are not in the
+        event map."""
+        dwell = self.first_dwell()
+        self.assertNotIn(dwell.bus, self.world.event_map.board)
+        self.assertNotIn(dwell.bus, self.world.event_map.disembarks)
+        self.assertNotIn(dwell.bus, self.world.event_map.departs)
+
+    def test_new_passenger_for_dwelling_bus_is_ignored(self):
+        """Verifies that new passengers for the route of a dwelling bus at
+        its stop are left to the dwell."""
+        dwell = self.first_dwell()
+        stop = dwell.bus.stop
+        dest = dwell.bus.next_stop
+        count = stop.pax_dests[dest.stop_id]
+        self.assertFalse(self.world.update(NEW_PASSENGERS, orig=stop, dest=dest))
+        self.assertEqual(count, stop.pax_dests[dest.stop_id])
+
+    def test_waiting_passengers_are_corrected(self):
+        """Verifies that the waiting passengers of the stop are charged with
+        the counts of the dwell, not the counts from its start."""
+        dwell = self.first_dwell()
+        stop = dwell.bus.stop
+        count = stop.pax_count
+        start = self.world.time
+        before = self.world.analysis.wtime[stop.index]
+
+        # the stop was last charged before the dwell started, every event is
+        # applied at the time the previous one fired (like World.run)
+        expected = count * (start - stop.wtime)
+        last = start
+        times = [start] + [fired for fired, event_type, dest in dwell.events[:-1]]
+        for time, (fired, event_type, dest) in zip(times, dwell.events):
+            expected += count * (time - last)
+            last = time
+            count += {BOARD: -1, NEW_PASSENGERS: 1}.get(event_type, 0)
+        expected += count * (dwell.end - last)
+
+        self.world.time = dwell.end
+        self.world.apply_dwell(dwell, dwell.end)
+        after = self.world.analysis.wtime[stop.index]
+        self.assertAlmostEqual(after - before, expected)
+
+    def test_events_are_consistent_after_run(self):
+        """Verifies that the event map matches the state of the network
+        after a whole run."""
+        DwellWorld.run(self.world, silent=True)
+        self.assertEqual(self.world.dwells, {})
+        check_events(self, self.world)
+
+    def test_iter_events(self):
+        """Verifies that the events of a dwell are yielded in the order
+        they are applied and that the sink is restored."""
+        sink = self.world.sink
+        times = [time for event_type, time, args in self.world.iter_events()]
+        self.assertTrue(times)
+        self.assertEqual(self.world.time, self.world.stop_time)
+        self.assertIs(self.world.sink, sink)
+
+
+class TestDwellAgreement(unittest.TestCase):
+
+    # few events, so the order in which they are applied shows in the means
+    input_str = """
+route 1 stops 1 2 buses 2 capacity 5
+road 1 2 1.0
+road 2 1 1.0
+board 10.0
+disembarks 1.0
+departs 0.1
+new passengers 0.1
+stop time 200
+"""
+    runs = 20
+
+    def summaries(self, world_class):
+        """Returns the totals of the summaries of seeded runs."""
+        totals = []
+        for seed in xrange(self.runs):
+            random.seed(seed)
+            if world_class is World:
+                world = FakeWorld(self.input_str)
+            else:
+                world = FakeDwellWorld(self.input_str)
+            world.initialise()
+            world_class.run(world, silent=True)
+            summary = world.analysis.summary(world.network, world.stop_time)
+            totals.append(dict((key, stats['total']) for key, stats in summary.iteritems()))
+        return totals
+
+    def test_means_agree_with_world(self):
+        """Verifies that the mean statistics of DwellWorld runs are within
+        four standard errors of the means of World runs."""
+        exact = self.summaries(World)
+        dwell = self.summaries(DwellWorld)
+        for key in ('avg_wtime', 'avg_qtime', 'avg_pax', 'missed_pax'):
+            means, variance = [], 0
+            for totals in (exact, dwell):
+                values = [total[key] for total in totals]
+                mean = sum(values) / float(len(values))
+                means.append(mean)
+                variance += sum((value - mean) ** 2 for value in values) / (len(values) - 1.0) / len(values)
+            self.assertLessEqual(abs(means[0] - means[1]), 4 * math.sqrt(variance) + 1e-9, key)
+
+
+if __name__ == '__main__':
+    suite = unittest.TestSuite()
+
+    for i in xrange(20):
+        suite.addTest(unittest.TestLoader().loadTestsFromTestCase(TestDwellWorld))
+    suite.addTest(unittest.TestLoader().loadTestsFromTestCase(TestDwellAgreement))
+    unittest.TextTestRunner().run(suite)
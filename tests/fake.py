@@ -1,3 +1,7 @@
+from Queue import Queue
+
+from simulator.events import event_kwargs
+from simulator.server import stream_job
 from simulator.world import World
 from simulator.parser import *
 
@@ -5,8 +9,8 @@ from simulator.parser import *
 class FakeWorld(World):
 
     def __init__(self, input_str):
+        super(FakeWorld, self).__init__()
         self.time = 0.0
-        self.wtime = 0.0
         input_lst = input_str.splitlines(True)
         network, rates, params, exps = parse_lines(input_lst, 'test')
         self.network = network
@@ -22,7 +26,8 @@ class FakeWorld(World):
         Run the simulation until we hit the stop_at or conds event.
         """
         while self.time <= self.stop_time:
-            event_type, kwargs = self.choose_event()
+            event_type, args = self.choose_event()
+            kwargs = event_kwargs(event_type, args)
             if conds and event_type == stop_at:
                 if self.satisfies_conds(conds, **kwargs):
                     return kwargs
@@ -36,3 +41,68 @@ class FakeWorld(World):
         """Returns true if the simulation satisfies conditions"""
         for key, funcs in conds.iteritems():
             all((func(kwargs[key]) for func in funcs))
+
+
+def stop_index(stop):
+    """Returns the destination index and the waiting counts of the routes of
+    the stop rebuilt from its queue and passengers, without the empty
+    entries."""
+    dest_buses = {}
+    for bus in stop.bus_queue:
+        if not bus.full():
+            for dest_id in bus.route.stop_ids:
+                dest_buses.setdefault(dest_id, set()).add(bus)
+    route_pax = {}
+    for dest_id, count in stop.pax_dests.iteritems():
+        for route_id in stop.dest_routes.get(dest_id, ()):
+            route_pax[route_id] = route_pax.get(route_id, 0) + count
+    return dest_buses, dict((route_id, count) for route_id, count in route_pax.iteritems() if count)
+
+
+def world_events(world):
+    """Returns the board counts by bus, the sets of the buses of the
+    disembarks and departs events and the total rate rebuilt from the state
+    of the network, which the updates of the world have to keep."""
+    rates = world.rates
+    board = {}
+    disembarks = set()
+    departs = set()
+    total_rate = rates['new_passengers'] + sum(bus.road_rate for bus in world.event_map.arrivals)
+    for stop in world.network.stops.itervalues():
+        for bus in stop.bus_queue:
+            if bus.is_head and not bus.full():
+                bus_boards = dict(bus.boards)
+                if bus_boards:
+                    board[bus] = bus_boards
+                    total_rate += sum(bus_boards.itervalues()) * rates['board']
+            if bus.disembarks:
+                disembarks.add(bus)
+                total_rate += bus.disembarks * rates['disembarks']
+            if bus.departure_ready:
+                departs.add(bus)
+                total_rate += rates['departs']
+    return board, disembarks, departs, total_rate
+
+
+
+def check_events(test, world):
+    """Asserts that the event map and the total rate of the world are the
+    ones rebuilt from the network (see world_events)."""
+    board, disembarks, departs, total_rate = world_events(world)
+    e_map = world.event_map
+    kept_board = dict(
+        (bus, dict((dest, count) for dest, count in dests.iteritems() if count))
+        for bus, dests in e_map.board.iteritems()
+    )
+    test.assertEqual(board, dict((bus, dests) for bus, dests in kept_board.iteritems() if dests))
+    test.assertEqual(disembarks, set(e_map.disembarks))
+    test.assertEqual(departs, set(e_map.departs))
+    test.assertAlmostEqual(total_rate, world.total_rate)
+
+
+def job_output(job):
+    """Returns the output of a job run in this process like a worker of the
+    server runs it."""
+    chunks = Queue()
+    stream_job(job, chunks)
+    return ''.join(iter(chunks.get, None))
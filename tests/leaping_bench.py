@@ -0,0 +1,33 @@
+"""
+Benchmark of the leaping engine against the exact one on the passenger heavy
+test5. Run it like the tests: python2.7 -m tests/leaping_bench [RUNS] [INPUT]
+"""
+import sys
+from random import seed
+from timeit import default_timer
+
+from simulator.leaping import LeapingWorld
+from simulator.world import World
+
+
+def run_time(world):
+    """Returns the time of a silent run of the world."""
+    world.validate()
+    world.initialise()
+    start = default_timer()
+    world.run(silent=True)
+    return default_timer() - start
+
+
+if __name__ == '__main__':
+    runs = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+    filename = sys.argv[2] if len(sys.argv) > 2 else 'tests/test5'
+    exact = leaping = 0.0
+    for run in xrange(runs):
+        seed(run)
+        exact += run_time(World(filename))
+        seed(run)
+        leaping += run_time(LeapingWorld(filename, seed=run))
+    print('{} runs of {}: exact {:.3f}s leaping {:.3f}s speedup {:.2f}x'.format(
+        runs, filename, exact, leaping, exact / leaping
+    ))
@@ -0,0 +1,173 @@
+import math
+import os
+import sys
+import unittest
+from StringIO import StringIO
+from tempfile import NamedTemporaryFile
+from unittest import skipIf
+
+from tests.fake import check_events
+from simulator.world import World
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+INPUT = """
+route 1 stops 1 2 3 buses 3 capacity 10
+route 2 stops 2 4 buses 2 capacity 8
+road 1 2 0.3
+road 2 3 0.5
+road 3 1 0.8
+road 2 4 0.4
+road 4 2 0.6
+board 8
+disembarks 8
+departs 0.5
+new passengers 60
+stop time 40
+"""
+
+
+@skipIf(numpy is None, 'numpy is not installed')
+class TestLeapingWorld(unittest.TestCase):
+
+    def setUp(self):
+        from simulator.leaping import LeapingWorld
+        with NamedTemporaryFile(delete=False) as f:
+            f.write(INPUT)
+        self.filename = f.name
+        self.world = LeapingWorld(self.filename, seed=3)
+        self.world.validate()
+        self.world.initialise()
+
+    def tearDown(self):
+        os.remove(self.filename)
+
+    def buses(self):
+        buses = list(self.world.event_map.arrivals)
+        for stop in self.world.network.stops.itervalues():
+            buses.extend(stop.bus_queue)
+        return buses
+
+    def test_leaps_are_taken(self):
+        """Verifies that the passenger events are batched in leaps."""
+        leaps = []
+        leap = self.world.leap
+        self.world.leap = lambda length, silent, off_times: leaps.append(length) or leap(length, silent, off_times)
+        self.world.run(silent=True)
+        self.assertTrue(leaps)
+
+    def test_capacity_is_respected(self):
+        """Verifies that the boarding batches never overfill a bus."""
+        self.world.run(silent=True)
+        for bus in self.buses():
+            self.assertTrue(bus.pax_count <= bus.route.capacity)
+
+    def test_no_bus_is_lost(self):
+        """Verifies that every bus is either on a stop or on the road."""
+        self.world.run(silent=True)
+        self.assertEqual(len(self.buses()), 5)
+
+    def test_total_rate_is_consistent(self):
+        """Verifies that the total rate matches the events after leaping."""
+        self.world.run(silent=True)
+        check_events(self, self.world)
+
+    def test_key_depends_on_engine_parameters(self):
+        """Verifies that results leaped with a different error control are
+        cached apart."""
+        from simulator.cache import result_key
+        self.world.seed = 5
+        key = result_key(self.world)
+        self.world.epsilon = 0.1
+        self.assertNotEqual(key, result_key(self.world))
+
+    def test_seeded_results_are_reproducible(self):
+        """Verifies that a seeded experiment gives the same results whatever
+        batch sizes were drawn before."""
+        self.world.seed = 5
+        self.world.simulate()
+        result = self.world.dump_result()
+        self.world.random.poisson(3.0, 10)
+        self.world.initialise()
+        self.world.simulate()
+        self.assertEqual(result, self.world.dump_result())
+
+    def test_events_are_kept_up_to_date(self):
+        """Verifies that the leaps update the event map like rebuilding it
+        from the network would."""
+        leap = self.world.leap
+
+        def checked_leap(length, silent, off_times):
+            leap(length, silent, off_times)
+            check_events(self, self.world)
+            e_map = self.world.event_map
+            slow_rate = len(e_map.departs) * self.world.rates['departs']
+            slow_rate += sum(bus.road_rate for bus in e_map.arrivals)
+            self.assertAlmostEqual(slow_rate, self.world.slow_rate)
+
+        self.world.leap = checked_leap
+        self.world.run(silent=True)
+
+    def test_comparison_report(self):
+        """Verifies that the comparison report lists all the metrics."""
+        from simulator.leaping import compare_engines, METRICS
+        stdout, sys.stdout = sys.stdout, StringIO()
+        try:
+            compare_engines(self.filename, runs=2)
+            report = sys.stdout.getvalue()
+        finally:
+            sys.stdout = stdout
+        for metric in METRICS:
+            self.assertIn(metric, report)
+        self.assertIn('speedup', report)
+
+
+@skipIf(numpy is None, 'numpy is not installed')
+class TestLeapingAgreement(unittest.TestCase):
+
+    runs = 20
+
+    def setUp(self):
+        with NamedTemporaryFile(delete=False) as f:
+            f.write(INPUT)
+        self.filename = f.name
+
+    def tearDown(self):
+        os.remove(self.filename)
+
+    def summaries(self, world_class):
+        """Returns the totals of the summaries of seeded runs."""
+        world = world_class(self.filename)
+        world.validate()
+        totals = []
+        for seed in xrange(self.runs):
+            world.initialise()
+            world.reseed(seed)
+            world.run(silent=True)
+            world.cleanup()
+            summary = world.analysis.summary(world.network, world.stop_time)
+            totals.append(dict((key, stats['total']) for key, stats in summary.iteritems()))
+        return totals
+
+    def test_means_agree_with_world(self):
+        """Verifies that the mean statistics of LeapingWorld runs are within
+        four standard errors of the means of World runs."""
+        from simulator.leaping import LeapingWorld
+        exact = self.summaries(World)
+        leaped = self.summaries(LeapingWorld)
+        for key in ('avg_wtime', 'avg_qtime', 'avg_pax', 'missed_pax'):
+            means, variance = [], 0
+            for totals in (exact, leaped):
+                values = [total[key] for total in totals]
+                mean = sum(values) / float(len(values))
+                means.append(mean)
+                variance += sum((value - mean) ** 2 for value in values) / (len(values) - 1.0) / len(values)
+            self.assertLessEqual(abs(means[0] - means[1]), 4 * math.sqrt(variance) + 1e-9, key)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -9,6 +9,34 @@ class TestNetwork(unittest.TestCase):
 
     def setUp(self):
         self.network = Network()
+        self.network.add_route(1, [1, 2, 3], 4, 10)
+
+    def test_buses_are_reused(self):
+        """
+        Test that initialise resets the same buses and the stop visits.
+        """
+        self.network.initialise()
+        buses = list(self.network.routes[1].buses)
+        buses[0].pax_dests[2] = 3
+        self.network.initialise()
+        self.assertEqual(map(id, buses), map(id, self.network.routes[1].buses))
+        self.assertEqual(buses[0].pax_count, 0)
+        self.assertEqual(self.network.stops[1].bus_count, 2)
+
+    def test_bus_pool_follows_bus_count(self):
+        """
+        Test that buses are dropped and created when the bus count changes.
+        """
+        route = self.network.routes[1]
+        self.network.initialise()
+        route.bus_count = 2
+        self.network.initialise()
+        self.assertEqual([bus.bus_id for bus in route.buses], ['1.0', '1.1'])
+        self.assertEqual(len(self.network.stops[1].bus_queue), 1)
+        route.bus_count = 5
+        self.network.initialise()
+        self.assertEqual(self.network.bus_ids, ['1.0', '1.1', '1.2', '1.3', '1.4'])
+        self.assertEqual([bus.index for bus in route.buses], range(5))
 
 
 class TestBus(unittest.TestCase):
@@ -95,7 +123,41 @@ class TestRoute(unittest.TestCase):
 class TestStop(unittest.TestCase):
 
     def setUp(self):
-        pass
+        self.stops = [Stop(3), Stop(4)]
+        self.route = Route(4, self.stops, 2, 2)
+        self.bus = Bus(self.route, 1)  # on the road to stop 4
+
+    def test_arrived_bus_is_indexed(self):
+        """
+        Test that an arrived bus is indexed under all stops of its route.
+        """
+        self.bus.arrive()
+        stop = self.stops[1]
+        self.assertIn(self.bus, stop.dest_buses[3])
+        self.assertIn(self.bus, stop.dest_buses[4])
+
+    def test_full_bus_is_not_indexed(self):
+        """
+        Test that a bus is taken out of the index when it fills up and put
+        back when someone disembarks.
+        """
+        self.bus.arrive()
+        stop = self.stops[1]
+        stop.pax_dests = PosCounter({3: 2})
+        self.bus.pax_dests = PosCounter({4: 1})
+        self.bus.board(3)
+        self.assertNotIn(self.bus, stop.dest_buses[3])
+        self.bus.disembark()
+        self.assertIn(self.bus, stop.dest_buses[3])
+
+    def test_departed_bus_is_not_indexed(self):
+        """
+        Test that a bus is taken out of the index when it departs.
+        """
+        self.bus.arrive()
+        self.bus.dequeue({(4, 3): 0.5})
+        self.assertNotIn(self.bus, self.stops[1].dest_buses[3])
+        self.assertNotIn(self.bus, self.stops[0].dest_buses[3])
 
 
 if __name__ == '__main__':
@@ -0,0 +1,136 @@
+import gzip
+import os
+import shutil
+import unittest
+from StringIO import StringIO
+from tempfile import mkdtemp
+
+from tests.fake import FakeWorld
+from simulator.events import format_event
+from simulator.output import BackgroundWriter, RecordWriter, open_output
+from simulator.world import World
+
+
+INPUT = """
+route 1 stops 1 2 3 buses 2 capacity 5
+route 2 stops 3 4 buses 1 capacity 3
+road 1 2 0.3
+road 2 3 0.5
+road 3 1 0.8
+road 3 4 0.4
+road 4 3 0.6
+board 2
+disembarks 2
+departs 1
+new passengers 4
+stop time 20
+"""
+
+
+class FailingFile(object):
+
+    def write(self, string):
+        raise IOError('disk full')
+
+    def close(self):
+        pass
+
+
+class TestOutput(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_gzip_output(self):
+        """Verifies that everything written to a compressed output is in
+        the file once it is closed."""
+        filename = os.path.join(self.directory, 'out.gz')
+        lines = ['Bus 1.{} leaves stop 2 at time {}\n'.format(i % 7, i * 0.1) for i in xrange(20000)]
+        output = open_output(filename)
+        self.assertIsInstance(output, BackgroundWriter)
+        for line in lines:
+            output.write(line)
+        output.close()
+        with gzip.open(filename) as f:
+            self.assertEqual(f.read(), ''.join(lines))
+        self.assertLess(os.path.getsize(filename), len(''.join(lines)) / 5)
+
+    def test_level_compresses_any_name(self):
+        """Verifies that a compression level gzips an output of any name and
+        that other outputs are plain files."""
+        filename = os.path.join(self.directory, 'out.txt')
+        with open_output(filename, level=1) as output:
+            output.write('abc\n')
+        with gzip.open(filename) as f:
+            self.assertEqual(f.read(), 'abc\n')
+        plain = open_output(os.path.join(self.directory, 'plain'))
+        self.assertIsInstance(plain, file)
+        plain.close()
+
+    def test_error_raised_on_close(self):
+        """Verifies that an error of the writing thread does not block the
+        writes and is raised by close."""
+        output = BackgroundWriter(FailingFile(), chunk_size=10, queue_size=2)
+        for _ in xrange(100):
+            output.write('0123456789')
+        self.assertRaises(IOError, output.close)
+
+
+class TestRecordWriter(unittest.TestCase):
+
+    def run_world(self, batch_size):
+        """Returns the lines of format_event and the output of a writer of
+        the events of a run."""
+        world = FakeWorld(INPUT)
+        world.initialise()
+        lines = []
+        output = StringIO()
+        with RecordWriter(world.network, output, batch_size=batch_size, queue_size=2) as writer:
+
+            def sink(event_type, time, args):
+                lines.append(format_event(event_type, time, args) + '\n')
+                writer(event_type, time, args)
+            world.sink = sink
+            World.run(world)
+        return ''.join(lines), output.getvalue()
+
+    def test_lines_of_log_event(self):
+        """Verifies that the writer writes the lines log_event would."""
+        for batch_size in (1, 7, 4096):
+            expected, written = self.run_world(batch_size)
+            self.assertTrue(expected)
+            self.assertEqual(written, expected)
+
+    def test_flush_writes_everything(self):
+        """Verifies that the events are written by flush, before anything
+        written after it."""
+        world = FakeWorld(INPUT)
+        world.initialise()
+        output = StringIO()
+        writer = RecordWriter(world.network, output, batch_size=5)
+        world.sink = writer
+        World.run(world)
+        writer.flush()
+        output.write('stats\n')
+        writer.close()
+        lines = output.getvalue().splitlines()
+        self.assertGreater(len(lines), 1)
+        self.assertEqual(lines[-1], 'stats')
+
+    def test_error_raised_on_flush(self):
+        """Verifies that an error of the formatting thread is raised by
+        flush."""
+        world = FakeWorld(INPUT)
+        world.initialise()
+        writer = RecordWriter(world.network, FailingFile(), batch_size=3, queue_size=1)
+        world.sink = writer
+        World.run(world)
+        self.assertRaises(IOError, writer.flush)
+        writer.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
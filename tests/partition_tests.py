@@ -0,0 +1,96 @@
+import os
+import unittest
+from tempfile import NamedTemporaryFile
+
+from tests.fake import FakeWorld
+from simulator.partition import PartitionedWorld
+
+
+INPUT = """
+route 1 stops 1 2 3 buses 3 capacity 10
+route 2 stops 2 4 buses 2 capacity 8
+route 3 stops 5 6 buses 2 capacity 5
+road 1 2 0.3
+road 2 3 0.5
+road 3 1 0.8
+road 2 4 0.4
+road 4 2 0.6
+road 5 6 0.7
+road 6 5 0.2
+board 2
+disembarks 2
+departs 1
+new passengers 6
+stop time 200
+"""
+
+
+class TestComponents(unittest.TestCase):
+
+    def setUp(self):
+        self.network = FakeWorld(INPUT).network
+
+    def test_components(self):
+        """Verifies that routes sharing a stop are in one component."""
+        components = sorted(self.network.components())
+        self.assertEqual(components, [([1, 2], [1, 2, 3, 4]), ([3], [5, 6])])
+
+    def test_connected_components_merge(self):
+        """Verifies that a route connecting two components merges them."""
+        self.network.add_route(4, [4, 6], 1, 5)
+        self.assertEqual(self.network.components(), [([1, 2, 3, 4], [1, 2, 3, 4, 5, 6])])
+
+    def test_restrict(self):
+        """Verifies that restricting the network drops the other routes
+        and their stops."""
+        self.network.restrict([3])
+        self.assertEqual(self.network.routes.keys(), [3])
+        self.assertEqual(sorted(self.network.stops), [5, 6])
+
+
+class TestPartitionedWorld(unittest.TestCase):
+
+    def setUp(self):
+        with NamedTemporaryFile(delete=False) as f:
+            f.write(INPUT)
+        self.filename = f.name
+        self.world = PartitionedWorld(self.filename, workers=2)
+        self.world.validate()
+
+    def tearDown(self):
+        if self.world.pool is not None:
+            self.world.pool.close()
+        os.remove(self.filename)
+
+    def test_analysis_is_merged(self):
+        """Verifies that the analysis of all the components is merged."""
+        self.world.initialise()
+        self.world.run(silent=True)
+        self.world.cleanup()
+        self.assertTrue(self.world.partitioned)
+        analysis = self.world.analysis
+        self.assertTrue(all(analysis.pax_count))
+        self.assertTrue(all(analysis.route_wtime(self.world.network)))
+        for stop in self.world.network.stops.itervalues():
+            self.assertTrue(stop.bus_count > 0)
+
+    def test_experimental_rates_are_shared(self):
+        """Verifies that the experimental rates reach the workers."""
+        self.world.initialise(rates={'new_passengers': 0.0001})
+        self.world.run(silent=True)
+        waiting = sum(self.world.analysis.wtime)
+        self.assertTrue(waiting < 200)
+
+    def test_experimental_routes_are_shared(self):
+        """Verifies that every worker gets the experiments of its own
+        routes."""
+        self.world.initialise(routes={1: {'bus_count': 1}, 3: {'bus_count': 4, 'cap': 3}})
+        self.world.run(silent=True)
+        self.world.cleanup()
+        self.assertTrue(self.world.partitioned)
+        self.assertEqual(len(self.world.network.bus_ids), 7)
+        self.assertTrue(all(self.world.analysis.pax_count))
+
+
+if __name__ == '__main__':
+    unittest.main()
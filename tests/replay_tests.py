@@ -0,0 +1,125 @@
+import os
+import shutil
+import unittest
+from tempfile import mkdtemp
+
+from tests.fake import FakeWorld
+from simulator.events import format_event
+from simulator.replay import ReplayWorld, ReplayError, text_events
+from simulator.trace import TraceWriter
+from simulator.world import World
+
+
+INPUT = """
+route 1 stops 1 2 3 buses 2 capacity 5
+route 2 stops 3 4 buses 1 capacity 3
+road 1 2 0.3
+road 2 3 0.5
+road 3 1 0.8
+road 3 4 0.4
+road 4 3 0.6
+board 2
+disembarks 2
+departs 1
+new passengers 4
+stop time 40
+"""
+
+
+class ReplayFakeWorld(FakeWorld, ReplayWorld):
+    pass
+
+
+class TestReplay(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = mkdtemp()
+        self.log = os.path.join(self.directory, 'log')
+        self.trace = os.path.join(self.directory, 'trace')
+
+        world = FakeWorld(INPUT)
+        world.initialise()
+        with open(self.log, 'w') as log, TraceWriter(self.trace) as writer:
+            def sink(event_type, time, args):
+                log.write(format_event(event_type, time, args) + '\n')
+                writer(event_type, time, args)
+            world.sink = sink
+            World.run(world)
+        world.cleanup()
+        self.analysis = world.analysis
+
+        self.world = ReplayFakeWorld(INPUT)
+        self.world.initialise()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def replay(self, events):
+        self.world.replay(events)
+        self.world.cleanup()
+        return self.world.analysis
+
+    def test_trace_replay(self):
+        """Verifies that replaying a trace recomputes the analysis of the
+        run exactly."""
+        analysis = self.replay(self.world.read_trace(self.trace))
+        self.assertEqual(analysis, self.analysis)
+
+    def test_text_replay(self):
+        """Verifies that replaying a text log recomputes the analysis of
+        the run up to the precision of the logged times."""
+        analysis = self.replay(self.world.read_text(self.log))
+        self.assertEqual(analysis.missed_stop, self.analysis.missed_stop)
+        self.assertEqual(analysis.pax_count, self.analysis.pax_count)
+        for field in ('pax_sum', 'qtime', 'wtime'):
+            for replayed, simulated in zip(getattr(analysis, field), getattr(self.analysis, field)):
+                self.assertAlmostEqual(replayed, simulated, places=5)
+
+    def test_other_lines_skipped(self):
+        """Verifies that only the lines of events are read."""
+        lines = ['number of missed passengers 3\n', 'Bus 1.1 leaves stop 2 at time 0.5\n']
+        self.assertEqual([(time, event_type) for time, event_type, fields in text_events(lines)], [(0.5, 2)])
+
+    def read_error(self, lines):
+        """Returns the message of the ReplayError of reading the lines."""
+        with open(self.log, 'w') as f:
+            f.writelines(lines)
+        with self.assertRaises(ReplayError) as caught:
+            list(self.world.read_text(self.log))
+        return str(caught.exception)
+
+    def test_unknown_bus(self):
+        """Verifies that an event of a bus not in the network is an error
+        naming its line, whatever the type of the event."""
+        for line in (
+            'Bus 7.1 leaves stop 2 at time 0.5\n',
+            'Bus 7.1 arrives at stop 2 at time 0.5\n',
+            'Passenger boards bus 7.1 at stop 2 with destination 3 at time 0.5\n',
+            'Passenger disembarks bus 7.1 at stop 2 at time 0.5\n',
+        ):
+            message = self.read_error(['number of missed passengers 3\n', line])
+            self.assertIn('Line 2 of', message)
+            self.assertTrue(message.endswith(line.strip()))
+
+    def test_text_out_of_order(self):
+        """Verifies that the events of a text log are applied as they are
+        read and that an event before the previous one is an error naming
+        its line, whatever the type of the event."""
+        with open(self.log, 'w') as f:
+            f.write('Bus 1.0 leaves stop 2 at time 0.5\nBus 1.0 leaves stop 2 at time 0.25\n')
+        events = self.world.read_text(self.log)
+        self.assertEqual(next(events)[0], 0.5)
+        self.assertRaises(ReplayError, next, events)
+        for line in (
+            'Bus 1.0 arrives at stop 2 at time 0.25\n',
+            'Passenger boards bus 1.0 at stop 2 with destination 3 at time 0.25\n',
+            'Passenger disembarks bus 1.0 at stop 2 at time 0.25\n',
+        ):
+            message = self.read_error(['Bus 1.0 leaves stop 2 at time 0.5\n', line])
+            self.assertIn('Line 2 of', message)
+            self.assertIn('out of time order', message)
+            self.assertTrue(message.endswith(line.strip()))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,104 @@
+import unittest
+
+from simulator.errors import InputError, InputWarning
+from simulator.parser import parse_lines
+from simulator.scenario import Scenario
+from simulator.world import World
+
+
+INPUT = """
+route 1 stops 1 2 3 buses experiment 2 3 capacity 10
+route 2 stops 2 4 buses 1 capacity 5
+road 1 2 0.3
+road 2 3 0.5
+road 3 1 0.8
+road 2 4 experiment 0.4 0.6
+road 4 2 0.6
+board 2
+disembarks 2
+departs 1
+new passengers 4
+stop time 50
+optimise parameters
+"""
+
+
+def build():
+    return (
+        Scenario()
+        .add_route(1, [1, 2, 3], [2, 3], 10)
+        .add_route(2, [2, 4], 1, 5)
+        .add_road(1, 2, 0.3)
+        .add_road(2, 3, 0.5)
+        .add_road(3, 1, 0.8)
+        .add_road(2, 4, [0.4, 0.6])
+        .add_road(4, 2, 0.6)
+        .add_rate('board', 2)
+        .add_rate('disembarks', 2)
+        .add_rate('departs', 1)
+        .add_rate('new_passengers', 4)
+        .set_stop_time(50)
+        .optimise_parameters()
+    )
+
+
+class TestScenario(unittest.TestCase):
+
+    def test_same_as_parsed(self):
+        """Verifies that a built scenario is the same as the parsed input."""
+        network, rates, params, exps = build().build()
+        parsed_network, parsed_rates, parsed_params, parsed_exps = parse_lines(INPUT.splitlines(True), 'test')
+        self.assertEqual(rates, parsed_rates)
+        self.assertEqual(params, parsed_params)
+        self.assertEqual(exps, parsed_exps)
+        self.assertEqual(repr(network), repr(parsed_network))
+
+    def test_errors(self):
+        """Verifies that the builder raises the errors of the parser."""
+        scenario = build()
+        self.assertRaises(InputError, scenario.add_route, 1, [1, 2], 1, 1)
+        self.assertRaises(InputError, scenario.add_road, 1, 2, 0.5)
+        self.assertRaises(InputError, scenario.add_rate, 'board', 1)
+        self.assertRaises(InputError, scenario.set_stop_time, 10)
+        self.assertRaises(InputError, scenario.optimise_parameters)
+        self.assertRaises(InputError, scenario.add_rate, 'arrivals', 1)
+        self.assertRaises(InputError, Scenario().add_route, 3, [1], 1, 1)
+        self.assertRaises(InputError, Scenario().build)
+
+    def test_values_positive(self):
+        """Verifies that zero, negative and missing values are errors."""
+        self.assertRaises(InputError, Scenario().add_route, 1, [1, 2], 0, 1)
+        self.assertRaises(InputError, Scenario().add_route, 1, [1, 2], 1, [3, -1])
+        self.assertRaises(InputError, Scenario().add_road, 1, 2, [])
+        self.assertRaises(InputError, Scenario().add_rate, 'board', '1')
+        self.assertRaises(InputError, Scenario().set_stop_time, 0)
+
+    def test_warning(self):
+        """Verifies that a road from a stop to itself is a warning unless
+        warnings are ignored."""
+        scenario = build().add_road(4, 4, 1)
+        self.assertRaises(InputWarning, scenario.build)
+        scenario.ignore_warnings()
+        scenario.build()
+
+    def test_world_validates(self):
+        """Verifies that a world of a scenario is validated like one of an
+        input file."""
+        scenario = Scenario().add_route(1, [1, 2], 1, 1).add_road(1, 2, 1).add_road(2, 1, 1)
+        scenario.add_rate('board', 1).add_rate('disembarks', 1).add_rate('departs', 1)
+        world = World.from_scenario(scenario.set_stop_time(10))
+        self.assertRaises(InputError, world.validate)
+
+    def test_world_runs(self):
+        """Verifies that a world of a scenario runs its experiments."""
+        world = World.from_scenario(build())
+        self.assertTrue(world.experimental_mode)
+        self.assertTrue(world.optimise)
+        world.validate()
+        world.initialise(routes={1: {'bus_count': 3}})
+        world.run(silent=True)
+        self.assertEqual(len(world.network.bus_ids), 4)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,94 @@
+import os
+import shutil
+import threading
+import unittest
+from Queue import Queue
+from tempfile import mkdtemp
+
+from simulator.server import ChunkWriter, MemoryScenarioCache, make_server, close_server, request
+from tests.fake import job_output
+from simulator.world import World
+
+
+class TestServer(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = mkdtemp()
+        self.address = os.path.join(self.directory, 'socket')
+        self.server = make_server(self.address, workers=2)
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.start()
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.thread.join()
+        close_server(self.server)
+        shutil.rmtree(self.directory)
+
+    def test_job_output(self):
+        """Verifies that the server sends back the output of a job."""
+        job = {'input': 'tests/test1', 'seed': 3}
+        output = request(self.address, job)
+        self.assertEqual(output, job_output(job))
+        self.assertIn('number of missed passengers', output)
+        self.assertNotIn('at time', output)
+        self.assertEqual(request(self.address, job), output)
+
+    def test_events(self):
+        """Verifies that the events are sent only when asked for."""
+        output = request(self.address, {'input': 'tests/test1', 'engine': 'dwell', 'events': True})
+        self.assertIn('at time', output)
+
+    def test_invalid_jobs(self):
+        """Verifies that invalid jobs and inputs are reported."""
+        self.assertTrue(request(self.address, {'engine': 'exact'}).startswith('Invalid job'))
+        self.assertTrue(request(self.address, {'input': 'x', 'engine': 'fast'}).startswith('Invalid job'))
+        self.assertEqual(request(self.address, {'input': 'tests/missing'}), 'Input file does not exist!\n')
+
+    def test_input_is_not_sent_back(self):
+        """Verifies that an invalid input only gets a fixed error message,
+        not the lines of the file."""
+        filename = os.path.join(self.directory, 'input')
+        with open(filename, 'w') as f:
+            f.write('secret line\n')
+        self.assertEqual(request(self.address, {'input': filename}), 'Invalid input file!\n')
+
+    def test_events_are_streamed(self):
+        """Verifies that an output of many chunks is sent back whole."""
+        job = {'input': 'tests/test2', 'seed': 3, 'events': True}
+        output = request(self.address, job)
+        self.assertGreater(len(output), 65536 * 8)
+        self.assertEqual(output, job_output(job))
+
+
+class TestChunkWriter(unittest.TestCase):
+
+    def test_chunks(self):
+        """Verifies that the output is put into the queue in chunks of at
+        least the chunk size and that its end is marked."""
+        chunks = Queue()
+        output = ChunkWriter(chunks, chunk_size=10)
+        for i in xrange(25):
+            output.write('{}\n'.format(i))
+        self.assertEqual(chunks.qsize(), 5)
+        output.close()
+        written = list(iter(chunks.get, None))
+        self.assertTrue(all(len(chunk) >= 10 for chunk in written[:-1]))
+        self.assertEqual(''.join(written), ''.join('{}\n'.format(i) for i in xrange(25)))
+
+
+class TestMemoryScenarioCache(unittest.TestCase):
+
+    def test_validated_input_is_reused(self):
+        """Verifies that a validated input is loaded from memory and that
+        the least recently used inputs are dropped."""
+        cache = MemoryScenarioCache(size=1)
+        world = World('tests/test1', scenarios=cache)
+        world.validate()
+        self.assertTrue(World('tests/test1', scenarios=cache).validated)
+        World('tests/test2', scenarios=cache).validate()
+        self.assertFalse(World('tests/test1', scenarios=cache).validated)
+
+
+if __name__ == '__main__':
+    unittest.main()
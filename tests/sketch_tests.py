@@ -0,0 +1,72 @@
+import json
+import random
+import unittest
+
+from simulator.sketch import QuantileSketch
+
+
+class TestQuantileSketch(unittest.TestCase):
+
+    def setUp(self):
+        rand = random.Random(5)
+        self.values = [rand.expovariate(0.01) for _ in xrange(20000)]
+        self.sketch = QuantileSketch(accuracy=0.01)
+        for value in self.values:
+            self.sketch.add(value)
+
+    def exact(self, values, q):
+        values = sorted(values)
+        return values[int(q * (len(values) - 1))]
+
+    def assertClose(self, estimate, exact, accuracy=0.01):
+        self.assertLessEqual(abs(estimate - exact), accuracy * exact + 1e-9,
+                             msg='{} is not within {} of {}'.format(estimate, accuracy, exact))
+
+    def test_quantiles_within_accuracy(self):
+        """Verifies that the quantiles are within the relative accuracy."""
+        self.assertEqual(len(self.sketch), len(self.values))
+        for q in (0, 0.01, 0.25, 0.5, 0.9, 0.95, 0.99, 1):
+            self.assertClose(self.sketch.quantile(q), self.exact(self.values, q))
+
+    def test_merge(self):
+        """Verifies that merged sketches give the quantiles of all their
+        values."""
+        other_values = [value * 3 for value in self.values[:5000]]
+        other = QuantileSketch(accuracy=0.01)
+        for value in other_values:
+            other.add(value)
+        self.sketch.merge(other)
+        values = self.values + other_values
+        self.assertEqual(len(self.sketch), len(values))
+        for q in (0.1, 0.5, 0.95, 0.99):
+            self.assertClose(self.sketch.quantile(q), self.exact(values, q))
+        self.assertRaises(ValueError, self.sketch.merge, QuantileSketch(accuracy=0.05))
+
+    def test_bounded_buckets(self):
+        """Verifies that the buckets do not grow beyond their limit and that
+        only the low quantiles lose accuracy."""
+        sketch = QuantileSketch(accuracy=0.01, max_buckets=100)
+        for value in self.values:
+            sketch.add(value)
+        self.assertLessEqual(len(sketch.buckets), 100)
+        self.assertClose(sketch.quantile(0.99), self.exact(self.values, 0.99))
+
+    def test_zeros_and_empty(self):
+        """Verifies the quantiles of zero values and of an empty sketch."""
+        sketch = QuantileSketch()
+        self.assertEqual(sketch.quantile(0.5), 0)
+        sketch.add(0.0, count=3)
+        sketch.add(10.0)
+        self.assertEqual(sketch.quantile(0.5), 0)
+        self.assertClose(sketch.quantile(1), 10.0)
+
+    def test_dump_and_load(self):
+        """Verifies that a sketch survives a JSON round trip."""
+        sketch = QuantileSketch(accuracy=0.01)
+        sketch.load(json.loads(json.dumps(self.sketch.dump())))
+        self.assertEqual(len(sketch), len(self.sketch))
+        self.assertEqual(sketch.quantile(0.95), self.sketch.quantile(0.95))
+
+
+if __name__ == '__main__':
+    unittest.main()
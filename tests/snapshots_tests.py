@@ -0,0 +1,97 @@
+import csv
+import os
+import shutil
+import unittest
+from tempfile import mkdtemp
+
+from tests.fake import FakeWorld
+from simulator.snapshots import COLUMNS, Snapshots
+from simulator.world import World
+
+
+INPUT = """
+route 1 stops 1 2 3 buses 3 capacity 5
+route 2 stops 3 4 buses 2 capacity 3
+road 1 2 0.3
+road 2 3 0.5
+road 3 1 0.8
+road 3 4 0.4
+road 4 3 0.6
+board 0.5
+disembarks 0.6
+departs 0.5
+new passengers 5
+stop time 80
+"""
+
+
+class TestSnapshots(unittest.TestCase):
+
+    def setUp(self):
+        self.world = FakeWorld(INPUT)
+        self.world.snapshot_interval = 7.5
+        self.world.initialise()
+        World.run(self.world, silent=True)
+        self.world.cleanup()
+
+    def test_charge_splits_the_intervals(self):
+        """Verifies that an integral is split between the intervals it
+        spans."""
+        snapshots = Snapshots(10)
+        snapshots.charge(snapshots.wtime, 5, 32, 2)
+        self.assertEqual(snapshots.wtime, [10, 20, 20, 4])
+        snapshots.charge(snapshots.wtime, 33, 35, 1)
+        self.assertEqual(snapshots.wtime, [10, 20, 20, 6])
+        snapshots.charge(snapshots.wtime, 35, 35, 1)
+        self.assertEqual(snapshots.wtime, [10, 20, 20, 6])
+
+    def test_intervals_add_up_to_the_analysis(self):
+        """Verifies that the intervals add up to the totals of the
+        analysis."""
+        snapshots = self.world.snapshots
+        analysis = self.world.analysis
+        self.assertEqual(len(snapshots.missed), 11)
+        self.assertEqual(sum(snapshots.missed), sum(analysis.missed_route))
+        self.assertEqual(sum(snapshots.departures), sum(analysis.pax_count))
+        self.assertEqual(sum(snapshots.pax_sum), sum(analysis.pax_sum))
+        self.assertAlmostEqual(sum(snapshots.qtime), sum(analysis.qtime))
+        self.assertAlmostEqual(sum(snapshots.wtime), sum(analysis.wtime))
+
+    def test_series(self):
+        """Verifies the times and averages of the series, the last interval
+        ends at the stop time."""
+        series = self.world.snapshots.series(self.world.stop_time)
+        self.assertEqual(series['time'], [7.5 * i for i in xrange(1, 11)] + [80.0])
+        lengths = [7.5] * 10 + [5.0]
+        waiting = sum(average * length for average, length in zip(series['waiting'], lengths))
+        self.assertAlmostEqual(waiting, sum(self.world.analysis.wtime))
+        for column in COLUMNS:
+            self.assertEqual(len(series[column]), 11)
+
+    def test_write_csv(self):
+        """Verifies that the series is written to a CSV file."""
+        directory = mkdtemp()
+        try:
+            filename = os.path.join(directory, 'series.csv')
+            self.world.snapshots.write(filename, self.world.stop_time)
+            with open(filename) as f:
+                rows = list(csv.reader(f))
+        finally:
+            shutil.rmtree(directory)
+        self.assertEqual(tuple(rows[0]), COLUMNS)
+        self.assertEqual(len(rows), 12)
+        self.assertEqual(sum(int(row[1]) for row in rows[1:]), sum(self.world.analysis.missed_route))
+
+    def test_reset(self):
+        """Verifies that a new run starts a new series."""
+        snapshots = self.world.snapshots
+        self.world.initialise()
+        self.assertIs(self.world.snapshots, snapshots)
+        self.assertEqual(snapshots.missed, [])
+        self.world.snapshot_interval = None
+        self.world.initialise()
+        self.assertIsNone(self.world.snapshots)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,91 @@
+import os
+import shutil
+import unittest
+from tempfile import mkdtemp
+from unittest import skipIf
+
+from tests.fake import FakeWorld
+from simulator.events import EVENT_FIELDS, NEW_PASSENGERS, DEPARTS
+from simulator.trace import TraceWriter, TraceReader, event_record, FIELDS, NONE
+from simulator.world import World
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+INPUT = """
+route 1 stops 1 2 3 buses 2 capacity 5
+route 2 stops 3 4 buses 1 capacity 3
+road 1 2 0.3
+road 2 3 0.5
+road 3 1 0.8
+road 3 4 0.4
+road 4 3 0.6
+board 2
+disembarks 2
+departs 1
+new passengers 4
+stop time 20
+"""
+
+
+class TestTrace(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = mkdtemp()
+        self.filename = os.path.join(self.directory, 'trace')
+        self.world = FakeWorld(INPUT)
+        self.world.initialise()
+        self.records = []
+
+        def sink(event_type, time, args):
+            self.records.append(event_record(event_type, time, args))
+            writer(event_type, time, args)
+
+        with TraceWriter(self.filename, buffer_size=7) as writer:
+            self.world.sink = sink
+            World.run(self.world)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_records_are_read_back(self):
+        """Verifies that the reader returns the records written."""
+        with TraceReader(self.filename) as reader:
+            self.assertEqual(len(reader), len(self.records))
+            self.assertEqual(list(reader), self.records)
+            self.assertEqual(reader[-1], self.records[-1])
+
+    def test_record_fields(self):
+        """Verifies that the records have the stops and buses of the
+        events."""
+        for time, bus, stop, dest, code in self.records:
+            if code == NEW_PASSENGERS:
+                self.assertEqual(bus, NONE)
+                self.assertNotEqual(dest, NONE)
+            else:
+                self.assertTrue(0 <= bus < len(self.world.network.bus_ids))
+            if 'dest' not in EVENT_FIELDS[code] or code == DEPARTS:
+                self.assertEqual(dest, NONE)
+            self.assertIn(stop, self.world.network.stops)
+
+    @skipIf(numpy is None, 'numpy is not installed')
+    def test_columns(self):
+        """Verifies that the columns are the fields of the records."""
+        with TraceReader(self.filename) as reader:
+            columns = reader.columns()
+            for i, field in enumerate(FIELDS):
+                self.assertEqual(list(columns[field]), [record[i] for record in self.records])
+            del columns
+
+    def test_not_a_trace(self):
+        """Verifies that other files are rejected."""
+        with open(self.filename, 'w') as f:
+            f.write('Bus 1.1 leaves stop 2 at time 0.0\n')
+        self.assertRaises(ValueError, TraceReader, self.filename)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,8 +1,11 @@
 import unittest
 
 # from simulator.world import InputError, InputWarning
-from tests.fake import FakeWorld
+from tests.fake import FakeWorld, check_events, stop_index
 from simulator.models import *
+from simulator.world import World
+from simulator.events import DEPARTS, ARRIVALS, NEW_PASSENGERS, EVENT_FIELDS, format_event, EventFilter, \
+    event_stop, event_routes
 
 
 class TestDepartsUpdate(unittest.TestCase):
@@ -36,7 +39,7 @@ stop time 1000
     def test_no_boards_before_departs(self):
         """Verifies that there are no potential boarders
         on the bus stop before the bus departs from the bus stop."""
-        kwargs = self.world.run(stop_at='departs', after=20)
+        kwargs = self.world.run(stop_at=DEPARTS, after=20)
         bus = kwargs['bus']
 
         if not bus.full():
@@ -45,7 +48,7 @@ stop time 1000
     def test_no_disembarks_before_departs(self):
         """Verifies that there are no potential disembarkers
         on the bus before the bus departs form the bus stop."""
-        kwargs = self.world.run(stop_at='departs', after=20)
+        kwargs = self.world.run(stop_at=DEPARTS, after=20)
         bus = kwargs['bus']
 
         self.assertEqual(bus.disembarks, 0)
@@ -53,7 +56,7 @@ stop time 1000
     def test_bus_on_head_full_or_no_boarders_before_departs(self):
         """Verifies that the bus was either on the head of the bus queue,
         full or there are no boarders before it departs from the stop."""
-        kwargs = self.world.run(stop_at='departs', after=60)
+        kwargs = self.world.run(stop_at=DEPARTS, after=60)
         bus = kwargs['bus']
 
         self.assertTrue(bus.departure_ready)
@@ -88,16 +91,159 @@ stop time 1000
 
     def test_bus_in_motion_before_arrival(self):
         """Verifies that the bus is in motion before its arrival."""
-        kwargs = self.world.run(stop_at='arrivals', after=20)
+        kwargs = self.world.run(stop_at=ARRIVALS, after=20)
         bus = kwargs['bus']
 
         self.assertTrue(bus.in_motion)
 
 
+class TestReindexEvents(unittest.TestCase):
+
+    def setUp(self):
+        input_str = """
+route 1 stops 1 2 3 4 5 6 buses 3 capacity 10
+route 2 stops 2 4 8 9 3 6 buses 2 capacity 8
+road 1 2 0.3
+road 2 3 0.5
+road 3 4 0.8
+road 4 5 0.2
+road 5 6 0.5
+road 6 1 0.2
+road 2 4 0.1
+road 4 8 0.6
+road 8 9 0.7
+road 9 3 0.2
+road 3 6 0.4
+road 6 2 0.3
+board 0.5
+disembarks 0.6
+departs 0.5
+new passengers 4
+stop time 1000
+"""
+        self.world = FakeWorld(input_str)
+        self.world.initialise()
+
+    def test_events_match_network(self):
+        """Verifies that the events rebuilt from the state of the network
+        are the ones kept by the dynamic updates."""
+        self.world.run(stop_at=ARRIVALS, after=50)
+        check_events(self, self.world)
+
+    def test_dest_index_matches_queues(self):
+        """Verifies that the destination index of the stops matches the
+        queues after the dynamic updates."""
+        self.world.run(stop_at=ARRIVALS, after=50)
+        for stop in self.world.network.stops.itervalues():
+            dest_buses = dict((dest, set(buses)) for dest, buses in stop.dest_buses.iteritems() if buses)
+            self.assertEqual(dest_buses, stop_index(stop)[0])
+
+    def test_ready_matches_departs(self):
+        """Verifies that the departure readiness kept by the updates is the
+        computed one and that exactly the ready buses can depart."""
+        self.world.run(stop_at=ARRIVALS, after=50)
+        departs = self.world.event_map.departs
+        for stop in self.world.network.stops.itervalues():
+            route_pax = dict((route_id, count) for route_id, count in stop.route_pax.iteritems() if count)
+            for bus in stop.bus_queue:
+                self.assertEqual(bus.ready, bus.departure_ready)
+                self.assertEqual(bus.ready, bus in departs)
+            self.assertEqual(route_pax, stop_index(stop)[1])
+
+    def test_wrapped_handler_is_dispatched(self):
+        """Verifies that a wrapped handler is called for its event type
+        and still updates the world."""
+        seen = []
+
+        def wrapper(handler):
+            def wrapped(**kwargs):
+                seen.append(kwargs['bus'])
+                return handler(**kwargs)
+            return wrapped
+
+        self.world.wrap_handler(ARRIVALS, wrapper)
+        kwargs = self.world.run(stop_at=ARRIVALS, after=20)
+        self.world.update(ARRIVALS, **kwargs)
+        self.assertEqual(seen[-1], kwargs['bus'])
+        self.assertIn(kwargs['bus'], kwargs['bus'].stop.bus_queue)
+
+    def test_sink_gets_records(self):
+        """Verifies that a run gives every event to the sink as a record
+        whose args match the fields of its type."""
+        records = []
+        self.world.sink = lambda event_type, time, args: records.append((event_type, time, args))
+        self.world.stop_time = 5
+        World.run(self.world)
+        self.assertTrue(records)
+        for event_type, time, args in records:
+            self.assertEqual(len(args), len(EVENT_FIELDS[event_type]))
+            self.assertTrue(format_event(event_type, time, args))
+
+    def test_iter_events(self):
+        """Verifies that iter_events yields the records the sink of a run
+        gets and only simulates as far as the events are consumed."""
+        from random import seed
+        records = []
+        self.world.sink = lambda *record: records.append(record)
+        self.world.stop_time = 5
+        seed(1)
+        self.world.initialise()
+        World.run(self.world)
+
+        seed(1)
+        self.world.initialise()
+        events = self.world.iter_events()
+        first = [next(events) for _ in xrange(10)]
+        self.assertEqual(self.world.time, first[-1][1])
+        rest = list(events)
+        self.assertEqual(len(first + rest), len(records))
+        for (event_type, time, args), record in zip(first + rest, records):
+            self.assertEqual((event_type, time), record[:2])
+
+    def test_event_filter(self):
+        """Verifies that the filter passes on every n-th of the events of
+        the chosen types, routes and stops only."""
+        from random import seed
+        records = []
+
+        def sink(event_type, time, args):
+            # the buses move on, so the stops and routes are taken now
+            records.append((event_type, time, event_stop(event_type, args).stop_id, event_routes(event_type, args)))
+        self.world.stop_time = 20
+        seed(2)
+        self.world.initialise()
+        self.world.sink = sink
+        World.run(self.world)
+
+        passed = []
+        seed(2)
+        self.world.initialise()
+        self.world.sink = EventFilter(
+            lambda *record: passed.append(record),
+            types=('departs', 'arrivals', 'new_passengers'), routes=[2], stops=[2, 4], every=3
+        )
+        World.run(self.world)
+        expected = [
+            (event_type, time) for event_type, time, stop_id, route_ids in records
+            if event_type in (DEPARTS, ARRIVALS, NEW_PASSENGERS) and stop_id in (2, 4) and 2 in route_ids
+        ][2::3]
+        self.assertTrue(expected)
+        self.assertEqual([record[:2] for record in passed], expected)
+
+    def test_silent_run_has_no_sink(self):
+        """Verifies that a silent run does not call the sink."""
+        def sink(event_type, time, args):
+            self.fail('sink called in a silent run')
+        self.world.sink = sink
+        self.world.stop_time = 5
+        World.run(self.world, silent=True)
+
+
 if __name__ == '__main__':
     suite = unittest.TestSuite()
 
     for i in xrange(100):
         suite.addTest(unittest.TestLoader().loadTestsFromTestCase(TestDepartsUpdate))
         suite.addTest(unittest.TestLoader().loadTestsFromTestCase(TestArrivalsUpdate))
+        suite.addTest(unittest.TestLoader().loadTestsFromTestCase(TestReindexEvents))
     unittest.TextTestRunner().run(suite)
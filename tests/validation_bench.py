@@ -0,0 +1,37 @@
+"""
+Benchmark of the validation of a large generated network. Run it like the
+tests: python2.7 -m tests/validation_bench [STOPS] [ROUTES]
+"""
+import sys
+from random import sample, seed
+from timeit import default_timer
+
+from simulator.scenario import Scenario
+from simulator.world import World
+
+
+def generate(stop_count, route_count, route_length=6):
+    """Returns a scenario of random routes over the stops with a road rate
+    for every road of the routes."""
+    seed(1)
+    scenario = Scenario().set_stop_time(10)
+    roads = set()
+    for route_id in xrange(1, route_count + 1):
+        stop_ids = sample(xrange(1, stop_count + 1), route_length)
+        scenario.add_route(route_id, stop_ids, 2, 10)
+        roads.update(zip(stop_ids, stop_ids[1:] + stop_ids[:1]))
+    for orig, dest in roads:
+        scenario.add_road(orig, dest, 0.5)
+    for name in ('board', 'disembarks', 'departs', 'new_passengers'):
+        scenario.add_rate(name, 1)
+    return scenario
+
+
+if __name__ == '__main__':
+    stop_count, route_count = map(int, sys.argv[1:3]) if len(sys.argv) > 2 else (3000, 1500)
+    world = World.from_scenario(generate(stop_count, route_count))
+    start = default_timer()
+    world.validate()
+    print('validated {} routes and {} road rates in {:.3f}s'.format(
+        route_count, len(world.rates) - 4, default_timer() - start
+    ))
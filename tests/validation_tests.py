@@ -1,7 +1,9 @@
+import glob
 import unittest
 
 from simulator.parser import parse_lines
 from simulator.models import *
+from simulator.world import World
 from tests.fake import FakeWorld
 
 
@@ -98,6 +100,44 @@ class TestNetworkValidation(unittest.TestCase):
         with self.assertRaises(InputWarning):
             network.validate(rates, params['ignore_warn'])
 
+    def test_road_rate_for_stops_of_route_is_warn(self):
+        """Verifies that a road rate for two stops of a route which are
+        not consecutive on it raises a warning."""
+        input_str = (
+            'route 1 stops 1 2 3 buses 3 capacity 10',
+            'road 1 2 0.3',
+            'road 2 3 0.5',
+            'road 3 1 0.8',
+            'road 1 3 0.8',
+            'board 0.5',
+            'disembarks 0.6',
+            'departs 0.5',
+            'new passengers 5',
+            'stop time 80'
+        )
+        network, rates, params, experiments = parse_lines(input_str, 'test')
+        with self.assertRaises(InputWarning):
+            network.validate(rates, params['ignore_warn'])
+
+    def test_road_rate_warnings_ignored(self):
+        """Verifies that the road rate warnings are not raised when
+        warnings are ignored."""
+        input_str = (
+            'route 1 stops 1 2 buses 3 capacity 10',
+            'road 1 2 0.3',
+            'road 2 1 0.5',
+            'road 4 2 0.8',
+            'road 2 2 0.8',
+            'board 0.5',
+            'disembarks 0.6',
+            'departs 0.5',
+            'new passengers 5',
+            'stop time 80',
+            'ignore warnings',
+        )
+        network, rates, params, experiments = parse_lines(input_str, 'test')
+        network.validate(rates, params['ignore_warn'])
+
     def test_route_with_same_stop_consecutively_is_error(self):
         """Verifies that when we have a route with the same stop twice
         in a row we raise an error."""
@@ -351,6 +391,17 @@ class TestParserValidation(unittest.TestCase):
             parse_lines(input_str, 'test')
 
 
+class TestShippedInputs(unittest.TestCase):
+
+    def test_inputs_are_valid(self):
+        """Verifies that every input shipped in tests parses and
+        validates."""
+        filenames = [filename for filename in glob.glob('tests/test*') if not filename.endswith('.py')]
+        self.assertTrue(filenames)
+        for filename in filenames:
+            World(filename).validate()
+
+
 if __name__ == '__main__':
     unittest.main()
 
@@ -0,0 +1,122 @@
+import math
+import random
+import unittest
+from unittest import skipIf
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+from tests.fake import FakeWorld
+from simulator.world import World
+
+
+INPUT = """
+route 1 stops 1 2 3 buses 3 capacity {}
+route 2 stops 2 4 buses 2 capacity {}
+road 1 2 0.3
+road 2 3 0.5
+road 3 1 0.8
+road 2 4 0.4
+road 4 2 0.6
+board 0.5
+disembarks 0.6
+departs 0.5
+new passengers 5
+stop time 50
+"""
+
+
+@skipIf(numpy is None, 'numpy is not installed')
+class TestReplicaWorld(unittest.TestCase):
+
+    def replicate(self, capacity=5, replicas=8, seed=1):
+        from simulator.vectorised import ReplicaWorld
+        world = FakeWorld(INPUT.format(capacity, capacity))
+        replica_world = ReplicaWorld(world, replicas, seed=seed)
+        replica_world.initialise()
+        return replica_world.run()
+
+    def test_analysis_per_replica(self):
+        """Verifies that every replica produces an analysis which covers all
+        the routes, stops and buses of the network."""
+        results = self.replicate()
+        self.assertEqual(len(results), 8)
+        for analysis, visits in results:
+            self.assertEqual(len(analysis.missed_route), 2)
+            self.assertEqual(len(analysis.qtime), 4)
+            self.assertTrue(all(analysis.pax_count))
+            # the buses are placed on the stops at the start
+            self.assertTrue(all(count >= 1 for count in visits.itervalues()))
+
+    def test_seeded_runs_are_reproducible(self):
+        """Verifies that replicas with the same seed give the same results."""
+        self.assertEqual(self.replicate(seed=4), self.replicate(seed=4))
+
+    def test_no_missed_pax_when_buses_never_full(self):
+        """Verifies that no passengers are missed when the buses can
+        not get full."""
+        for analysis, visits in self.replicate(capacity=1000):
+            self.assertEqual(sum(analysis.missed_route), 0)
+            self.assertEqual(sum(analysis.missed_stop), 0)
+
+    def test_replicas_differ(self):
+        """Verifies that the replicas are independent of each other."""
+        results = self.replicate()
+        wtimes = set(analysis.wtime[0] for analysis, visits in results)
+        self.assertTrue(len(wtimes) > 1)
+
+
+@skipIf(numpy is None, 'numpy is not installed')
+class TestReplicaAgreement(unittest.TestCase):
+
+    runs = 40
+
+    def totals(self, world, analysis):
+        """Returns the totals of the summary of an analysis of the world."""
+        summary = analysis.summary(world.network, world.stop_time)
+        return dict((key, stats['total']) for key, stats in summary.iteritems())
+
+    def exact_totals(self):
+        """Returns the totals of the summaries of seeded World runs."""
+        totals = []
+        for seed in xrange(self.runs):
+            random.seed(seed)
+            world = FakeWorld(INPUT.format(5, 5))
+            world.initialise()
+            World.run(world, silent=True)
+            world.cleanup()
+            totals.append(self.totals(world, world.analysis))
+        return totals
+
+    def replica_totals(self):
+        """Returns the totals of the summaries of as many replicas."""
+        from simulator.vectorised import ReplicaWorld
+        world = FakeWorld(INPUT.format(5, 5))
+        replica_world = ReplicaWorld(world, self.runs, seed=1)
+        replica_world.initialise()
+        totals = []
+        for analysis, visits in replica_world.run():
+            for stop_id, stop in world.network.stops.iteritems():
+                stop.bus_count = visits[stop_id]
+            totals.append(self.totals(world, analysis))
+        return totals
+
+    def test_means_agree_with_world(self):
+        """Verifies that the mean statistics of the replicas are within four
+        standard errors of the means of World runs."""
+        exact = self.exact_totals()
+        replicas = self.replica_totals()
+        for key in ('avg_wtime', 'avg_qtime', 'avg_pax', 'missed_pax'):
+            means, variance = [], 0
+            for totals in (exact, replicas):
+                values = [total[key] for total in totals]
+                mean = sum(values) / float(len(values))
+                means.append(mean)
+                variance += sum((value - mean) ** 2 for value in values) / (len(values) - 1.0) / len(values)
+            self.assertLessEqual(abs(means[0] - means[1]), 4 * math.sqrt(variance) + 1e-9, key)
+
+
+if __name__ == '__main__':
+    unittest.main()